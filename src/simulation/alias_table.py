@@ -0,0 +1,37 @@
+"""
+Walker alias tables for sampling from a fixed discrete distribution.
+
+Building a table takes O(n) for n outcomes; each sample then costs one uniform draw and one comparison, however many
+outcomes there are. The uniform picks a column and, from its fractional part, either the column's own outcome or its
+alias, with each column holding at most two outcomes whose probabilities fill it exactly.
+"""
+
+import numpy as np
+
+
+class AliasTable:
+    """Samples indices of a PMF (pmf[i] is the probability of i) in O(1) each"""
+
+    def __init__(self, pmf):
+        pmf = np.asarray(pmf, dtype=float)
+        n = len(pmf)
+        self.size = n
+        # Vose's method: columns below the average probability are topped up by an alias above it
+        scaled = pmf * n / pmf.sum()
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left over is 1 up to rounding, so it keeps its own column
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """An array of size independent draws"""
+        draws = rng.random(size) * self.size
+        columns = draws.astype(np.int64)
+        return np.where(draws - columns < self.prob[columns], columns, self.alias[columns])
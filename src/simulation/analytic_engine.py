@@ -0,0 +1,365 @@
+"""
+Exact (non Monte Carlo) combat resolution.
+
+Instead of sampling dice, the AnalyticCombatEngine works with probability mass functions (PMFs). Each attack's
+outcome (damage inflicted and sustained hits generated) is computed exactly from the hit, wound, save, damage and
+FNP probabilities that CombatEngine samples, and damage allocation is tracked as a Markov chain over the target's
+current wounds. The result is the exact distribution of total damage and models destroyed.
+
+PMFs are NumPy arrays indexed by value, so pmf[3] is the probability of exactly 3.
+
+The same per-attack outcome PMFs also make a fast simulation mode: resolve_attacks_sampled draws each attack's damage
+and sustained hits in one go from alias tables of its outcome PMF, built once per weapon and target, and only the
+allocation of damage to models is simulated step by step.
+
+One-use rules (Reroll 1 Hit Roll, Flip Roll to 6, etc.) depend on the order of every die in a trial and are not
+supported; use the simulator for those.
+"""
+
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple
+import math as m
+import numpy as np
+from combat_engine import CombatEngine, Weapon, Model, AttackPlan, resolution_order
+from alias_table import AliasTable
+
+
+def uniform_pmf(low: int, high: int) -> np.ndarray:
+    """PMF of a uniform integer from low to high inclusive"""
+    pmf = np.zeros(high + 1)
+    pmf[low:] = 1 / (high - low + 1)
+    return pmf
+
+
+def shift_pmf(pmf: np.ndarray, shift: int) -> np.ndarray:
+    """PMF of X + shift for a non-negative integer shift"""
+    return np.concatenate([np.zeros(shift), pmf])
+
+
+def sum_pmf(pmf: np.ndarray, count: int) -> np.ndarray:
+    """PMF of the sum of count independent copies of X"""
+    result = np.array([1.0])
+    for _ in range(count):
+        result = np.convolve(result, pmf)
+    return result
+
+
+def map_pmf(pmf: np.ndarray, function) -> np.ndarray:
+    """PMF of function(X) for a function mapping non-negative integers to non-negative integers"""
+    values = [function(value) for value in range(len(pmf))]
+    result = np.zeros(max(values) + 1)
+    np.add.at(result, values, pmf)
+    return result
+
+
+def pad_pmf(pmf: np.ndarray, length: int) -> np.ndarray:
+    """Pad a PMF with zero probabilities up to the given length"""
+    return np.concatenate([pmf, np.zeros(max(0, length - len(pmf)))])
+
+
+def pmf_mean_std(pmf: np.ndarray) -> Tuple[float, float]:
+    """Mean and standard deviation of a PMF"""
+    values = np.arange(len(pmf))
+    mean = float(np.dot(values, pmf))
+    variance = float(np.dot((values - mean) ** 2, pmf))
+    return mean, m.sqrt(max(0.0, variance))
+
+
+@dataclass(frozen=True)
+class OutcomeTable:
+    """Alias tables of a single attack's outcome, for sampling whole attacks (see resolve_attacks_sampled)"""
+    outcomes: AliasTable  # Joint outcome, indexed sustained_hits * width + damage
+    width: int
+    sustained_damage: AliasTable  # Damage of a sustained hit, whose own sustained hits are not resolved
+
+
+class AnalyticCombatEngine(CombatEngine):
+    def __init__(self, debug: bool = False):
+        super().__init__(debug=debug)
+        self._outcome_tables: Dict[AttackPlan, OutcomeTable] = {}
+
+    def attacks_pmf(self, plan: AttackPlan) -> np.ndarray:
+        """PMF of the number of attacks from one copy of a weapon, matching roll_attacks_batch"""
+        pmf = np.asarray(plan.attacks.pmf())
+
+        # Apply Blast rule if present
+        pmf = shift_pmf(pmf, plan.blast_bonus)
+
+        # Apply Rapid Fire bonus
+        for bonus in plan.rapid_fire_bonuses:
+            pmf = np.convolve(pmf, bonus.pmf())
+
+        return pmf
+
+    def damage_pmf(self, plan: AttackPlan, is_critical_hit: bool, is_devastating_wound: bool) -> np.ndarray:
+        """PMF of the damage from one unsaved attack after damage reduction, Melta and Feel No Pain"""
+        pmf = plan.damage.pmf(plan.damage_reroll, is_critical_hit)
+
+        for rule in plan.damage_reductions:
+            if rule == "-1 Damage":
+                pmf = map_pmf(pmf, lambda damage: max(1, damage - 1))
+            elif rule == "Half Damage":
+                pmf = map_pmf(pmf, lambda damage: (damage + 1) // 2)
+        pmf = shift_pmf(pmf, plan.melta_bonus)
+
+        # Each point of damage is ignored independently on a successful Feel No Pain roll
+        fnp_value = plan.feel_no_pain_devastating if is_devastating_wound else plan.feel_no_pain
+        if fnp_value is not None:
+            fail_chance = 1 - (7 - fnp_value) / 6
+            thinned = np.zeros(len(pmf))
+            for damage, probability in enumerate(pmf):
+                if probability > 0:
+                    kept = np.array([m.comb(damage, k) * fail_chance ** k * (1 - fail_chance) ** (damage - k)
+                                     for k in range(damage + 1)])
+                    thinned[:damage + 1] += probability * kept
+            pmf = thinned
+
+        return pmf
+
+    def sustained_hits_pmf(self, plan: AttackPlan) -> np.ndarray:
+        """PMF of the number of sustained hits generated by a critical hit"""
+        if plan.sustained_hits_d3:
+            return uniform_pmf(1, 3)
+        return shift_pmf(np.array([1.0]), plan.sustained_hits)
+
+    def attack_outcome_pmf(self, plan: AttackPlan) -> np.ndarray:
+        """
+        Joint PMF of a single attack's outcome.
+
+        Returns:
+            2D array where [s, d] is the probability that the attack generates s sustained hits and inflicts d damage
+            (before allocation)
+        """
+        hit = self.hit_outcome(plan)
+        save_chance = max(0, 7 - plan.save_threshold) / 6
+
+        outcome_pmfs = []
+        for is_critical_hit, hit_chance in ((False, hit["hit"]), (True, hit["critical"])):
+            if hit_chance == 0:
+                continue
+            wound = self.wound_outcome(plan, is_critical_hit)
+            # Failed wounds and saved wounds inflict no damage
+            damage = np.array([wound["fail"] + wound["wound"] * save_chance])
+            if wound["wound"] > 0:
+                unsaved = wound["wound"] * (1 - save_chance) * self.damage_pmf(plan, is_critical_hit, False)
+                damage = pad_pmf(damage, len(unsaved)) + pad_pmf(unsaved, len(damage))
+            if wound["critical"] > 0:
+                if plan.devastating_wounds:
+                    critical = wound["critical"] * self.damage_pmf(plan, is_critical_hit, True)
+                else:
+                    critical = (wound["critical"] * (1 - save_chance)
+                                * self.damage_pmf(plan, is_critical_hit, False))
+                    critical = pad_pmf(critical, 1)
+                    critical[0] += wound["critical"] * save_chance
+                damage = pad_pmf(damage, len(critical)) + pad_pmf(critical, len(damage))
+            sustained = self.sustained_hits_pmf(plan) if is_critical_hit else np.array([1.0])
+            outcome_pmfs.append(hit_chance * np.outer(sustained, damage))
+
+        # Misses generate nothing
+        width = max([outcome.shape[1] for outcome in outcome_pmfs], default=1)
+        height = max([outcome.shape[0] for outcome in outcome_pmfs], default=1)
+        outcome = np.zeros((height, width))
+        outcome[0, 0] = hit["miss"]
+        for partial in outcome_pmfs:
+            outcome[:partial.shape[0], :partial.shape[1]] += partial
+        return outcome
+
+    def outcome_table(self, plan: AttackPlan) -> OutcomeTable:
+        """Alias tables of an attack plan's outcome PMF, built on first use"""
+        table = self._outcome_tables.get(plan)
+        if table is None:
+            outcome = self.attack_outcome_pmf(plan)
+            table = OutcomeTable(AliasTable(outcome.ravel()), outcome.shape[1], AliasTable(outcome.sum(axis=0)))
+            self._outcome_tables[plan] = table
+        return table
+
+    def resolve_attacks_sampled(self, weapon: Weapon, target: Model, n_trials: int, rng: np.random.Generator,
+                                current_wounds: Optional[np.ndarray] = None, quantity: int = 1,
+                                target_range: Optional[int] = None,
+                                models: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        Resolve all attacks from a weapon against a target for n_trials trials at once, drawing each attack's damage
+        and sustained hits from its outcome PMF instead of rolling its dice.
+
+        The results are distributed exactly as with resolve_attacks_batch, whose arguments these are, but only
+        damage_dealt, damage_inflicted, wasted_damage, models_destroyed and current_wounds are known.
+        """
+        if current_wounds is None:
+            current_wounds = np.full(n_trials, target.wounds, dtype=np.int64)
+        if models is None:
+            models = np.zeros(n_trials, dtype=np.int64)
+        results = {key: np.zeros(n_trials, dtype=np.int64)
+                   for key in ("damage_dealt", "damage_inflicted", "wasted_damage", "models_destroyed")}
+        results["current_wounds"] = current_wounds
+
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        plan = self.compile_attack_plan(weapon, target, target_range)
+        if not plan.in_range:
+            return results
+        table = self.outcome_table(plan)
+        if profiler is not None:
+            profiler.lap("plan")
+
+        num_attacks = self.roll_attacks_batch(plan, rng, n_trials * quantity).reshape(n_trials, quantity).sum(axis=1)
+        trial_ids = np.repeat(np.arange(n_trials), num_attacks)
+        if profiler is not None:
+            profiler.lap("attacks")
+
+        sustained_hits, damage = np.divmod(table.outcomes.sample(rng, len(trial_ids)), table.width)
+        sustained_damage = table.sustained_damage.sample(rng, int(sustained_hits.sum()))
+        if profiler is not None:
+            profiler.lap("damage")
+
+        # Each sustained hit is allocated straight after the attack that generated it
+        attack_positions, sustained_positions = resolution_order(sustained_hits)
+        ordered_trial_ids = np.empty(len(trial_ids) + len(sustained_damage), dtype=np.int64)
+        ordered_trial_ids[attack_positions] = trial_ids
+        ordered_trial_ids[sustained_positions] = np.repeat(trial_ids, sustained_hits)
+        ordered_damage = np.empty(len(ordered_trial_ids), dtype=np.int64)
+        ordered_damage[attack_positions] = damage
+        ordered_damage[sustained_positions] = sustained_damage
+        models_before = models.copy()
+        results["damage_dealt"], allocated = self.allocate_damage_batch(ordered_damage, ordered_trial_ids, target,
+                                                                        current_wounds, models, plan.overkill)
+        if profiler is not None:
+            profiler.lap("allocate")
+
+        # Attacks after the target was destroyed are never made, so inflict nothing
+        if allocated is not None:
+            ordered_damage = np.where(allocated >= target.unit_size, 0, ordered_damage)
+        results["damage_inflicted"] = np.bincount(ordered_trial_ids, weights=ordered_damage,
+                                                  minlength=n_trials).astype(np.int64)
+        results["wasted_damage"] = results["damage_inflicted"] - results["damage_dealt"]
+        results["models_destroyed"] = models - models_before
+        return results
+
+    def allocate_damage_distribution(self, state: np.ndarray, damage_pmf: np.ndarray, target: Model,
+                                     overkill: bool) -> np.ndarray:
+        """
+        Apply one attack's damage PMF to an allocation state.
+
+        The state is a 2D array where [w, t] is the probability that the current model has w + 1 wounds remaining
+        and t damage has been dealt so far. damage_pmf need not sum to 1, which lets callers split an attack's
+        outcome into parts.
+        """
+        wounds = target.wounds
+        max_dealt = len(damage_pmf) - 1 if overkill else min(len(damage_pmf) - 1, wounds)
+        new_state = np.zeros((wounds, state.shape[1] + max_dealt))
+        columns = state.shape[1]
+
+        if overkill:
+            # Every point of damage counts; only the wounds remaining on the current model wrap around
+            for damage, probability in enumerate(damage_pmf):
+                if probability == 0:
+                    continue
+                rows = (np.arange(wounds) - damage) % wounds
+                new_state[rows, damage:damage + columns] += probability * state
+            return new_state
+
+        # Damage less than the wounds remaining leaves the model alive with fewer wounds
+        for damage, probability in enumerate(damage_pmf[:wounds]):
+            if probability == 0:
+                continue
+            new_state[:wounds - damage, damage:damage + columns] += probability * state[damage:]
+
+        # Damage at least the wounds remaining destroys the model; excess damage is lost and the next model is fresh
+        tail = np.cumsum(damage_pmf[::-1])[::-1]
+        for remaining in range(1, wounds + 1):
+            if remaining < len(tail) and tail[remaining] > 0:
+                new_state[wounds - 1, remaining:remaining + columns] += tail[remaining] * state[remaining - 1]
+
+        return new_state
+
+    def resolve_attacks_distribution(self, weapon: Weapon, target: Model, state: Optional[np.ndarray] = None,
+                                     quantity: int = 1, target_range: Optional[int] = None) -> np.ndarray:
+        """
+        Resolve all attacks from a weapon against a target exactly.
+
+        Args:
+            weapon: The attacking weapon
+            target: The defending model
+            state: Allocation state from earlier weapons (see allocate_damage_distribution); starts with a fresh
+                model and no damage if not given
+            quantity: Number of copies of the weapon firing one after another
+            target_range: Distance to the target in inches; defaults to the weapon's target_range
+
+        Returns:
+            The allocation state after the weapon's attacks
+        """
+        if state is None:
+            state = np.zeros((target.wounds, 1))
+            state[target.wounds - 1, 0] = 1.0
+
+        # Check if weapon is in range
+        plan = self.compile_attack_plan(weapon, target, target_range)
+        if not plan.in_range:
+            return state
+
+        attacks_pmf = sum_pmf(self.attacks_pmf(plan), quantity)
+        outcome = self.attack_outcome_pmf(plan)
+        sustained_damage_pmf = outcome.sum(axis=0)
+        overkill = plan.overkill
+
+        # Walk through the attacks one at a time, mixing in the state after each possible number of attacks
+        result = attacks_pmf[0] * state
+        for num_attacks in range(1, len(attacks_pmf)):
+            remaining = attacks_pmf[num_attacks:].sum()
+            if remaining < 1e-15:
+                break
+            next_state = None
+            for sustained_hits, damage_pmf in enumerate(outcome):
+                if damage_pmf.sum() == 0:
+                    continue
+                partial = self.allocate_damage_distribution(state, damage_pmf, target, overkill)
+                # Each sustained hit is resolved as an extra attack straight after the attack that generated it
+                for _ in range(sustained_hits):
+                    partial = self.allocate_damage_distribution(partial, sustained_damage_pmf, target, overkill)
+                if next_state is None:
+                    next_state = partial
+                else:
+                    width = max(next_state.shape[1], partial.shape[1])
+                    next_state = (np.pad(next_state, ((0, 0), (0, width - next_state.shape[1])))
+                                  + np.pad(partial, ((0, 0), (0, width - partial.shape[1]))))
+            state = next_state
+            result = np.pad(result, ((0, 0), (0, state.shape[1] - result.shape[1])))
+            result += attacks_pmf[num_attacks] * state
+
+        return result
+
+    def resolve_distribution(self, attacking_weapons: List[Weapon], target: Model,
+                             target_range: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Compute the exact distribution of damage and models destroyed for a list of weapons at a target range
+        (defaults to each weapon's target_range).
+
+        Returns:
+            Dictionary with PMFs of total damage and models destroyed
+
+        Against a target with a unit_size, attacks stop once that many models are destroyed, which caps the damage
+        dealt at their wounds without changing anything below that, so damage beyond it is counted at the cap after
+        each weapon.
+        """
+        unit_wounds = target.unit_size * target.wounds if target.unit_size is not None else None
+        state = None
+        index = 0
+        while index < len(attacking_weapons):
+            weapon = attacking_weapons[index]
+            quantity = 1
+            while index + quantity < len(attacking_weapons) and attacking_weapons[index + quantity] is weapon:
+                quantity += 1
+            state = self.resolve_attacks_distribution(weapon, target, state, quantity, target_range)
+            if unit_wounds is not None and state.shape[1] > unit_wounds + 1:
+                state[:, unit_wounds] += state[:, unit_wounds + 1:].sum(axis=1)
+                state = state[:, :unit_wounds + 1]
+            index += quantity
+
+        if state is None:
+            state = np.ones((1, 1))
+        damage = state.sum(axis=0)
+        models_destroyed = np.bincount(np.arange(len(damage)) // target.wounds, weights=damage)
+        return {
+            "damage": damage,
+            "models_destroyed": models_destroyed
+        }
@@ -60,10 +60,100 @@ Defender Special Rules Implemented:
 """
 
 import random
-from typing import List, Dict, Optional, Union, Any
+from typing import List, Dict, Optional, Union, Any, Tuple, Sequence, TYPE_CHECKING
 from dataclasses import dataclass, field
 import re
+import bisect
+import itertools
 import math as m
+import numpy as np
+from dice_expr import DiceExpr, parse_dice_expr, REROLL_FAILED, REROLL_ONES
+from rng_streams import RandomSource, as_numpy_rng, as_python_random, StageStreams
+from importance_sampling import TiltedStreams
+from tracing import Tracer
+from profiling import StageProfiler
+if TYPE_CHECKING:
+    from defender_unit import DefenderUnit
+
+# Rules that can be used once per simulation, by their key in the one-use rules dictionary
+ONE_USE_RULES = {
+    "has_reroll_1_hit": "Reroll 1 Hit Roll",
+    "has_reroll_1_wound": "Reroll 1 Wound Roll",
+    "has_reroll_1_hit_or_wound": "Reroll 1 Hit or Wound",
+    "has_reroll_1_hit_wound_or_damage": "Reroll 1 Hit or Wound or Damage",
+    "has_flip_a_6": "Flip Roll to 6",
+    "has_flip_a_6_hit": "Flip Hit Roll to 6",
+    "has_flip_a_6_wound": "Flip Wound Roll to 6",
+    "has_flip_a_6_damage": "Flip Damage Roll to 6",
+    "has_flip_a_6_hit_wound": "Flip Hit or Wound Roll to 6"
+}
+# A trial's unspent one-use rules are a bitmask of these bits, so starting a trial is copying an int rather than a
+# dictionary, and the batch engine keeps one per trial in an array
+ONE_USE_BITS = {key: 1 << index for index, key in enumerate(ONE_USE_RULES)}
+
+def one_use_rules_in_order(*keys: str) -> Tuple[Tuple[int, str], ...]:
+    """Bits and names of one-use rules, in the order they are tried"""
+    return tuple((ONE_USE_BITS[key], ONE_USE_RULES[key]) for key in keys)
+
+# The one-use rules that can reroll or flip each roll, in the order they are spent
+HIT_REROLL_RULES = one_use_rules_in_order("has_reroll_1_hit", "has_reroll_1_hit_or_wound",
+                                          "has_reroll_1_hit_wound_or_damage")
+HIT_FLIP_RULES = one_use_rules_in_order("has_flip_a_6_hit", "has_flip_a_6_hit_wound", "has_flip_a_6")
+WOUND_REROLL_RULES = one_use_rules_in_order("has_reroll_1_wound", "has_reroll_1_hit_or_wound",
+                                            "has_reroll_1_hit_wound_or_damage")
+WOUND_FLIP_RULES = one_use_rules_in_order("has_flip_a_6_wound", "has_flip_a_6_hit_wound", "has_flip_a_6")
+DAMAGE_REROLL_RULES = one_use_rules_in_order("has_reroll_1_hit_wound_or_damage")
+DAMAGE_FLIP_RULES = one_use_rules_in_order("has_flip_a_6_damage", "has_flip_a_6")
+
+def one_use_mask(one_use_rules: Optional[Dict[str, bool]]) -> int:
+    """The bitmask of the available rules in a one-use rules dictionary (see get_one_use_rules)"""
+    return sum(ONE_USE_BITS[key] for key, available in (one_use_rules or {}).items() if available)
+
+# Counts kept per weapon by resolve_attacks and per trial by resolve_attacks_batch. Attacks include the extra attacks
+# from sustained hits; saves are saving throws made; damage_inflicted is the damage of unsaved attacks after damage
+# reduction, Melta and Feel No Pain, of which wasted_damage is lost to allocation because a model had fewer wounds left.
+# wasted_attacks are attacks left unresolved because every model of the target was already destroyed.
+RESULT_COUNTERS = ("attacks", "hits", "critical_hits", "sustained_hits", "lethal_hits", "wounds", "critical_wounds",
+                   "devastating_wounds", "saves", "failed_saves", "fnp_saves", "damage_inflicted", "wasted_damage",
+                   "wasted_attacks", "damage_dealt", "models_destroyed")
+
+# Per-attack outcomes of resolve_attack_batch that depend on the target's profile: against a DefenderUnit they have a
+# leading axis by profile
+PROFILE_OUTCOMES = ("wound", "critical_wound", "devastating_wound", "saved", "failed_save", "fnp_saves", "damage")
+
+# Outcomes of a single attack drawn by resolve_attacks_aggregated: how its hit roll went (a miss, a normal hit or a
+# critical hit) and how its wound and save rolls went, numbered hit * len(WOUND_OUTCOMES) + wound
+HIT_OUTCOMES = ("miss", "hit", "critical_hit")
+WOUND_OUTCOMES = ("no_wound", "saved", "failed_save", "critical_saved", "critical_failed_save", "devastating")
+
+def outcome_indices(condition) -> Tuple[int, ...]:
+    """Numbers of the attack outcomes whose hit and wound outcome meet a condition"""
+    return tuple(index for index, (hit, wound) in enumerate(itertools.product(HIT_OUTCOMES, WOUND_OUTCOMES))
+                 if condition(hit, wound))
+
+# The attack outcomes each resolve_attacks counter counts; a miss is always no_wound
+OUTCOME_COUNTERS = {
+    "hits": outcome_indices(lambda hit, wound: hit != "miss"),
+    "critical_hits": outcome_indices(lambda hit, wound: hit == "critical_hit"),
+    "wounds": outcome_indices(lambda hit, wound: wound != "no_wound"),
+    "critical_wounds": outcome_indices(lambda hit, wound: wound.startswith("critical") or wound == "devastating"),
+    "devastating_wounds": outcome_indices(lambda hit, wound: wound == "devastating"),
+    "saves": outcome_indices(lambda hit, wound: wound in ("saved", "critical_saved")),
+    "failed_saves": outcome_indices(lambda hit, wound: wound in ("failed_save", "critical_failed_save", "devastating")),
+}
+# The counters each attack outcome adds to
+OUTCOME_COUNTED = tuple(tuple(counter for counter, outcomes in OUTCOME_COUNTERS.items() if outcome in outcomes)
+                        for outcome in range(len(HIT_OUTCOMES) * len(WOUND_OUTCOMES)))
+CRITICAL_HIT_OUTCOMES = frozenset(OUTCOME_COUNTERS["critical_hits"])
+DAMAGING_OUTCOMES = frozenset(OUTCOME_COUNTERS["failed_saves"])
+DEVASTATING_OUTCOMES = frozenset(OUTCOME_COUNTERS["devastating_wounds"])
+# Outcomes whose order matters: damage is allocated in order, and a critical hit's sustained hits come straight after it
+ORDERED_OUTCOMES = tuple(sorted(DAMAGING_OUTCOMES | CRITICAL_HIT_OUTCOMES))
+# From this many attacks on, their outcomes are drawn as one multinomial rather than one by one
+MULTINOMIAL_ATTACKS = 32
+
+# Bump whenever a change to the engines changes simulated results, so stored results are recomputed
+ENGINE_VERSION = "7"
 
 @dataclass
 class Model:
@@ -77,6 +167,8 @@ class Model:
     feel_no_pain: Optional[int] = None
     keywords: List[str] = field(default_factory=list)
     special_rules: List[str] = field(default_factory=list)
+    # Attacks stop once this many models are destroyed; without it the model stands for an endless line of them
+    unit_size: Optional[int] = None
 
 @dataclass
 class Weapon:
@@ -93,364 +185,296 @@ class Weapon:
     one_use_rules: Dict[str, bool] = field(default_factory=dict)
     target_range: int = 0  # Distance to target in inches
 
+@dataclass(frozen=True, slots=True)
+class AttackPlan:
+    """A weapon's and target's special rules resolved once for the pairing, so each attack only reads fields"""
+    in_range: bool
+    attacks: DiceExpr
+    blast_bonus: int
+    rapid_fire_bonuses: Tuple[DiceExpr, ...]  # Bonus attacks at half range
+    torrent: bool
+    skill: int
+    hit_modifier: int
+    hit_reroll: Optional[str]  # REROLL_FAILED, REROLL_ONES or None
+    critical_hit_threshold: int
+    sustained_hits: int
+    sustained_hits_d3: bool
+    lethal_hits: bool
+    mortal: bool
+    wound_required: int
+    wound_modifier: int
+    wound_reroll: Optional[str]
+    critical_wound_threshold: int  # Includes any Anti-[Keyword] X+ that applies to the target
+    devastating_wounds: bool
+    save_threshold: int  # Unmodified save roll needed, after AP, Cover and invulnerable saves
+    damage: DiceExpr
+    damage_reroll: Optional[str]
+    damage_reductions: Tuple[str, ...]  # "-1 Damage" / "Half Damage", in the order they are applied
+    melta_bonus: int
+    feel_no_pain: Optional[int]
+    feel_no_pain_devastating: Optional[int]  # Feel No Pain against devastating wounds, which count as mortal wounds
+    overkill: bool
+
+@dataclass
+class AttackContext:
+    """
+    Per-trial state for resolving attacks: the dice source, the wounds left on the model currently being attacked, the
+    target range and the one-use rules not yet spent, as a bitmask of ONE_USE_BITS. The engine keeps no per-attack
+    state and never modifies weapons or targets, so one engine can serve many threads as long as each trial has its own
+    context.
+
+    model is the index of the model being allocated to, which is also the number of models destroyed. Once it reaches
+    num_models the unit is destroyed, current_wounds is 0 and no further attacks are resolved; num_models is None for a
+    Model without a unit_size, which a fresh model replaces each time one is destroyed.
+    """
+    random: random.Random
+    current_wounds: int
+    target_range: int = 0
+    one_use_rules: int = 0
+    defender: Optional["DefenderUnit"] = None
+    model: int = 0
+    num_models: Optional[int] = None
+
+def unit_models(target: Union[Model, "DefenderUnit"]) -> Optional[int]:
+    """Number of models attacks stop after destroying: a DefenderUnit's, or a Model's unit_size (None if endless)"""
+    return target.unit_size if isinstance(target, Model) else target.num_models
+
+def profile_column(plans: Sequence[AttackPlan], attribute: str) -> np.ndarray:
+    """An attack plan attribute for each profile as a column, to broadcast per-attack arrays to a row per profile"""
+    return np.array([[getattr(plan, attribute)] for plan in plans])
+
+def resolution_order(sustained_hits: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Positions in resolution order of an array of attacks, given the sustained hits each generated, and of those
+    sustained hits, which are resolved straight after the attack that generated them
+    """
+    sustained_before = np.cumsum(sustained_hits) - sustained_hits
+    attack_positions = np.arange(len(sustained_hits)) + sustained_before
+    sustained_positions = (np.repeat(attack_positions + 1 - sustained_before, sustained_hits)
+                           + np.arange(int(sustained_hits.sum())))
+    return attack_positions, sustained_positions
+
+def spendable_one_use(plan: AttackPlan) -> int:
+    """The one-use rules an attack from a plan can ever spend, as a bitmask"""
+    bits = 0
+    if not plan.torrent:
+        bits |= sum(bit for bit, _ in HIT_FLIP_RULES)
+        if plan.hit_reroll != REROLL_FAILED:
+            bits |= sum(bit for bit, _ in HIT_REROLL_RULES)
+    if not plan.mortal:
+        bits |= sum(bit for bit, _ in WOUND_FLIP_RULES)
+        if plan.wound_reroll != REROLL_FAILED:
+            bits |= sum(bit for bit, _ in WOUND_REROLL_RULES)
+    damage = (plan.damage,) if plan.damage.critical is None else (plan.damage, plan.damage.critical)
+    if any(expr.dice for expr in damage):
+        bits |= sum(bit for bit, _ in DAMAGE_REROLL_RULES)
+    if any(expr.dice == 1 and expr.sides == 6 for expr in damage):
+        bits |= sum(bit for bit, _ in DAMAGE_FLIP_RULES)
+    return bits
+
+def spend_one_use_batch(one_use: np.ndarray, rules: Tuple[Tuple[int, str], ...], eligible: np.ndarray) -> np.ndarray:
+    """
+    Spend the first of the rules left in each eligible trial's one-use mask, clearing its bit in one_use; returns which
+    trials spent one
+    """
+    spent = np.zeros(len(one_use), dtype=np.int64)
+    for bit, _ in rules:
+        spent |= np.where(eligible & (spent == 0) & ((one_use & bit) != 0), bit, 0)
+    one_use &= ~spent
+    return spent != 0
+
 class CombatEngine:
-    def __init__(self, debug: bool = False):
-        self.hit_modifiers = 0
-        self.wound_modifiers = 0
-        self.save_modifiers = 0
+    def __init__(self, debug: bool = False, rng: Optional[RandomSource] = None, tracer: Optional[Tracer] = None,
+                 profiler: Optional[StageProfiler] = None):
+        self._attack_plans: Dict[tuple, AttackPlan] = {}
+        self._outcome_chances: Dict[AttackPlan, np.ndarray] = {}
+        self.set_rng(rng)
+        self.set_debug(debug, tracer)
+        # Charged with the time spent in each stage of an attack if set (see profiling)
+        self.profiler = profiler
+
+    def set_debug(self, debug: bool, tracer: Optional[Tracer] = None):
+        """
+        Turn tracing on or off (see tracing). Debug mode traces every die and prints it as it is rolled; pass a tracer
+        to collect the events instead. Nothing is traced, or formatted, when both are off.
+        """
         self.debug = debug
+        if tracer is None and debug:
+            tracer = Tracer(echo=True)
+        self.tracer = tracer
+
+    def set_rng(self, rng: Optional[RandomSource] = None):
+        """Draw all dice from the given NumPy Generator or random.Random (see rng_streams); unseeded if None"""
+        if rng is None:
+            rng = np.random.default_rng()
+        self.rng = as_numpy_rng(rng)
+        self.random = as_python_random(rng)
+
+    def make_context(self, target: Union[Model, "DefenderUnit"], target_range: int = 0,
+                     one_use_rules: Union[int, Dict[str, bool], None] = None,
+                     rng: Optional[RandomSource] = None) -> AttackContext:
+        """
+        Start a trial against a fresh target model or unit, with the one-use rules given as a dictionary or a bitmask
+        (see one_use_mask); uses the engine's generator if rng is not given
+        """
+        if not isinstance(one_use_rules, int):
+            one_use_rules = one_use_mask(one_use_rules)
+        defender = None if isinstance(target, Model) else target
+        return AttackContext(
+            random=as_python_random(rng) if rng is not None else self.random,
+            current_wounds=target.wounds if defender is None else int(defender.wounds[0]),
+            target_range=target_range,
+            one_use_rules=one_use_rules,
+            defender=defender,
+            num_models=unit_models(target)
+        )
+
+    def allocate_damage(self, damage: int, context: AttackContext, target: Model) -> Tuple[int, int]:
+        """
+        Allocate one attack's damage to the current model, returning the damage dealt and the models destroyed; damage
+        beyond the model's wounds left is lost
+        """
+        damage_dealt = min(damage, context.current_wounds)
+        context.current_wounds -= damage_dealt
+        # Move on to a fresh model if this one is destroyed
+        if damage_dealt and context.current_wounds == 0:
+            self.next_model(context, target)
+            return damage_dealt, 1
+        return damage_dealt, 0
+
+    def allocate_overkill(self, damage: int, context: AttackContext, target: Model) -> Tuple[int, int]:
+        """
+        Allocate damage that spills over from model to model (Overkill), returning the damage dealt and the models
+        destroyed. Only the wounds taken so far matter, so this is arithmetic rather than a point-by-point loop.
+        """
+        defender = context.defender
+        if defender is None:
+            wounds, num_models = target.wounds, context.num_models
+            taken = (context.model + 1) * wounds - context.current_wounds
+            damage_dealt = damage
+            if num_models is not None:
+                # Nothing is left to allocate to once every model is destroyed
+                taken = min(taken, num_models * wounds)
+                damage_dealt = min(damage, num_models * wounds - taken)
+            model = (taken + damage_dealt) // wounds
+            models_destroyed = model - context.model
+            context.model = model
+            if num_models is None or model < num_models:
+                context.current_wounds = (model + 1) * wounds - (taken + damage_dealt)
+            else:
+                context.current_wounds = 0
+            return damage_dealt, models_destroyed
+        taken = int(defender.cumulative_wounds[min(context.model + 1, defender.num_models)]) - context.current_wounds
+        # Nothing is left to allocate to once every model of the unit is destroyed
+        damage_dealt = min(damage, defender.total_wounds - taken)
+        model = int(np.searchsorted(defender.cumulative_wounds, taken + damage_dealt, side='right')) - 1
+        models_destroyed = model - context.model
+        context.model = model
+        if model < defender.num_models:
+            context.current_wounds = int(defender.cumulative_wounds[model + 1]) - (taken + damage_dealt)
+        else:
+            context.current_wounds = 0
+        return damage_dealt, models_destroyed
+
+    def next_model(self, context: AttackContext, target: Model):
+        """Allocate to a fresh model once the current one is destroyed, if any are left"""
+        context.model += 1
+        if context.num_models is not None and context.model >= context.num_models:
+            context.current_wounds = 0
+        elif context.defender is None:
+            context.current_wounds = target.wounds
+        else:
+            context.current_wounds = int(context.defender.wounds[context.model])
 
     def debug_print(self, message: str):
         """Print message only if debug mode is enabled"""
         if self.debug:
             print(message)
 
-    def roll_dice(self) -> int:
+    def roll_dice(self, context: Optional[AttackContext] = None) -> int:
         """Roll a single D6"""
-        return random.randint(1, 6)
-
-    def find_rapid_fire_bonus(self, rapid_fire_value: str) -> int:
-        """Find the Rapid Fire bonus from the Rapid Fire value"""
-        # Handle D6+X format
-        match = re.match(r'D6\+(\d+)', rapid_fire_value)
-        if match:
-            result = self.roll_dice() + int(match.group(1))
-            self.debug_print(f"  D6+X attacks result: {result}")
-            bonus = result
-            
-        # Handle D6 format
-        if rapid_fire_value == 'D6':
-            result = self.roll_dice()
-            self.debug_print(f"  D6 attacks result: {result}")
-            bonus = result
-            
-        # Handle D3+X format
-        match = re.match(r'D3\+(\d+)', rapid_fire_value)
-        if match:
-            result = random.randint(1, 3) + int(match.group(1))
-            self.debug_print(f"  D3+X attacks result: {result}")
-            bonus = result
-            
-        # Handle D3 format
-        if rapid_fire_value == 'D3':
-            result = random.randint(1, 3)
-            self.debug_print(f"  D3 attacks result: {result}")
-            bonus = result
-            
-        # Handle 2D6 format
-        match = re.match(r'(\d+)D6', rapid_fire_value)
-        if match:
-            num_dice = int(match.group(1))
-            result = sum(self.roll_dice() for _ in range(num_dice))
-            self.debug_print(f"  XD6 attacks result: {result}")
-            bonus = result
-            
-        # If we can't parse it, return 1 as a fallback
-        if bonus == 0:
-            self.debug_print(f"  Using fallback attacks value: 1")
-            bonus = 1
+        return (context.random if context is not None else self.random).randint(1, 6)
+
+    def roll_dice_expr(self, expr: DiceExpr, context: Optional[AttackContext] = None) -> List[int]:
+        """Roll the dice of a dice expression"""
+        rng = context.random if context is not None else self.random
+        return [rng.randint(1, expr.sides) for _ in range(expr.dice)]
 
+    def find_rapid_fire_bonus(self, rapid_fire_value: Union[int, str, DiceExpr],
+                              context: Optional[AttackContext] = None) -> int:
+        """Roll a Rapid Fire bonus like "D3" or "D6+1" """
+        expr = rapid_fire_value if isinstance(rapid_fire_value, DiceExpr) else parse_dice_expr(rapid_fire_value)
+        rolls = self.roll_dice_expr(expr, context)
+        bonus = max(0, expr.total(rolls))
+        if self.tracer is not None:
+            self.tracer.emit("rapid_fire", expr=expr.text, rolls=rolls, value=bonus)
         return bonus
     
-    def roll_attacks(self, attacks_value: Union[int, str], weapon: Weapon, target: Model) -> int:
+    def roll_attacks(self, attacks_value: Union[int, str, DiceExpr], weapon: Weapon, target: Model,
+                     context: Optional[AttackContext] = None, plan: Optional[AttackPlan] = None) -> int:
         """Calculate number of attacks based on the weapon's attacks value"""
-        self.debug_print(f"  Rolling attacks for value: {attacks_value}")
-        base_attacks = 0
-        
-        if isinstance(attacks_value, int):
-            self.debug_print(f"  Integer attacks value: {attacks_value}")
-            base_attacks = attacks_value
-            # Apply Blast rule if present
-            if "Blast" in weapon.special_rules:
-                blast_bonus = m.floor(target.total_models / 5)
-                self.debug_print(f"  Weapon has Blast rule - adding {blast_bonus} attacks for {target.total_models} models")
-                base_attacks += blast_bonus
-            return base_attacks
-            
-        # Handle D6+X format
-        match = re.match(r'D6\+(\d+)', attacks_value)
-        if match:
-            result = self.roll_dice() + int(match.group(1))
-            self.debug_print(f"  D6+X attacks result: {result}")
-            base_attacks = result
-            
-        # Handle D6 format
-        if attacks_value == 'D6':
-            result = self.roll_dice()
-            self.debug_print(f"  D6 attacks result: {result}")
-            base_attacks = result
-            
-        # Handle D3+X format
-        match = re.match(r'D3\+(\d+)', attacks_value)
-        if match:
-            result = random.randint(1, 3) + int(match.group(1))
-            self.debug_print(f"  D3+X attacks result: {result}")
-            base_attacks = result
-            
-        # Handle D3 format
-        if attacks_value == 'D3':
-            result = random.randint(1, 3)
-            self.debug_print(f"  D3 attacks result: {result}")
-            base_attacks = result
-            
-        # Handle 2D6 format
-        match = re.match(r'(\d+)D6', attacks_value)
-        if match:
-            num_dice = int(match.group(1))
-            result = sum(self.roll_dice() for _ in range(num_dice))
-            self.debug_print(f"  XD6 attacks result: {result}")
-            base_attacks = result
-            
-        # If we can't parse it, return 1 as a fallback
-        if base_attacks == 0:
-            self.debug_print(f"  Using fallback attacks value: 1")
-            base_attacks = 1
+        if context is None:
+            context = self.make_context(target, weapon.target_range)
+        if plan is None:
+            plan = self.compile_attack_plan(weapon, target, context.target_range)
+        expr = attacks_value if isinstance(attacks_value, DiceExpr) else parse_dice_expr(attacks_value)
+        rolls = self.roll_dice_expr(expr, context)
+        base_attacks = max(0, expr.total(rolls))
             
         # Apply Blast rule if present
-        if "Blast" in weapon.special_rules:
-            blast_bonus = m.floor(target.total_models / 5)
-            self.debug_print(f"  Weapon has Blast rule - adding {blast_bonus} attacks for {target.total_models} models")
-            base_attacks += blast_bonus
-            
+        base_attacks += plan.blast_bonus
+
+        if self.tracer is not None:
+            self.tracer.emit("attacks", weapon=weapon.name, expr=expr.text, rolls=rolls, blast=plan.blast_bonus,
+                             value=base_attacks)
         return base_attacks
 
-    def roll_damage(self, damage_value: Union[int, str], weapon: Weapon, target: Model, is_critical_hit: bool = False, one_use_rules: Dict[str, bool] = None) -> int:
+    def roll_damage(self, damage_value: Union[int, str, DiceExpr], weapon: Weapon, target: Model, is_critical_hit: bool = False,
+                    context: Optional[AttackContext] = None, plan: Optional[AttackPlan] = None) -> int:
         """Calculate damage based on the weapon's damage value"""
-        self.debug_print(f"  Rolling damage for value: {damage_value}")
-        if isinstance(damage_value, int):
-            self.debug_print(f"  Integer damage value: {damage_value}")
-            return damage_value
-            
-        # Handle D6+X format
-        match = re.match(r'D6\+(\d+)', damage_value)
-        if match:
-            unmodified_roll = self.roll_dice()
-            result = unmodified_roll + int(match.group(1))
-            self.debug_print(f"  D6+X damage result: {result}")
-            
-            # Check if we need to reroll
-            should_reroll = False
-            if self.has_reroll_damage(weapon, target):
-                # Reroll if the roll failed (for D6+X, we consider it failed if the expected value of the reroll is higher than the roll)
-                should_reroll = unmodified_roll < 4
-            elif self.has_reroll_damage_1(weapon) and unmodified_roll == 1:
-                # Reroll if we rolled a 1
-                should_reroll = True
-            elif one_use_rules["has_reroll_1_hit_wound_or_damage"] and unmodified_roll < 4:
-                should_reroll = True
-                one_use_rules["has_reroll_1_hit_wound_or_damage"] = False
-                self.debug_print("  Using Reroll 1 Hit or Wound or Damage special rule")
-
-            if should_reroll:
-                self.debug_print(f"  Initial damage roll {result} (unmodified {unmodified_roll}) failed or rolled a 1, attempting reroll")
-                unmodified_reroll = self.roll_dice()
-                result = unmodified_reroll + int(match.group(1))
-                self.debug_print(f"  Reroll result: {result}")
-
-            if one_use_rules["has_flip_a_6_damage"]:
-                if should_reroll and unmodified_reroll < 4:
-                    die_roll = 6
-                    one_use_rules["has_flip_a_6_damage"] = False
-                    self.debug_print("  Using Flip Damage Roll to 6 special rule")
-                    result = die_roll + int(match.group(1))
-                elif unmodified_roll < 4:
-                    die_roll = 6
-                    one_use_rules["has_flip_a_6_damage"] = False
-                    self.debug_print("  Using Flip Damage Roll to 6 special rule")
-                    result = die_roll + int(match.group(1))
-            elif one_use_rules["has_flip_a_6"]:
-                if should_reroll and unmodified_reroll < 4:
-                    die_roll = 6
-                    one_use_rules["has_flip_a_6"] = False
-                    self.debug_print("  Using Flip Damage Roll to 6 special rule")
-                    result = die_roll + int(match.group(1))
-                elif unmodified_roll < 4:
-                    die_roll = 6
-                    one_use_rules["has_flip_a_6"] = False
-                    self.debug_print("  Using Flip Damage Roll to 6 special rule")
-                    result = die_roll + int(match.group(1))
-            
-            return result
-            
-        # Handle D6 format
-        if damage_value == 'D6':
-            unmodified_roll = self.roll_dice()
-            result = unmodified_roll
-            self.debug_print(f"  D6 damage result: {result}")
-            
-            # Check if we need to reroll
-            should_reroll = False
-            if self.has_reroll_damage(weapon, target):
-                # Reroll if the roll failed (for D6+X, we consider it failed if the expected value of the reroll is higher than the roll)
-                should_reroll = unmodified_roll < 4
-            elif self.has_reroll_damage_1(weapon) and unmodified_roll == 1:
-                # Reroll if we rolled a 1
-                should_reroll = True
-            elif one_use_rules["has_reroll_1_hit_wound_or_damage"] and unmodified_roll < 4:
-                should_reroll = True
-                one_use_rules["has_reroll_1_hit_wound_or_damage"] = False
-                self.debug_print("  Using Reroll 1 Hit or Wound or Damage special rule")
-
-            if should_reroll:
-                self.debug_print(f"  Initial damage roll {result} (unmodified {unmodified_roll}) failed or rolled a 1, attempting reroll")
-                unmodified_reroll = self.roll_dice()
-                reroll = unmodified_reroll
-                self.debug_print(f"  Reroll result: {reroll}")
-                result = reroll
-
-            if one_use_rules["has_flip_a_6_damage"]:
-                if should_reroll and unmodified_reroll < 4:
-                    die_roll = 6
-                    one_use_rules["has_flip_a_6_damage"] = False
-                    self.debug_print("  Using Flip Damage Roll to 6 special rule")
-                    result = die_roll
-                elif unmodified_roll < 4:
-                    die_roll = 6
-                    one_use_rules["has_flip_a_6_damage"] = False
-                    self.debug_print("  Using Flip Damage Roll to 6 special rule")
-                    result = die_roll
-            elif one_use_rules["has_flip_a_6"]:
-                if should_reroll and unmodified_reroll < 4:
-                    die_roll = 6
-                    one_use_rules["has_flip_a_6"] = False
-                    self.debug_print("  Using Flip Damage Roll to 6 special rule")
-                    result = die_roll
-                elif unmodified_roll < 4:
-                    die_roll = 6
-                    one_use_rules["has_flip_a_6"] = False
-                    self.debug_print("  Using Flip Damage Roll to 6 special rule")
-                    result = die_roll
+        if context is None:
+            context = self.make_context(target, weapon.target_range)
+        if plan is None:
+            plan = self.compile_attack_plan(weapon, target, context.target_range)
+        one_use_rules = context.one_use_rules
+        expr = damage_value if isinstance(damage_value, DiceExpr) else parse_dice_expr(damage_value)
+        expr = expr.select(is_critical_hit)
+        if expr.dice == 0:
+            if self.tracer is not None:
+                self.tracer.emit("damage", weapon=weapon.name, expr=expr.text, value=max(0, expr.bonus))
+            return max(0, expr.bonus)
 
-            return result
-            
-        # Handle D3+X format
-        match = re.match(r'D3\+(\d+)', damage_value)
-        if match:
-            unmodified_roll = self.roll_dice()
-            result = m.ceil(unmodified_roll/2) + int(match.group(1))
-            self.debug_print(f"  D3+X damage result: {result}")
-            
-            # Check if we need to reroll
-            should_reroll = False
-            if self.has_reroll_damage(weapon, target):
-                # Reroll if the roll failed (for D3+X, we consider it failed if the expected value of the reroll is higher than the roll)
-                should_reroll = unmodified_roll < 3
-            elif self.has_reroll_damage_1(weapon) and unmodified_roll == 1:
-                # Reroll if we rolled a 1
-                should_reroll = True
-            elif one_use_rules["has_reroll_1_hit_wound_or_damage"] and unmodified_roll < 4:
-                should_reroll = True
-                one_use_rules["has_reroll_1_hit_wound_or_damage"] = False
-                self.debug_print("  Using Reroll 1 Hit or Wound or Damage special rule")
-
-            if should_reroll:
-                self.debug_print(f"  Initial damage roll {result} (unmodified {unmodified_roll}) failed or rolled a 1, attempting reroll")
-                unmodified_reroll = self.roll_dice()
-                reroll = m.ceil(unmodified_reroll/2) + int(match.group(1))
-                self.debug_print(f"  Reroll result: {reroll}")
-                result = reroll
-            
-            return result
-            
-        # Handle D3 format
-        if damage_value == 'D3':
-            unmodified_roll = self.roll_dice()
-            result = m.ceil(unmodified_roll/2)
-            self.debug_print(f"  D3 damage result: {result}")
-            
-            # Check if we need to reroll
-            should_reroll = False
-            if self.has_reroll_damage(weapon, target):
-                # Reroll if the roll failed (for D3, we consider it failed if the expected value of the reroll is higher than the roll)
-                should_reroll = unmodified_roll < 3
-            elif self.has_reroll_damage_1(weapon) and unmodified_roll == 1:
-                # Reroll if we rolled a 1
-                should_reroll = True
-            elif one_use_rules["has_reroll_1_hit_wound_or_damage"] and unmodified_roll < 4:
-                should_reroll = True
-                one_use_rules["has_reroll_1_hit_wound_or_damage"] = False
-                self.debug_print("  Using Reroll 1 Hit or Wound or Damage special rule")
-
-            if should_reroll:
-                self.debug_print(f"  Initial damage roll {result} (unmodified {unmodified_roll}) failed or rolled a 1, attempting reroll")
-                unmodified_reroll = self.roll_dice()
-                reroll = m.ceil(unmodified_reroll/2)
-                self.debug_print(f"  Reroll result: {reroll}")
-                result = reroll
-            
-            return result
-            
-        # Handle 2D6 format
-        match = re.match(r'(\d+)D6', damage_value)
-        if match:
-            num_dice = int(match.group(1))
-            unmodified_rolls = [self.roll_dice() for _ in range(num_dice)]
-            result = sum(unmodified_rolls)
-            self.debug_print(f"  XD6 damage result: {result}")
-            
-            # Check if we need to reroll
-            should_reroll = False
-            if self.has_reroll_damage(weapon, target):
-                # Reroll if any die rolled a 1
-                should_reroll = result < int(match.group(1)) * 3.5
-            elif self.has_reroll_damage_1(weapon):
-                # Reroll if any die rolled a 1
-                should_reroll = 1 in unmodified_rolls
-            elif one_use_rules["has_reroll_1_hit_wound_or_damage"] and unmodified_roll < 4:
-                should_reroll = True
-                one_use_rules["has_reroll_1_hit_wound_or_damage"] = False
-                self.debug_print("  Using Reroll 1 Hit or Wound or Damage special rule")
-
-            if should_reroll:
-                self.debug_print(f"  Initial damage roll {result} (unmodified rolls {unmodified_rolls}) contains a 1, attempting reroll")
-                unmodified_rerolls = [self.roll_dice() for _ in range(num_dice)]
-                reroll = sum(unmodified_rerolls)
-                self.debug_print(f"  Reroll result: {reroll}")
-                # Use the better of the two rolls
-                result = reroll
-            
-            return result
-        
-        # Handle 2D3 or 2D6 format
-        if damage_value == '2D3 or 2D6':
-            if is_critical_hit:
-                unmodified_roll = self.roll_dice() + self.roll_dice()
-            else:
-                unmodified_roll = m.ceil(self.roll_dice()/2) + m.ceil(self.roll_dice()/2)
-            result = unmodified_roll
-            self.debug_print(f"  Damage result: {result}")
-            return result
-        
-        # Handle D3 or 3 format
-        if damage_value == 'D3 or 3':
-            if is_critical_hit:
-                unmodified_roll = 3
-            else:
-                unmodified_roll = m.ceil(self.roll_dice()/2)
-            result = unmodified_roll
-            self.debug_print(f"  Damage result: {result}")
-            return result
+        rolls = self.roll_dice_expr(expr, context)
+        first_rolls = None
+        used_rules = ()
 
-        # If we can't parse it, return 1 as a fallback
-        self.debug_print(f"  Using fallback damage value: 1")
-        return 1
+        # Check if we need to reroll
+        should_reroll = expr.should_reroll(rolls, plan.damage_reroll)
+        if not should_reroll and one_use_rules and expr.should_reroll(rolls, REROLL_FAILED):
+            for bit, rule in DAMAGE_REROLL_RULES:
+                if one_use_rules & bit:
+                    should_reroll = True
+                    one_use_rules = context.one_use_rules = one_use_rules & ~bit
+                    used_rules += (rule,)
+                    break
 
-    def get_sustained_hits_value(self, weapon: Weapon) -> int:
-        """Extract the number of sustained hits from weapon special rules"""
-        for rule in weapon.special_rules:
-            if "Sustained Hits" in rule:
-                # Check for "Sustained Hits X+" pattern
-                match = re.search(r'Sustained Hits (\d+)\+', rule)
-                if match:
-                    return int(match.group(1))
-                
-                # Check for "Sustained Hits D3" pattern
-                if "Sustained Hits D3" in rule:
-                    return random.randint(1, 3)
-                
-                # If no specific pattern matches, default to 1
-                return 1
-        return 0
+        if should_reroll:
+            first_rolls = rolls
+            rolls = self.roll_dice_expr(expr, context)
+
+        # Flip a failed single D6 damage roll to a 6
+        if one_use_rules and expr.dice == 1 and expr.sides == 6 and rolls[0] < 4:
+            for bit, rule in DAMAGE_FLIP_RULES:
+                if one_use_rules & bit:
+                    context.one_use_rules = one_use_rules & ~bit
+                    used_rules += (rule,)
+                    rolls = [6]
+                    break
+
+        if self.tracer is not None:
+            self.tracer.emit("damage", weapon=weapon.name, expr=expr.text, rolls=rolls, rerolled=first_rolls,
+                             rules=used_rules, value=max(0, expr.total(rolls)))
+        return max(0, expr.total(rolls))
 
     def get_critical_hit_threshold(self, weapon: Weapon) -> int:
         """Get the critical hit threshold from weapon special rules"""
@@ -586,553 +610,1546 @@ class CombatEngine:
                     return True
         return False
 
-    def make_hit_roll(self, weapon: Weapon, target: Model, one_use_rules: Dict[str, bool]) -> Dict[str, bool]:
+    def get_sustained_hits_rule(self, weapon: Weapon) -> Tuple[int, bool]:
+        """Get the fixed Sustained Hits value and whether it is a D3"""
+        for rule in weapon.special_rules:
+            if "Sustained Hits" in rule:
+                match = re.search(r'Sustained Hits (\d+)\+', rule)
+                if match:
+                    return int(match.group(1)), False
+                if "Sustained Hits D3" in rule:
+                    return 0, True
+                return 1, False
+        return 0, False
+
+    def get_wound_required(self, weapon: Weapon, target: Model) -> int:
+        """Get the wound roll needed based on strength vs toughness"""
+        if weapon.strength >= target.toughness * 2:
+            return 2
+        elif weapon.strength > target.toughness:
+            return 3
+        elif weapon.strength == target.toughness:
+            return 4
+        elif weapon.strength * 2 <= target.toughness:
+            return 6
+        return 5
+
+    def has_devastating_wounds(self, weapon: Weapon, target: Model) -> bool:
+        """Check if critical wounds from the weapon count as devastating wounds against the target"""
+        for rule in weapon.special_rules:
+            if rule.startswith("Devastating Wounds "):
+                keyword = rule.replace("Devastating Wounds ", "")
+                if keyword.lower() in [k.lower() for k in target.keywords]:
+                    self.debug_print(f"  Critical wounds count as Devastating Wounds {keyword} - target has {keyword} keyword")
+                    return True
+            elif rule == "Devastating Wounds" or rule == "Mortal":
+                self.debug_print(f"  Critical wounds count as Devastating Wounds ({rule})")
+                return True
+        return False
+
+    def get_save_threshold(self, weapon: Weapon, target: Model, ap_value: int) -> int:
+        """Get the unmodified save roll needed against the weapon"""
+        # Apply -1 AP special rule if present
+        if "-1 AP" in target.special_rules:
+            self.debug_print("  Target has -1 AP rule")
+            ap_value = max(0, ap_value - 1)
+        elif "-1 AP in Melee" in target.special_rules and weapon.weapon_type.lower() == "melee":
+            self.debug_print("  Target has -1 AP in Melee rule and weapon is melee")
+            ap_value = max(0, ap_value - 1)
+        save_value = target.save + ap_value
+
+        # Apply Cover special rule if present and weapon is ranged
+        if (("Cover" in target.special_rules or "Smoke" in target.special_rules) and
+            weapon.weapon_type.lower() == "ranged" and
+            "Ignores Cover" not in weapon.special_rules):
+            self.debug_print("  Target has Cover rule (from Cover or Smoke) and weapon is ranged and doesn't ignore cover")
+            # Only prevent save from going below 3 if base save is 3 or higher
+            if target.save >= 3:
+                save_value = max(3, save_value - 1)
+            else:
+                save_value = max(2, save_value - 1)
+
+        # Phase-specific invulnerable saves replace the save entirely
+        for rule in target.special_rules:
+            match = re.match(r'Invulnerable Save Ranged (\d+)\+', rule)
+            if match and weapon.weapon_type.lower() == "ranged":
+                self.debug_print(f"  Target has {rule} and weapon is ranged - using {match.group(1)}+ invulnerable save")
+                return max(2, int(match.group(1)))
+            match = re.match(r'Invulnerable Save Melee (\d+)\+', rule)
+            if match and weapon.weapon_type.lower() == "melee":
+                self.debug_print(f"  Target has {rule} and weapon is melee - using {match.group(1)}+ invulnerable save")
+                return max(2, int(match.group(1)))
+
+        if target.invulnerable_save is not None:
+            save_value = min(save_value, target.invulnerable_save)
+        # A roll of 1 always fails
+        return max(2, save_value)
+
+    def get_damage_reductions(self, weapon: Weapon, target: Model) -> Tuple[str, ...]:
+        """Get the damage reduction rules that apply to the weapon, in the order they are applied"""
+        reductions = []
+        for rule in target.special_rules:
+            if rule in ("-1 Damage", "Half Damage") and ("Ignore Damage Modifiers" not in weapon.special_rules or "Ignore Modifiers" not in weapon.special_rules):
+                self.debug_print(f"  Target has {rule} rule")
+                reductions.append(rule)
+        return tuple(reductions)
+
+    def get_feel_no_pain(self, weapon: Weapon, target: Model, is_devastating_wound: bool) -> Optional[int]:
+        """Get the Feel No Pain value that applies to an attack"""
+        # First check for conditional FNP rules
+        for rule in target.special_rules:
+            if "Feel No Pain" in rule:
+                # Extract the value of the unconditional Feel No Pain
+                match = re.match(r'Feel No Pain (\d+)\+', rule)
+                if match:
+                    return int(match.group(1))
+            elif "FNP" in rule:
+                # Extract the condition and value from the rule
+                # Format is "[condition] FNP X+"
+                match = re.match(r'([^FNP]+) FNP (\d+)\+', rule)
+                if match:
+                    condition = match.group(1).strip()
+                    # Check if the weapon has the condition as a special rule
+                    if condition in weapon.special_rules:
+                        return int(match.group(2))
+                    # Devastating wounds count as mortal wounds
+                    if condition == "Mortal" and (is_devastating_wound or "Mortal Wounds" in weapon.special_rules):
+                        return int(match.group(2))
+        # If no conditional FNP applies, use the base FNP value
+        return target.feel_no_pain
+
+    def get_melta_bonus(self, weapon: Weapon, target_range: int) -> int:
+        """Get the total Melta damage bonus that applies at the target range"""
+        melta_bonus = 0
+        if weapon.weapon_type.lower() == "ranged" and target_range <= weapon.range / 2:
+            for rule in weapon.special_rules:
+                match = re.match(r'Melta (\d+)', rule)
+                if match:
+                    self.debug_print(f"  Weapon has {rule} and target is within half range - adding {match.group(1)} damage")
+                    melta_bonus += int(match.group(1))
+        return melta_bonus
+
+    def get_rapid_fire_bonuses(self, weapon: Weapon, target_range: int) -> Tuple[DiceExpr, ...]:
+        """Get the Rapid Fire bonuses that apply at the target range"""
+        bonuses = []
+        for rule in weapon.special_rules:
+            if rule.startswith("Rapid Fire ") and weapon.weapon_type.lower() == "ranged" and target_range <= weapon.range/2:
+                rapid_fire_value = rule[len("Rapid Fire "):]
+                self.debug_print(f"  Weapon has {rule} and target is within half range")
+                bonuses.append(parse_dice_expr(rapid_fire_value))
+        return tuple(bonuses)
+
+    def compile_attack_plan(self, weapon: Weapon, target: Model, target_range: Optional[int] = None) -> AttackPlan:
+        """
+        Resolve the weapon's and target's special rules into an AttackPlan, cached per weapon/target pairing.
+        target_range defaults to the weapon's target_range.
+        """
+        if target_range is None:
+            target_range = weapon.target_range
+        key = (weapon.name, weapon.range, weapon.attacks, weapon.skill, weapon.strength, weapon.ap, weapon.damage,
+               weapon.weapon_type, tuple(weapon.special_rules), target_range,
+               target.toughness, target.save, target.wounds, target.total_models, target.invulnerable_save,
+               target.feel_no_pain, tuple(target.keywords), tuple(target.special_rules))
+        plan = self._attack_plans.get(key)
+        if plan is not None:
+            return plan
+
+        self.debug_print(f"  Compiling attack plan for {weapon.name} against {target.name}")
+        ap_value = weapon.ap + 1 if "+1 AP" in weapon.special_rules else weapon.ap
+        hit_modifier, wound_modifier = self.get_roll_modifiers(weapon, target)
+        sustained_hits, sustained_hits_d3 = self.get_sustained_hits_rule(weapon)
+
+        if self.has_reroll_hits(weapon, target):
+            hit_reroll = REROLL_FAILED
+        elif self.has_reroll_hits_1(weapon, target):
+            hit_reroll = REROLL_ONES
+        else:
+            hit_reroll = None
+        if self.has_reroll_wounds(weapon, target):
+            wound_reroll = REROLL_FAILED
+        elif self.has_reroll_wounds_1(weapon, target):
+            wound_reroll = REROLL_ONES
+        else:
+            wound_reroll = None
+        if self.has_reroll_damage(weapon, target):
+            damage_reroll = REROLL_FAILED
+        elif self.has_reroll_damage_1(weapon):
+            damage_reroll = REROLL_ONES
+        else:
+            damage_reroll = None
+
+        plan = AttackPlan(
+            in_range=not (weapon.weapon_type.lower() == "ranged" and weapon.range < target_range),
+            attacks=parse_dice_expr(weapon.attacks),
+            blast_bonus=m.floor(target.total_models / 5) if "Blast" in weapon.special_rules else 0,
+            rapid_fire_bonuses=self.get_rapid_fire_bonuses(weapon, target_range),
+            torrent=self.has_torrent(weapon),
+            skill=weapon.skill,
+            hit_modifier=hit_modifier,
+            hit_reroll=hit_reroll,
+            critical_hit_threshold=self.get_critical_hit_threshold(weapon),
+            sustained_hits=sustained_hits,
+            sustained_hits_d3=sustained_hits_d3,
+            lethal_hits=self.has_lethal_hits(weapon, target),
+            mortal="Mortal" in weapon.special_rules,
+            wound_required=self.get_wound_required(weapon, target),
+            wound_modifier=wound_modifier,
+            wound_reroll=wound_reroll,
+            critical_wound_threshold=self.get_critical_wound_threshold(weapon, target),
+            devastating_wounds=self.has_devastating_wounds(weapon, target),
+            save_threshold=self.get_save_threshold(weapon, target, ap_value),
+            damage=parse_dice_expr(weapon.damage),
+            damage_reroll=damage_reroll,
+            damage_reductions=self.get_damage_reductions(weapon, target),
+            melta_bonus=self.get_melta_bonus(weapon, target_range),
+            feel_no_pain=self.get_feel_no_pain(weapon, target, False),
+            feel_no_pain_devastating=self.get_feel_no_pain(weapon, target, True),
+            overkill="Overkill" in weapon.special_rules
+        )
+        self._attack_plans[key] = plan
+        return plan
+
+    def make_hit_roll(self, weapon: Weapon, target: Model, context: Optional[AttackContext] = None,
+                      plan: Optional[AttackPlan] = None) -> Dict[str, bool]:
         """Make a hit roll based on the weapon's skill"""
+        if context is None:
+            context = self.make_context(target, weapon.target_range)
+        if plan is None:
+            plan = self.compile_attack_plan(weapon, target, context.target_range)
+        one_use_rules = context.one_use_rules
+
         # Check for Torrent special rule
-        if self.has_torrent(weapon):
-            self.debug_print("  Weapon has Torrent special rule - hit automatically succeeds")
+        if plan.torrent:
+            if self.tracer is not None:
+                self.tracer.emit("hit", weapon=weapon.name, rules=("Torrent",), outcome="hit")
             return {"hit": True, "critical": False}
             
         # Initial roll
-        unmodified_roll = self.roll_dice()
+        unmodified_roll = self.roll_dice(context)
         # Apply modifiers
-        roll = unmodified_roll + self.hit_modifiers
+        roll = unmodified_roll + plan.hit_modifier
         
         # Get critical hit threshold
-        critical_threshold = self.get_critical_hit_threshold(weapon)
+        critical_threshold = plan.critical_hit_threshold
         
         # Check if we need to reroll
         should_reroll = False
-        if self.has_reroll_hits(weapon, target):
+        used_rules = ()
+        if plan.hit_reroll == REROLL_FAILED:
             # Reroll if the roll failed
-            should_reroll = roll < weapon.skill
-        elif self.has_reroll_hits_1(weapon, target) and unmodified_roll == 1:
+            should_reroll = roll < plan.skill
+        elif plan.hit_reroll == REROLL_ONES and unmodified_roll == 1:
             # Reroll if we rolled a 1
             should_reroll = True
-        elif one_use_rules["has_reroll_1_hit"] and roll < weapon.skill:
-            # Reroll if we rolled a 1 and haven't used the reroll yet
-            should_reroll = True
-            one_use_rules["has_reroll_1_hit"] = False
-            self.debug_print("  Using Reroll 1 Hit Roll special rule")
-        elif one_use_rules["has_reroll_1_hit_or_wound"] and roll < weapon.skill:
-            # Reroll if we rolled a 1 and haven't used the reroll yet
-            should_reroll = True
-            one_use_rules["has_reroll_1_hit_or_wound"] = False
-            self.debug_print("  Using Reroll 1 Hit or Wound special rule")
-        elif one_use_rules["has_reroll_1_hit_wound_or_damage"] and roll < weapon.skill:
-            # Reroll if we rolled a 1 and haven't used the reroll yet
-            should_reroll = True
-            one_use_rules["has_reroll_1_hit_wound_or_damage"] = False
-            self.debug_print("  Using Reroll 1 Hit or Wound or Damage special rule")
+        elif one_use_rules and roll < plan.skill:
+            # Otherwise spend the first one-use reroll available on a failed roll
+            for bit, rule in HIT_REROLL_RULES:
+                if one_use_rules & bit:
+                    should_reroll = True
+                    one_use_rules = context.one_use_rules = one_use_rules & ~bit
+                    used_rules += (rule,)
+                    break
         
+        first_roll = None
         if should_reroll:
-            self.debug_print(f"  Initial hit roll {roll} failed or rolled a 1, attempting reroll")
-            unmodified_reroll = self.roll_dice()
-            reroll = unmodified_reroll + self.hit_modifiers
-            self.debug_print(f"  Reroll result: {reroll}")
-            unmodified_roll = unmodified_reroll
-            roll = reroll
+            first_roll = unmodified_roll
+            unmodified_roll = self.roll_dice(context)
+            roll = unmodified_roll + plan.hit_modifier
         
         # Apply a flipped 6, if any.
-        if one_use_rules["has_flip_a_6_hit"] and roll < weapon.skill:
-            unmodified_roll = 6
-            one_use_rules["has_flip_a_6_hit"] = False
-            self.debug_print("  Using Flip Hit Roll to 6 special rule")
-        elif one_use_rules["has_flip_a_6_hit_wound"] and roll < weapon.skill:
-            unmodified_roll = 6
-            one_use_rules["has_flip_a_6_hit_wound"] = False
-            self.debug_print("  Using Flip Hit or Wound Roll to 6 special rule")
-        elif one_use_rules["has_flip_a_6"] and roll < weapon.skill:
-            unmodified_roll = 6
-            one_use_rules["has_flip_a_6"] = False
-            self.debug_print("  Using Flip Hit Roll to 6 special rule")
-
-        # Check for automatic failure on unmodified roll of 1
-        if unmodified_roll == 1 and not self.has_torrent(weapon):
-            self.debug_print("  Unmodified roll of 1 automatically fails (no Torrent)")
-            return {"hit": False, "critical": False}
-        
-        # Critical hit based on threshold
-        is_critical = unmodified_roll >= critical_threshold
-        # Normal hit
-        is_hit = is_critical or roll >= weapon.skill
-        
+        if one_use_rules and roll < plan.skill:
+            for bit, rule in HIT_FLIP_RULES:
+                if one_use_rules & bit:
+                    unmodified_roll = 6
+                    context.one_use_rules = one_use_rules & ~bit
+                    used_rules += (rule,)
+                    break
+
+        # Automatic failure on unmodified roll of 1, otherwise critical hit based on threshold or normal hit
+        is_critical = unmodified_roll != 1 and unmodified_roll >= critical_threshold
+        is_hit = unmodified_roll != 1 and (is_critical or roll >= plan.skill)
+
+        if self.tracer is not None:
+            self.tracer.emit("hit", weapon=weapon.name, roll=unmodified_roll, modifier=plan.hit_modifier,
+                             needed=plan.skill, rerolled=first_roll, rules=used_rules,
+                             outcome="critical" if is_critical else "hit" if is_hit else "miss")
         return {
             "hit": is_hit,
             "critical": is_critical
         }
 
-    def make_wound_roll(self, weapon: Weapon, target: Model, is_critical_hit: bool = False, one_use_rules: Dict[str, bool] = None) -> Dict[str, bool]:
+    def make_wound_roll(self, weapon: Weapon, target: Model, is_critical_hit: bool = False,
+                        context: Optional[AttackContext] = None, plan: Optional[AttackPlan] = None) -> Dict[str, bool]:
         """Make a wound roll based on strength vs toughness"""
+        if context is None:
+            context = self.make_context(target, weapon.target_range)
+        if plan is None:
+            plan = self.compile_attack_plan(weapon, target, context.target_range)
+        one_use_rules = context.one_use_rules
+
         # Lethal Hits automatically wound on critical hits
-        if is_critical_hit and self.has_lethal_hits(weapon, target):
-            self.debug_print("  Critical hit with Lethal Hits, automatically wounding")
+        if is_critical_hit and plan.lethal_hits:
+            if self.tracer is not None:
+                self.tracer.emit("wound", weapon=weapon.name, rules=("Lethal Hits",), outcome="wound")
             return {"wound": True, "critical": False}
         
         # If the weapon has the Mortal special rule and it has hit, then it automatically gets a critical wound
         # Note that this is different from the Devastating Wounds special rule, which is handled later.
-        if "Mortal" in weapon.special_rules:
-            self.debug_print("  Weapon has Mortal special rule and has hit, automatically getting a critical wound")
+        if plan.mortal:
+            if self.tracer is not None:
+                self.tracer.emit("wound", weapon=weapon.name, rules=("Mortal",), outcome="critical")
             return {"wound": True, "critical": True}
 
-        unmodified_roll = self.roll_dice()
+        unmodified_roll = self.roll_dice(context)
         # Apply modifiers
-        roll = unmodified_roll + self.wound_modifiers
+        roll = unmodified_roll + plan.wound_modifier
         
         # Get critical wound threshold
-        critical_threshold = self.get_critical_wound_threshold(weapon, target)
+        critical_threshold = plan.critical_wound_threshold
         
-        # Determine required roll based on strength vs toughness
-        if weapon.strength >= target.toughness * 2:
-            required = 2
-        elif weapon.strength > target.toughness:
-            required = 3
-        elif weapon.strength == target.toughness:
-            required = 4
-        elif weapon.strength * 2 <= target.toughness:
-            required = 6
-        else:
-            required = 5
+        # Required roll based on strength vs toughness
+        required = plan.wound_required
             
         # Check if we need to reroll
         should_reroll = False
-        if self.has_reroll_wounds(weapon, target):
+        used_rules = ()
+        if plan.wound_reroll == REROLL_FAILED:
             # Reroll if the roll failed
             should_reroll = roll < required
-        elif self.has_reroll_wounds_1(weapon, target) and unmodified_roll == 1:
+        elif plan.wound_reroll == REROLL_ONES and unmodified_roll == 1:
             # Reroll if we rolled a 1
             should_reroll = True
-        elif one_use_rules["has_reroll_1_wound"] and roll < required:
-            # Use a 1-use reroll
-            should_reroll = True
-            one_use_rules["has_reroll_1_wound"] = False
-            self.debug_print("  Using Reroll 1 Wound Roll special rule")
-        elif one_use_rules["has_reroll_1_hit_or_wound"] and roll < required:
-            # Use a 1-use reroll
-            should_reroll = True
-            one_use_rules["has_reroll_1_hit_or_wound"] = False
-            self.debug_print("  Using Reroll 1 Hit or Wound special rule")
-        elif one_use_rules["has_reroll_1_hit_wound_or_damage"] and roll < required:
-            # Use a 1-use reroll
-            should_reroll = True
-            one_use_rules["has_reroll_1_hit_wound_or_damage"] = False
-            self.debug_print("  Using Reroll 1 Hit or Wound or Damage special rule")
+        elif one_use_rules and roll < required:
+            # Otherwise spend the first one-use reroll available on a failed roll
+            for bit, rule in WOUND_REROLL_RULES:
+                if one_use_rules & bit:
+                    should_reroll = True
+                    one_use_rules = context.one_use_rules = one_use_rules & ~bit
+                    used_rules += (rule,)
+                    break
 
+        first_roll = None
         if should_reroll:
-            self.debug_print(f"  Initial wound roll {roll} failed or rolled a 1, attempting reroll")
-            unmodified_reroll = self.roll_dice()
-            reroll = unmodified_reroll + self.wound_modifiers
-            self.debug_print(f"  Reroll result: {reroll}")
-            unmodified_roll = unmodified_reroll
-            roll = reroll
+            first_roll = unmodified_roll
+            unmodified_roll = self.roll_dice(context)
+            roll = unmodified_roll + plan.wound_modifier
 
         # Apply a flipped 6, if any.
-        if one_use_rules["has_flip_a_6_wound"] and roll < required:
-            unmodified_roll = 6
-            one_use_rules["has_flip_a_6_wound"] = False
-            self.debug_print("  Using Flip Wound Roll to 6 special rule")
-        elif one_use_rules["has_flip_a_6_hit_wound"] and roll < required:
-            unmodified_roll = 6
-            one_use_rules["has_flip_a_6_hit_wound"] = False
-            self.debug_print("  Using Flip Hit or Wound Roll to 6 special rule")
-        elif one_use_rules["has_flip_a_6"] and roll < required:
-            unmodified_roll = 6
-            one_use_rules["has_flip_a_6"] = False
-            self.debug_print("  Using Flip Wound Roll to 6 special rule")
-
-        # Check for automatic failure on unmodified roll of 1
-        if unmodified_roll == 1:
-            self.debug_print("  Unmodified roll of 1 automatically fails wound roll")
-            return {"wound": False, "critical": False}
-        
-        # Critical wound based on threshold
-        is_critical = unmodified_roll >= critical_threshold
-        if is_critical:
-            return {"wound": True, "critical": True}
-            
+        if one_use_rules and roll < required:
+            for bit, rule in WOUND_FLIP_RULES:
+                if one_use_rules & bit:
+                    unmodified_roll = 6
+                    context.one_use_rules = one_use_rules & ~bit
+                    used_rules += (rule,)
+                    break
+
+        # Automatic failure on unmodified roll of 1, otherwise critical wound based on threshold or normal wound
+        is_critical = unmodified_roll != 1 and unmodified_roll >= critical_threshold
+        is_wound = unmodified_roll != 1 and (is_critical or roll >= required)
+
+        if self.tracer is not None:
+            self.tracer.emit("wound", weapon=weapon.name, roll=unmodified_roll, modifier=plan.wound_modifier,
+                             needed=required, rerolled=first_roll, rules=used_rules,
+                             outcome="critical" if is_critical else "wound" if is_wound else "fail")
         return {
-            "wound": roll >= required,
-            "critical": False
+            "wound": is_wound,
+            "critical": is_critical
         }
 
-    def make_save_roll(self, weapon: Weapon, target: Model, is_devastating_wound: bool = False) -> bool:
+    def make_save_roll(self, weapon: Weapon, target: Model, is_devastating_wound: bool = False,
+                       context: Optional[AttackContext] = None, plan: Optional[AttackPlan] = None) -> bool:
         """Make a save roll based on the target's save characteristic"""
+        if context is None:
+            context = self.make_context(target, weapon.target_range)
+        if plan is None:
+            plan = self.compile_attack_plan(weapon, target, context.target_range)
+
         # Devastating Wounds automatically fail the save
         if is_devastating_wound:
+            if self.tracer is not None:
+                self.tracer.emit("save", weapon=weapon.name, rules=("Devastating Wounds",), outcome="failed")
             return False
         
-        roll = self.roll_dice()
+        roll = self.roll_dice(context)
 
-        # A roll of 1 automatically fails the save
-        if roll == 1:
-            return False
+        # A roll of 1 automatically fails the save; AP, Cover and invulnerable saves are already folded into the
+        # save threshold
+        saved = roll != 1 and roll >= plan.save_threshold
 
-        # Apply modifiers
-        roll += self.save_modifiers
-        
-        # Calculate final save value
-        ap_value = weapon.ap_actual
-        
-        # Apply -1 AP special rule if present
-        if "-1 AP" in target.special_rules:
-            self.debug_print("  Target has -1 AP rule")
-            ap_value = max(0, ap_value - 1)
-            self.debug_print(f"  AP value after -1 AP rule: {ap_value}")
-        elif "-1 AP in Melee" in target.special_rules and weapon.weapon_type.lower() == "melee":
-            self.debug_print("  Target has -1 AP in Melee rule and weapon is melee")
-            ap_value = max(0, ap_value - 1)
-            self.debug_print(f"  AP value after -1 AP in Melee rule: {ap_value}")
-        
-        save_value = target.save + ap_value
-        
-        # Apply Cover special rule if present and weapon is ranged
-        if (("Cover" in target.special_rules or "Smoke" in target.special_rules) and 
-            weapon.weapon_type.lower() == "ranged" and 
-            "Ignores Cover" not in weapon.special_rules):
-            self.debug_print("  Target has Cover rule (from Cover or Smoke) and weapon is ranged and doesn't ignore cover")
-            # Only prevent save from going below 3 if base save is 3 or higher
-            if target.save >= 3:
-                save_value = max(3, save_value - 1)
-            else:
-                save_value = max(2, save_value - 1)
-            self.debug_print(f"  Save value after Cover: {save_value}")
+        if self.tracer is not None:
+            self.tracer.emit("save", weapon=weapon.name, roll=roll, needed=plan.save_threshold,
+                             outcome="saved" if saved else "failed")
+        return saved
 
-        # Debug print all special rules
-        self.debug_print(f"  Target special rules: {target.special_rules}")
+    def get_roll_modifiers(self, weapon: Weapon, target: Model) -> Tuple[int, int]:
+        """Get the hit and wound roll modifiers for a weapon against a target"""
+        hit_modifiers = 0
+        wound_modifiers = 0
 
-        # Check for Invulnerable Save Ranged special rule
-        for rule in target.special_rules:
-            if rule.startswith("Invulnerable Save Ranged "):
-                # Extract the value from the rule
-                match = re.match(r'Invulnerable Save Ranged (\d+)\+', rule)
-                if match and weapon.weapon_type.lower() == "ranged":
-                    inv_value = int(match.group(1))
-                    self.debug_print(f"  Target has {rule} and weapon is ranged - using {inv_value}+ invulnerable save")
-                    if roll >= inv_value:
-                        return True
-                    return False
-            if rule.startswith("Invulnerable Save Melee "):
-                # Extract the value from the rule
-                match = re.match(r'Invulnerable Save Melee (\d+)\+', rule)
-                if match and weapon.weapon_type.lower() == "melee":
-                    inv_value = int(match.group(1))
-                    self.debug_print(f"  Target has {rule} and weapon is melee - using {inv_value}+ invulnerable save")
-                    if roll >= inv_value:
-                        return True
-                    return False
-
-        # Check invulnerable save if available
-        if target.invulnerable_save is not None:
-            self.debug_print(f"  Using general invulnerable save: {target.invulnerable_save}+")
-            if roll >= target.invulnerable_save:
-                return True
-                
-        return roll >= save_value
-
-    def resolve_attack(self, weapon: Weapon, target: Model, one_use_rules: Dict[str, bool]) -> Dict[str, bool]:
-        """Resolve a single attack from a weapon against a target"""
-        self.hit_modifiers = 0
-        self.wound_modifiers = 0
-        self.save_modifiers = 0
-        self.debug_print(f"  Starting attack with {weapon.name}")
-        self.debug_print(f"  Weapon damage value: {weapon.damage}")
-        
         # Calculate hit and wound modifiers including target special rules
         for rule in target.special_rules:
             if "Ignore Modifiers" not in weapon.special_rules and "Ignore Hit Modifiers" not in weapon.special_rules:
                 if rule == "-1 to be Hit":
                     self.debug_print("  Target has -1 to be Hit rule")
-                    self.hit_modifiers -= 1
-                    self.debug_print(f"  Hit modifiers reduced to {self.hit_modifiers}")
+                    hit_modifiers -= 1
+                    self.debug_print(f"  Hit modifiers reduced to {hit_modifiers}")
                 elif rule == "-1 to be Hit in Melee" and weapon.weapon_type.lower() == "melee":
                     self.debug_print("  Target has -1 to be Hit in Melee rule and weapon is melee")
-                    self.hit_modifiers -= 1
-                    self.debug_print(f"  Hit modifiers reduced to {self.hit_modifiers}")
+                    hit_modifiers -= 1
+                    self.debug_print(f"  Hit modifiers reduced to {hit_modifiers}")
                 elif rule == "Stealth" and weapon.weapon_type.lower() == "ranged":
                     self.debug_print("  Target has Stealth rule")
-                    self.hit_modifiers -= 1
-                    self.debug_print(f"  Hit modifiers reduced to {self.hit_modifiers}")
+                    hit_modifiers -= 1
+                    self.debug_print(f"  Hit modifiers reduced to {hit_modifiers}")
                 elif rule == "Smoke":
                     self.debug_print("  Target has Smoke rule - applying Stealth")
-                    self.hit_modifiers -= 1
-                    self.debug_print(f"  Hit modifiers reduced to {self.hit_modifiers}")
+                    hit_modifiers -= 1
+                    self.debug_print(f"  Hit modifiers reduced to {hit_modifiers}")
             if "Ignore Modifiers" not in weapon.special_rules and "Ignore Wound Modifiers" not in weapon.special_rules:
                 if rule == "-1 to be Wounded":
                     self.debug_print("  Target has -1 to be Wounded rule")
-                    self.wound_modifiers -= 1
-                    self.debug_print(f"  Wound modifiers reduced to {self.wound_modifiers}")
+                    wound_modifiers -= 1
+                    self.debug_print(f"  Wound modifiers reduced to {wound_modifiers}")
                 elif rule == "-1 to be Wounded in Melee" and weapon.weapon_type.lower() == "melee":
                     self.debug_print("  Target has -1 to be Wounded in Melee rule and weapon is melee")
-                    self.wound_modifiers -= 1
-                    self.debug_print(f"  Wound modifiers reduced to {self.wound_modifiers}")
+                    wound_modifiers -= 1
+                    self.debug_print(f"  Wound modifiers reduced to {wound_modifiers}")
                 elif rule == "-1 to be Wounded by High Strength" and weapon.strength > target.toughness:
                     self.debug_print("  Target has -1 to be Wounded by High Strength rule and weapon strength is greater than target toughness")
-                    self.wound_modifiers -= 1
-                    self.debug_print(f"  Wound modifiers reduced to {self.wound_modifiers}")
+                    wound_modifiers -= 1
+                    self.debug_print(f"  Wound modifiers reduced to {wound_modifiers}")
         
         # Max modifer is +/-1.
-        self.hit_modifiers = max(-1, min(1, self.hit_modifiers))
-        self.wound_modifiers = max(-1, min(1, self.wound_modifiers))
+        hit_modifiers = max(-1, min(1, hit_modifiers))
+        wound_modifiers = max(-1, min(1, wound_modifiers))
         
         # Check for weapon special rules that modify rolls; maximum modifiers are +/-1.
         for rule in weapon.special_rules:
             if rule == "+1 to Hit":
                 self.debug_print("  Weapon has +1 to Hit rule - adding +1 to hit roll")
-                self.hit_modifiers += 1
-                self.debug_print(f"  Hit modifiers increased to {self.hit_modifiers}")
+                hit_modifiers += 1
+                self.debug_print(f"  Hit modifiers increased to {hit_modifiers}")
             elif rule.startswith("+1 to Hit "):
                 keyword = rule.replace("+1 to Hit ", "")
                 if keyword.lower() in [k.lower() for k in target.keywords]:
                     self.debug_print(f"  Weapon has {rule} and target has {keyword} keyword - adding +1 to hit roll")
-                    self.hit_modifiers += 1
-                    self.debug_print(f"  Hit modifiers increased to {self.hit_modifiers}")
+                    hit_modifiers += 1
+                    self.debug_print(f"  Hit modifiers increased to {hit_modifiers}")
             if rule == "+1 to Wound":
                 self.debug_print("  Weapon has +1 to Wound rule - adding +1 to wound roll")
-                self.wound_modifiers += 1
-                self.debug_print(f"  Wound modifiers increased to {self.wound_modifiers}")
+                wound_modifiers += 1
+                self.debug_print(f"  Wound modifiers increased to {wound_modifiers}")
             elif rule.startswith("+1 to Wound "):
                 keyword = rule.replace("+1 to Wound ", "")
                 if keyword.lower() in [k.lower() for k in target.keywords]:
                     self.debug_print(f"  Weapon has {rule} and target has {keyword} keyword - adding +1 to wound roll")
-                    self.wound_modifiers += 1
-                    self.debug_print(f"  Wound modifiers increased to {self.wound_modifiers}")
+                    wound_modifiers += 1
+                    self.debug_print(f"  Wound modifiers increased to {wound_modifiers}")
+
+        return hit_modifiers, wound_modifiers
+
+    def resolve_attack(self, weapon: Weapon, target: Model, context: AttackContext,
+                       plan: Optional[AttackPlan] = None) -> Dict[str, bool]:
+        """Resolve a single attack from a weapon against a target, allocating damage to context.current_wounds"""
+        if plan is None:
+            plan = self.compile_attack_plan(weapon, target, context.target_range)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
 
         # Step 1: Hit Roll
-        hit_result = self.make_hit_roll(weapon, target, one_use_rules)
-        self.debug_print(f"  Hit roll result: {hit_result}")
+        hit_result = self.make_hit_roll(weapon, target, context, plan)
+        if profiler is not None:
+            profiler.lap("hit")
         if not hit_result["hit"]:
             return {"hit": False, "wound": False, "save": False, "damage_dealt": 0}
+        result = {"hit": True, "critical_hit": hit_result["critical"],
+                  "lethal_hit": hit_result["critical"] and plan.lethal_hits, "wound": False, "save": False,
+                  "damage_dealt": 0}
             
         # Check for Sustained Hits
         sustained_hits = 0
         if hit_result["critical"]:
-            sustained_hits = self.get_sustained_hits_value(weapon)
+            sustained_hits = context.random.randint(1, 3) if plan.sustained_hits_d3 else plan.sustained_hits
+            if sustained_hits and self.tracer is not None:
+                self.tracer.emit("sustained_hits", weapon=weapon.name, value=sustained_hits)
+        result["sustained_hits"] = sustained_hits
             
         # Step 2: Wound Roll
         is_critical_hit = hit_result["critical"]
-        wound_result = self.make_wound_roll(weapon, target, is_critical_hit, one_use_rules)
-        self.debug_print(f"  Wound roll result: {wound_result}")
+        wound_result = self.make_wound_roll(weapon, target, is_critical_hit, context, plan)
+        if profiler is not None:
+            profiler.lap("wound")
         if not wound_result["wound"]:
-            return {"hit": True, "wound": False, "save": False, "damage_dealt": 0}
+            return result
+        result["wound"] = True
+        result["critical_wound"] = wound_result["critical"]
             
         # Step 3: Save Roll
         # Check for Devastating Wounds
-        is_devastating_wound = False
-        if wound_result["critical"]:
-            # Check for conditional Devastating Wounds
-            for rule in weapon.special_rules:
-                if rule.startswith("Devastating Wounds "):
-                    # Extract the keyword from the rule
-                    keyword = rule.replace("Devastating Wounds ", "")
-                    if keyword.lower() in [k.lower() for k in target.keywords]:
-                        self.debug_print(f"  Critical wound with Devastating Wounds {keyword} - target has {keyword} keyword")
-                        is_devastating_wound = True
-                        break
-                elif rule == "Devastating Wounds":
-                    self.debug_print("  Critical wound with Devastating Wounds")
-                    is_devastating_wound = True
-                    break
-                elif rule == "Mortal":
-                    self.debug_print("  Critical wound with Mortal")
-                    is_devastating_wound = True
-                    break
-        
-        # Devastating Wounds count as mortal wounds; add "Mortal" to special rules here and remove it after the FNP is applied
-        dev_to_mortals_dummy = False
-        if is_devastating_wound:
-            weapon.special_rules.append("Mortal Wounds")
-            dev_to_mortals_dummy = True
+        is_devastating_wound = wound_result["critical"] and plan.devastating_wounds
+        result["devastating_wound"] = is_devastating_wound
 
-        # Implement Smoke
-        if "Smoke" in target.special_rules:
-            self.debug_print("  Target has Smoke rule - applying Cover")
-            target.special_rules.append("Cover")
-
-        saved = self.make_save_roll(weapon, target, is_devastating_wound)
-        self.debug_print(f"  Save roll result: {saved}")
+        saved = self.make_save_roll(weapon, target, is_devastating_wound, context, plan)
+        if profiler is not None:
+            profiler.lap("save")
         if saved:
-            return {"hit": True, "wound": True, "save": True, "damage_dealt": 0}
+            result["save"] = True
+            return result
             
         # Step 4: Inflict Damage
-        self.debug_print("  About to roll damage")
-        damage = self.roll_damage(weapon.damage, weapon, target, is_critical_hit, one_use_rules)
-        self.debug_print(f"  Damage roll: {damage}")
-        
+        damage = self.roll_damage(plan.damage, weapon, target, is_critical_hit, context, plan)
+        if profiler is not None:
+            profiler.lap("damage")
+
         # Apply damage reduction rules
-        for rule in target.special_rules:
-            if rule == "-1 Damage" and ("Ignore Damage Modifiers" not in weapon.special_rules or "Ignore Modifiers" not in weapon.special_rules):
-                self.debug_print("  Target has -1 Damage rule")
+        for rule in plan.damage_reductions:
+            if rule == "-1 Damage":
                 damage = max(1, damage - 1)
-                self.debug_print(f"  Damage reduced to {damage}")
-            elif rule == "Half Damage" and ("Ignore Damage Modifiers" not in weapon.special_rules or "Ignore Modifiers" not in weapon.special_rules):
-                self.debug_print("  Target has Half Damage rule")
+            elif rule == "Half Damage":
                 damage = m.ceil(damage / 2)
-                self.debug_print(f"  Damage halved to {damage}")
-        
-        # Check for Melta rule; note that this is applied after damage reduction rules
-        for rule in weapon.special_rules:
-            if rule.startswith("Melta "):
-                # Extract the bonus value from the rule
-                match = re.match(r'Melta (\d+)', rule)
-                if match:
-                    melta_bonus = int(match.group(1))
-                    # Check if target is within half range
-                    if weapon.weapon_type.lower() == "ranged" and weapon.target_range <= weapon.range / 2:
-                        self.debug_print(f"  Weapon has Melta {melta_bonus} and target is within half range - adding {melta_bonus} damage")
-                        damage += melta_bonus
-                        self.debug_print(f"  New damage value: {damage}")
-
-        # Apply Feel No Pain if present
-        fnp_value = None
         
-        # First check for conditional FNP rules
-        for rule in target.special_rules:
-            if "Feel No Pain" in rule:
-                # Extract the value of the unconditional Feel No Pain
-                match = re.match(r'Feel No Pain (\d+)\+', rule)
-                if match:
-                    fnp_value = int(match.group(1))
-                    self.debug_print(f"  Target has {rule}")
-                    break
-            elif "FNP" in rule:
-                # Extract the condition and value from the rule
-                # Format is "[condition] FNP X+"
-                match = re.match(r'([^FNP]+) FNP (\d+)\+', rule)
-                if match:
-                    condition = match.group(1).strip()
-                    value = int(match.group(2))
-                    # Check if the weapon has the condition as a special rule
-                    if condition in weapon.special_rules:
-                        self.debug_print(f"  Weapon has {condition} and target has {condition} FNP {value}+")
-                        fnp_value = value
-                        break
-                    if condition == "Mortal":
-                        if "Mortal Wounds" in weapon.special_rules:
-                            self.debug_print(f"  Weapon has Mortal Wounds and target has Mortal FNP {value}+")
-                            fnp_value = value
-                            break
-        
-        # If no conditional FNP applies, use the base FNP value
-        if fnp_value is None and target.feel_no_pain is not None:
-            fnp_value = target.feel_no_pain
-        
-        # Apply FNP if we have a value
+        # Apply Melta; note that this is applied after damage reduction rules
+        damage += plan.melta_bonus
+        if profiler is not None:
+            profiler.lap("damage_reduction")
+
+        # Apply Feel No Pain if present; devastating wounds count as mortal wounds
+        fnp_value = plan.feel_no_pain_devastating if is_devastating_wound else plan.feel_no_pain
         if fnp_value is not None:
-            self.debug_print(f"  Target has Feel No Pain {fnp_value}+")
-            fnp_saves = 0
-            for _ in range(damage):
-                fnp_roll = self.roll_dice()
-                #self.debug_print(f"  Feel No Pain roll: {fnp_roll}")
-                if fnp_roll >= fnp_value:
-                    fnp_saves += 1
+            fnp_rolls = [self.roll_dice(context) for _ in range(damage)]
+            fnp_saves = sum(fnp_roll >= fnp_value for fnp_roll in fnp_rolls)
+            if self.tracer is not None:
+                self.tracer.emit("feel_no_pain", weapon=weapon.name, rolls=fnp_rolls, needed=fnp_value,
+                                 saved=fnp_saves)
             damage -= fnp_saves
-            self.debug_print(f"  Feel No Pain saved {fnp_saves} damage, reduced to {damage}")
+            result["fnp_saves"] = fnp_saves
+            if profiler is not None:
+                profiler.lap("feel_no_pain")
         
         # Handle Overkill special rule
-        if "Overkill" in weapon.special_rules:
-            self.debug_print(f"  Weapon has Overkill rule - splitting {damage} damage into {damage} instances of 1 damage")
-            # Each instance of damage is split into pieces of 1 damage so that overkill continues to kill models.
-            overkill_instances = damage
-            damage = 1
-            for _ in range(overkill_instances):
-                damage_dealt_temp = min(damage, target.current_wounds)
-                target.current_wounds -= damage_dealt_temp
-                self.debug_print(f"  Damage dealt: {damage_dealt_temp}")
-                self.debug_print(f"  Target remaining wounds: {target.current_wounds}")
-                # Reset wounds if model is destroyed
-                if target.current_wounds <= 0:
-                    target.current_wounds = target.wounds
-            damage_dealt = overkill_instances
+        if plan.overkill:
+            damage_dealt, models_destroyed = self.allocate_overkill(damage, context, target)
         else:
-            damage_dealt = min(damage, target.current_wounds)
-            target.current_wounds -= damage_dealt
-            self.debug_print(f"  Damage dealt: {damage_dealt}")
-            self.debug_print(f"  Target remaining wounds: {target.current_wounds}")
-        
-        # Reset wounds if model is destroyed
-        if target.current_wounds <= 0:
-            target.current_wounds = target.wounds
-        
-        # Remove "Mortal" from special rules if it was added from a devastating wound
-        if dev_to_mortals_dummy:
-            weapon.special_rules.remove("Mortal Wounds")
+            damage_dealt, models_destroyed = self.allocate_damage(damage, context, target)
+        if profiler is not None:
+            profiler.lap("allocate")
 
-        return {
-            "hit": True,
-            "wound": True,
-            "save": False,
-            "damage_dealt": damage_dealt,
-            "sustained_hits": sustained_hits
-        }
+        if self.tracer is not None:
+            self.tracer.emit("allocate", weapon=weapon.name, damage=damage, dealt=damage_dealt,
+                             models_destroyed=models_destroyed, wounds_left=context.current_wounds,
+                             rules=("Overkill",) if plan.overkill else ())
+        result["damage_inflicted"] = damage
+        result["damage_dealt"] = damage_dealt
+        return result
 
-    def resolve_attacks(self, weapon: Weapon, target: Model, one_use_rules: Dict[str, bool]) -> Dict[str, int]:
-        """Resolve all attacks from a weapon against a target"""
-        results = {
-            "hits": 0,
-            "wounds": 0,
-            "failed_saves": 0,
-            "damage_dealt": 0,
-            "critical_hits": 0,
-            "critical_wounds": 0,
-            "sustained_hits": 0,
-            "models_destroyed": 0
-        }
-        weapon.ap_actual = weapon.ap
-        for rule in weapon.special_rules:
-            if rule == "+1 AP":
-                self.debug_print("  Weapon has +1 AP rule - adding +1 to AP")
-                weapon.ap_actual = weapon.ap + 1
-                self.debug_print(f"  AP increased to {weapon.ap_actual}")
+    def resolve_attacks(self, weapon: Weapon, target: Union[Model, "DefenderUnit"],
+                        context: AttackContext) -> Dict[str, int]:
+        """
+        Resolve all attacks from a weapon against a target model or unit.
+
+        Neither the weapon nor the target is modified; damage carry-over between weapons and spent one-use rules are
+        tracked in the context (see make_context). Against a DefenderUnit each attack is rolled against the profile of
+        the model it is allocated to. Once every model of a DefenderUnit, or of a Model with a unit_size, is destroyed
+        the rest of the attacks are not rolled, and are counted as wasted attacks.
+        """
+        results = dict.fromkeys(RESULT_COUNTERS, 0)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        # Special rules are resolved once here rather than for every attack, and for every profile of a unit
+        defender = context.defender
+        models_before = context.model
+        if defender is None:
+            plan = self.compile_attack_plan(weapon, target, context.target_range)
+        else:
+            profile_plans = [self.compile_attack_plan(weapon, profile, context.target_range)
+                             for profile in defender.profiles]
+            profile = defender.profile_index(context.model)
+            target, plan = defender.profiles[profile], profile_plans[profile]
+        if profiler is not None:
+            profiler.lap("plan")
 
-        
         # Check if weapon is in range
-        if weapon.weapon_type.lower() == "ranged" and weapon.range < weapon.target_range:
-            self.debug_print(f"Weapon {weapon.name} is out of range ({weapon.range} < {weapon.target_range})")
+        if not plan.in_range:
+            if self.tracer is not None:
+                self.tracer.emit("out_of_range", weapon=weapon.name, range=weapon.range,
+                                 target_range=context.target_range)
             return results
 
         # Calculate number of attacks
-        num_attacks = self.roll_attacks(weapon.attacks, weapon, target)
-        self.debug_print(f"Resolving {num_attacks} attacks")
+        num_attacks = self.roll_attacks(plan.attacks, weapon, target, context, plan)
 
         # Apply Rapid Fire bonus
-        for rule in weapon.special_rules:
-            if rule.startswith("Rapid Fire ") and weapon.weapon_type.lower() == "ranged" and weapon.target_range <= weapon.range/2:
-                # Extract the bonus value from the rule
-                match = re.match(r'Rapid Fire (.+)', rule)
-                if match and match.group(1).isdigit():
-                    bonus = int(match.group(1))
-                    self.debug_print(f"  Weapon has Rapid Fire {bonus} and target is within range - adding {bonus} attacks")
-                    num_attacks += bonus
-                else:
-                    bonus = self.find_rapid_fire_bonus(match.group(1))
-                    self.debug_print(f"  Weapon has Rapid Fire {bonus} and target is within range - adding {bonus} attacks")
-                    num_attacks += bonus
-        
-        for _ in range(num_attacks):
-            attack_result = self.resolve_attack(weapon, target, one_use_rules)
-            if attack_result["hit"]:
-                results["hits"] += 1
-            if attack_result["wound"]:
-                results["wounds"] += 1
-            if not attack_result["save"]:
-                results["failed_saves"] += 1
-                results["damage_dealt"] += attack_result["damage_dealt"]
-            
+        for rapid_fire in plan.rapid_fire_bonuses:
+            num_attacks += self.find_rapid_fire_bonus(rapid_fire, context)
+        if profiler is not None:
+            profiler.lap("attacks")
+
+        self.resolve_attack_sequence(weapon, target, context, num_attacks, results, plan,
+                                     profile_plans if defender is not None else None)
+        results["wasted_damage"] = results["damage_inflicted"] - results["damage_dealt"]
+        results["models_destroyed"] = context.model - models_before
+        return results
+
+    def resolve_attack_sequence(self, weapon: Weapon, target: Model, context: AttackContext, num_attacks: int,
+                                results: Dict[str, int], plan: AttackPlan,
+                                profile_plans: Optional[List[AttackPlan]] = None):
+        """
+        Resolve num_attacks attacks one at a time, each followed by its sustained hits, adding them to the counts in
+        results; against a DefenderUnit, profile_plans has the weapon's attack plan against each of its profiles
+        """
+        defender = context.defender
+        num_models = context.num_models
+        for attack in range(num_attacks):
+            # Once every model is destroyed the rest of the attacks are not rolled
+            if num_models is not None and context.model >= num_models:
+                results["wasted_attacks"] += num_attacks - attack
+                break
+            if defender is not None:
+                profile = defender.profile_index(context.model)
+                target, plan = defender.profiles[profile], profile_plans[profile]
+            attack_result = self.resolve_attack(weapon, target, context, plan)
+            self.count_attack(results, attack_result)
+
             # Handle sustained hits
-            if "sustained_hits" in attack_result and attack_result["sustained_hits"] > 0:
+            if attack_result.get("sustained_hits", 0) > 0:
                 results["sustained_hits"] += attack_result["sustained_hits"]
                 # Resolve each sustained hit
-                for _ in range(attack_result["sustained_hits"]):
-                    sustained_attack = self.resolve_attack(weapon, target, one_use_rules)
-                    if sustained_attack["hit"]:
-                        results["hits"] += 1
-                    if sustained_attack["wound"]:
-                        results["wounds"] += 1
-                    if not sustained_attack["save"]:
-                        results["failed_saves"] += 1
-                        results["damage_dealt"] += sustained_attack["damage_dealt"]
-        
-        # Calculate models destroyed
-        results["models_destroyed"] = results["damage_dealt"] // target.wounds
-        
-        return results 
\ No newline at end of file
+                for sustained_hit in range(attack_result["sustained_hits"]):
+                    if num_models is not None and context.model >= num_models:
+                        results["wasted_attacks"] += attack_result["sustained_hits"] - sustained_hit
+                        break
+                    if defender is not None:
+                        profile = defender.profile_index(context.model)
+                        target, plan = defender.profiles[profile], profile_plans[profile]
+                    self.count_attack(results, self.resolve_attack(weapon, target, context, plan))
+
+    def count_attack(self, results: Dict[str, int], attack_result: Dict[str, bool]):
+        """Add a single attack's outcome from resolve_attack to the counts of resolve_attacks"""
+        results["attacks"] += 1
+        if not attack_result["hit"]:
+            return
+        results["hits"] += 1
+        results["critical_hits"] += attack_result["critical_hit"]
+        results["lethal_hits"] += attack_result["lethal_hit"]
+        if not attack_result["wound"]:
+            return
+        results["wounds"] += 1
+        results["critical_wounds"] += attack_result["critical_wound"]
+        results["devastating_wounds"] += attack_result["devastating_wound"]
+        if attack_result["save"]:
+            results["saves"] += 1
+            return
+        results["failed_saves"] += 1
+        results["fnp_saves"] += attack_result.get("fnp_saves", 0)
+        results["damage_inflicted"] += attack_result["damage_inflicted"]
+        results["damage_dealt"] += attack_result["damage_dealt"]
+
+    # ------------------------------------------------------------------
+    # Stage-aggregated resolution
+    #
+    # Without one-use rules every attack of a weapon is independent of the others up to damage allocation, so the
+    # number of attacks ending in each outcome can be drawn at once from its probability instead of rolling every die.
+    # ------------------------------------------------------------------
+
+    def die_pmf(self, reroll_faces: np.ndarray) -> np.ndarray:
+        """PMF of an unmodified D6 result (indexed 0-6) when the faces marked in reroll_faces are rerolled once"""
+        first_roll = np.full(7, 1 / 6)
+        first_roll[0] = 0
+        reroll_chance = first_roll[reroll_faces].sum()
+        pmf = np.where(reroll_faces, 0.0, first_roll) + reroll_chance * first_roll
+        return pmf
+
+    def hit_outcome(self, plan: AttackPlan) -> Dict[str, float]:
+        """Probabilities of a miss, a normal hit and a critical hit, matching make_hit_roll"""
+        if plan.torrent:
+            return {"miss": 0.0, "hit": 1.0, "critical": 0.0}
+
+        faces = np.arange(7)
+        if plan.hit_reroll == REROLL_FAILED:
+            reroll_faces = (faces >= 1) & (faces + plan.hit_modifier < plan.skill)
+        elif plan.hit_reroll == REROLL_ONES:
+            reroll_faces = faces == 1
+        else:
+            reroll_faces = np.zeros(7, dtype=bool)
+        pmf = self.die_pmf(reroll_faces)
+
+        critical = (faces != 1) & (faces >= plan.critical_hit_threshold)
+        hit = ~critical & (faces != 1) & (faces + plan.hit_modifier >= plan.skill)
+        return {"miss": float(pmf[~critical & ~hit].sum()), "hit": float(pmf[hit].sum()),
+                "critical": float(pmf[critical].sum())}
+
+    def wound_outcome(self, plan: AttackPlan, is_critical_hit: bool) -> Dict[str, float]:
+        """Probabilities of a failed, normal and critical wound roll, matching make_wound_roll"""
+        if is_critical_hit and plan.lethal_hits:
+            return {"fail": 0.0, "wound": 1.0, "critical": 0.0}
+        if plan.mortal:
+            return {"fail": 0.0, "wound": 0.0, "critical": 1.0}
+
+        faces = np.arange(7)
+        if plan.wound_reroll == REROLL_FAILED:
+            reroll_faces = (faces >= 1) & (faces + plan.wound_modifier < plan.wound_required)
+        elif plan.wound_reroll == REROLL_ONES:
+            reroll_faces = faces == 1
+        else:
+            reroll_faces = np.zeros(7, dtype=bool)
+        pmf = self.die_pmf(reroll_faces)
+
+        critical = (faces != 1) & (faces >= plan.critical_wound_threshold)
+        wound = ~critical & (faces != 1) & (faces + plan.wound_modifier >= plan.wound_required)
+        return {"fail": float(pmf[~critical & ~wound].sum()), "wound": float(pmf[wound].sum()),
+                "critical": float(pmf[critical].sum())}
+
+    def attack_outcome_chances(self, plan: AttackPlan) -> Tuple[np.ndarray, List[float]]:
+        """
+        Probabilities of each outcome of a single attack (see HIT_OUTCOMES and WOUND_OUTCOMES), matching
+        resolve_attack, and their running totals for drawing one outcome with a uniform; computed once per attack plan
+        """
+        cached = self._outcome_chances.get(plan)
+        if cached is not None:
+            return cached
+
+        hit = self.hit_outcome(plan)
+        # A roll of 1 always fails the save
+        save_chance = max(0, 7 - max(plan.save_threshold, 2)) / 6
+        chances = np.zeros((len(HIT_OUTCOMES), len(WOUND_OUTCOMES)))
+        chances[0, 0] = hit["miss"]
+        for row, is_critical_hit in ((1, False), (2, True)):
+            hit_chance = hit["critical" if is_critical_hit else "hit"]
+            wound = self.wound_outcome(plan, is_critical_hit)
+            chances[row, 0] = hit_chance * wound["fail"]
+            chances[row, 1] = hit_chance * wound["wound"] * save_chance
+            chances[row, 2] = hit_chance * wound["wound"] * (1 - save_chance)
+            if plan.devastating_wounds:
+                chances[row, 5] = hit_chance * wound["critical"]
+            else:
+                chances[row, 3] = hit_chance * wound["critical"] * save_chance
+                chances[row, 4] = hit_chance * wound["critical"] * (1 - save_chance)
+        chances = chances.ravel() / chances.sum()
+        # Rounding must not leave a uniform past the last possible outcome
+        cumulative = np.cumsum(chances)
+        cumulative[np.flatnonzero(chances)[-1]:] = 1.0
+        self._outcome_chances[plan] = (chances, cumulative.tolist())
+        return self._outcome_chances[plan]
+
+    def draw_outcomes(self, num_attacks: int, plan: AttackPlan, context: AttackContext,
+                      rng: np.random.Generator) -> Tuple[List[int], List[int]]:
+        """
+        Draw the outcomes of num_attacks attacks, returning how many ended in each outcome and, in a random order, the
+        outcomes of the attacks in ORDERED_OUTCOMES
+        """
+        chances, cumulative = self.attack_outcome_chances(plan)
+        counts = [0] * len(chances)
+        if num_attacks < MULTINOMIAL_ATTACKS:
+            # One uniform per attack, so the outcomes come in a random order already
+            order = []
+            for _ in range(num_attacks):
+                outcome = bisect.bisect_right(cumulative, context.random.random())
+                counts[outcome] += 1
+                if outcome in DAMAGING_OUTCOMES or outcome in CRITICAL_HIT_OUTCOMES:
+                    order.append(outcome)
+            return counts, order
+
+        counts = rng.multinomial(num_attacks, chances).tolist()
+        order = [outcome for outcome in ORDERED_OUTCOMES for _ in range(counts[outcome])]
+        context.random.shuffle(order)
+        return counts, order
+
+    def resolve_attacks_aggregated(self, weapon: Weapon, target: Union[Model, "DefenderUnit"],
+                                   context: AttackContext, rng: Optional[np.random.Generator] = None,
+                                   quantity: int = 1) -> Dict[str, int]:
+        """
+        Resolve all attacks from quantity copies of a weapon firing one after another as resolve_attacks does, with the
+        same results in distribution, but draw each attack's outcome in one go instead of rolling its hit, wound and
+        save dice, or for many attacks how many end in each outcome as one multinomial, and the Feel No Pain saves
+        against each attack as one binomial.
+
+        Only the attacks that inflict damage are then allocated one by one, as allocation depends on their order: in a
+        random order, as the attacks are interchangeable, each followed by its sustained hits. Against a Model with a
+        unit_size, only as many attacks as cannot destroy the rest of the unit are drawn at a time, and once any attack
+        could, the rest are rolled one at a time by resolve_attack_sequence. One-use rules spend dice in order and
+        against a DefenderUnit the profile rolled against changes as models are destroyed, so with either, or with
+        tracing, every die is rolled by resolve_attacks instead.
+
+        rng is the NumPy generator multinomial and binomial counts are drawn from; the engine's if not given.
+        """
+        results = dict.fromkeys(RESULT_COUNTERS, 0)
+        if context.defender is not None or self.tracer is not None or context.one_use_rules:
+            for _ in range(quantity):
+                for key, value in self.resolve_attacks(weapon, target, context).items():
+                    results[key] += value
+            return results
+        if rng is None:
+            rng = self.rng
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        plan = self.compile_attack_plan(weapon, target, context.target_range)
+        if profiler is not None:
+            profiler.lap("plan")
+        if not plan.in_range:
+            return results
+        models_before = context.model
+
+        if plan.attacks.is_fixed and not plan.rapid_fire_bonuses:
+            # Every copy makes the same number of attacks
+            num_attacks = quantity * self.roll_attacks(plan.attacks, weapon, target, context, plan)
+        else:
+            num_attacks = 0
+            for _ in range(quantity):
+                num_attacks += self.roll_attacks(plan.attacks, weapon, target, context, plan)
+                for rapid_fire in plan.rapid_fire_bonuses:
+                    num_attacks += self.find_rapid_fire_bonus(rapid_fire, context)
+        if profiler is not None:
+            profiler.lap("attacks")
+
+        remaining = num_attacks
+        while remaining:
+            drawn = remaining
+            if context.num_models is not None:
+                # No attack can be cut short by the unit being destroyed while the attacks drawn could not destroy it
+                wounds_left = (context.num_models - context.model - 1) * target.wounds + context.current_wounds
+                drawn = min(remaining, max(wounds_left - 1, 0) // self.max_attack_damage(plan))
+                if drawn == 0:
+                    self.resolve_attack_sequence(weapon, target, context, remaining, results, plan)
+                    break
+            self.resolve_drawn_attacks(weapon, target, context, rng, plan, drawn, results)
+            remaining -= drawn
+        results["lethal_hits"] = results["critical_hits"] if plan.lethal_hits else 0
+        results["wasted_damage"] = results["damage_inflicted"] - results["damage_dealt"]
+        results["models_destroyed"] = context.model - models_before
+        return results
+
+    def resolve_drawn_attacks(self, weapon: Weapon, target: Model, context: AttackContext, rng: np.random.Generator,
+                              plan: AttackPlan, num_attacks: int, results: Dict[str, int]):
+        """
+        Draw the outcomes of num_attacks attacks and their sustained hits, and allocate their damage, adding them to
+        the counts of resolve_attacks_aggregated
+        """
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        # The hit, wound and save rolls are drawn together, so they are all charged to hit
+        counts, order = self.draw_outcomes(num_attacks, plan, context, rng)
+        self.count_outcomes(results, counts)
+        results["attacks"] += num_attacks
+        damaging = []
+        sustains = plan.sustained_hits_d3 or plan.sustained_hits > 0
+        for outcome in order:
+            if outcome in DAMAGING_OUTCOMES:
+                damaging.append(outcome)
+            # Each sustained hit is a whole attack too, resolved straight after the one that generated it, whose own
+            # sustained hits are not resolved
+            if sustains and outcome in CRITICAL_HIT_OUTCOMES:
+                sustained_hits = context.random.randint(1, 3) if plan.sustained_hits_d3 else plan.sustained_hits
+                sustained_counts, sustained_order = self.draw_outcomes(sustained_hits, plan, context, rng)
+                self.count_outcomes(results, sustained_counts)
+                results["attacks"] += sustained_hits
+                results["sustained_hits"] += sustained_hits
+                damaging.extend(outcome for outcome in sustained_order if outcome in DAMAGING_OUTCOMES)
+        if profiler is not None:
+            profiler.lap("hit")
+        if not damaging:
+            return
+
+        if plan.damage.is_fixed:
+            damage = [self.reduce_damage(plan, max(0, plan.damage.bonus))] * len(damaging)
+        else:
+            damage = [self.reduce_damage(plan, self.roll_damage(plan.damage, weapon, target,
+                                                                outcome in CRITICAL_HIT_OUTCOMES, context, plan))
+                      for outcome in damaging]
+        if profiler is not None:
+            profiler.lap("damage")
+
+        # Feel No Pain saves each point of damage independently, so the number saved is binomial
+        if plan.feel_no_pain is not None or plan.feel_no_pain_devastating is not None:
+            if plan.feel_no_pain_devastating == plan.feel_no_pain:
+                fnp_chances = (7 - plan.feel_no_pain) / 6
+            else:
+                fnp_chances = [(7 - fnp_value) / 6 if fnp_value is not None else 0.0
+                               for fnp_value in (plan.feel_no_pain_devastating if outcome in DEVASTATING_OUTCOMES
+                                                 else plan.feel_no_pain for outcome in damaging)]
+            fnp_saves = rng.binomial(damage, fnp_chances).tolist()
+            damage = [attack_damage - saved for attack_damage, saved in zip(damage, fnp_saves)]
+            results["fnp_saves"] += sum(fnp_saves)
+            if profiler is not None:
+                profiler.lap("feel_no_pain")
+
+        damage_inflicted = sum(damage)
+        results["damage_inflicted"] += damage_inflicted
+        if plan.overkill:
+            # With Overkill the order does not matter, so the damage is allocated in one go
+            results["damage_dealt"] += self.allocate_overkill(damage_inflicted, context, target)[0]
+        else:
+            for attack_damage in damage:
+                results["damage_dealt"] += self.allocate_damage(attack_damage, context, target)[0]
+        if profiler is not None:
+            profiler.lap("allocate")
+
+    def reduce_damage(self, plan: AttackPlan, damage: int) -> int:
+        """An unsaved attack's damage after damage reduction and then Melta, as in resolve_attack"""
+        for rule in plan.damage_reductions:
+            if rule == "-1 Damage":
+                damage = max(1, damage - 1)
+            elif rule == "Half Damage":
+                damage = m.ceil(damage / 2)
+        return damage + plan.melta_bonus
+
+    def max_attack_damage(self, plan: AttackPlan) -> int:
+        """The most damage one attack and its sustained hits can inflict, before Feel No Pain"""
+        max_sustained_hits = 3 if plan.sustained_hits_d3 else plan.sustained_hits
+        # -1 Damage never takes an attack below 1 damage
+        return (1 + max_sustained_hits) * max(self.reduce_damage(plan, plan.damage.maximum), 1)
+
+    def count_outcomes(self, results: Dict[str, int], counts: List[int]):
+        """Add how many attacks ended in each outcome to the counts of resolve_attacks"""
+        for outcome, count in enumerate(counts):
+            if count:
+                for counter in OUTCOME_COUNTED[outcome]:
+                    results[counter] += count
+
+    # ------------------------------------------------------------------
+    # Batch resolution
+    #
+    # The methods below resolve every trial of a weapon-vs-target matchup at once with NumPy arrays instead of
+    # rolling one die at a time. They follow the same rules (and the same quirks) as the per-attack methods above,
+    # so results agree with resolve_attacks in distribution. One-use rules (Reroll 1 Hit Roll, Flip Roll to 6, etc.)
+    # are kept as a bitmask per trial, and against a Model they are spent on the first rolls they apply to (see
+    # resolve_one_use_attacks_batch); against a DefenderUnit callers fall back to resolve_attacks.
+    # ------------------------------------------------------------------
+
+    def roll_dice_batch(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """Roll an array of D6"""
+        return rng.integers(1, 7, size=size)
+
+    def roll_stage_batch(self, streams: StageStreams, stage: str, size: int, log_weight: Optional[np.ndarray] = None,
+                         used: Optional[np.ndarray] = None, scores: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Roll an array of D6 for one stage of an attack.
+
+        With tilted streams (see importance_sampling), the dice are tilted by the scores of their faces (how much each
+        face favours the attacker, indexed by face) and the log likelihood ratio of each die is added to log_weight
+        where used is set; dice that turn out not to matter, such as the wound roll of a miss, are left out.
+        """
+        if log_weight is None:
+            return self.roll_dice_batch(getattr(streams, stage), size)
+        rolls, log_ratio = streams.roll_d6(stage, size, scores)
+        log_weight += log_ratio if used is None else np.where(used, log_ratio, 0.0)
+        return rolls
+
+    def roll_attacks_batch(self, plan: AttackPlan, rng: np.random.Generator, size: int,
+                           streams: Optional[TiltedStreams] = None,
+                           log_weight: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Calculate an array of attack counts, including Blast and Rapid Fire, from an attack plan.
+
+        With tilted streams the base attacks are drawn from them instead and their log likelihood ratios are added to
+        log_weight.
+        """
+        if streams is None:
+            base_attacks = plan.attacks.sample(rng, size)
+        else:
+            base_attacks, log_ratio = streams.sample_values("attacks", plan.attacks.pmf(), size)
+            log_weight += log_ratio
+
+        # Apply Blast rule if present
+        base_attacks += plan.blast_bonus
+
+        # Apply Rapid Fire bonus
+        for bonus in plan.rapid_fire_bonuses:
+            base_attacks += bonus.sample(rng, size)
+
+        return base_attacks
+
+    def spend_one_use_rolls_batch(self, rng: np.random.Generator, unmodified_rolls: np.ndarray, modifier: int,
+                                  required: int, rerolled: Optional[np.ndarray],
+                                  reroll_rules: Tuple[Tuple[int, str], ...], flip_rules: Tuple[Tuple[int, str], ...],
+                                  one_use: np.ndarray, rolled: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Spend one-use rerolls and flips on an array of hit or wound rolls, each from a different trial, as make_hit_roll
+        and make_wound_roll do: a reroll on a failed roll the weapon's own rerolls left alone, then a flip to 6 on a roll
+        still failed. Only rolls that were made (rolled) spend anything.
+
+        Returns the unmodified rolls, flipped ones as 6, and the modified rolls, which like the per-attack engine's do
+        not count a flip.
+        """
+        rolls = unmodified_rolls + modifier
+        if reroll_rules:
+            failed = rolled & (rolls < required)
+            if rerolled is not None:
+                failed &= ~rerolled
+            spent = spend_one_use_batch(one_use, reroll_rules, failed)
+            unmodified_rolls = np.where(spent, self.roll_dice_batch(rng, len(rolls)), unmodified_rolls)
+            rolls = unmodified_rolls + modifier
+        flipped = spend_one_use_batch(one_use, flip_rules, rolled & (rolls < required))
+        return np.where(flipped, 6, unmodified_rolls), rolls
+
+    def roll_damage_one_use_batch(self, plan: AttackPlan, rng: np.random.Generator, critical_hit: np.ndarray,
+                                  unsaved: np.ndarray, one_use: np.ndarray) -> np.ndarray:
+        """
+        Roll an array of damage values, each from a different trial, spending one-use rerolls and flips on the damage
+        rolls of unsaved attacks as roll_damage does
+        """
+        size = len(critical_hit)
+        damage = np.zeros(size, dtype=np.int64)
+        if plan.damage.critical is None:
+            selections = ((plan.damage, np.ones(size, dtype=bool)),)
+        else:
+            selections = ((plan.damage, ~critical_hit), (plan.damage.critical, critical_hit))
+        for expr, selected in selections:
+            if expr.dice == 0:
+                damage[selected] = max(0, expr.bonus)
+                continue
+            rolls = rng.integers(1, expr.sides + 1, size=(size, expr.dice))
+            rerolls = rng.integers(1, expr.sides + 1, size=(size, expr.dice))
+            below_average = rolls.sum(axis=1) * 2 < expr.dice * (expr.sides + 1)
+            if plan.damage_reroll == REROLL_FAILED:
+                rerolled = below_average
+            elif plan.damage_reroll == REROLL_ONES:
+                rerolled = (rolls == 1).any(axis=1)
+            else:
+                rerolled = np.zeros(size, dtype=bool)
+            rerolled = rerolled | spend_one_use_batch(one_use, DAMAGE_REROLL_RULES,
+                                                      selected & unsaved & ~rerolled & below_average)
+            rolls = np.where(rerolled[:, np.newaxis], rerolls, rolls)
+            # Flip a failed single D6 damage roll to a 6
+            if expr.dice == 1 and expr.sides == 6:
+                flipped = spend_one_use_batch(one_use, DAMAGE_FLIP_RULES, selected & unsaved & (rolls[:, 0] < 4))
+                rolls = np.where(flipped[:, np.newaxis], 6, rolls)
+            damage = np.where(selected, np.maximum(0, rolls.sum(axis=1) + expr.bonus), damage)
+        return damage
+
+    def resolve_attack_batch(self, plan: AttackPlan, size: int, streams: StageStreams,
+                             profile_plans: Optional[Sequence[AttackPlan]] = None,
+                             one_use: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        Resolve an array of independent single attacks from an attack plan, up to damage allocation.
+
+        With tilted streams the result also has the log likelihood ratio of each attack's dice, as log_weight. With
+        profile_plans, the plans against each profile of a DefenderUnit, the dice are rolled once and the outcomes from
+        the wound roll on (PROFILE_OUTCOMES) are worked out against every profile, with a leading axis by profile.
+
+        With one_use, the one-use rules mask of each attack's trial, every attack is from a different trial and spends
+        one-use rules as resolve_attack does, clearing their bits in one_use. This needs a single profile and untilted
+        streams.
+        """
+        log_weight = np.zeros(size) if isinstance(streams, TiltedStreams) else None
+        faces = np.arange(7)
+        plans = (plan,) if profile_plans is None else tuple(profile_plans)
+        if log_weight is not None and len(plans) > 1:
+            raise ValueError("Tilted streams need a target with a single profile")
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+
+        # Step 1: Hit Roll
+        if plan.torrent:
+            hit = np.ones(size, dtype=bool)
+            critical_hit = np.zeros(size, dtype=bool)
+        else:
+            scores = None
+            if log_weight is not None:
+                # Score each face: 1 for a hit, 2 for a critical hit that triggers a rule
+                critical_faces = (faces != 1) & (faces >= plan.critical_hit_threshold)
+                hit_faces = critical_faces | ((faces != 1) & (faces + plan.hit_modifier >= plan.skill))
+                scores = hit_faces.astype(np.int64) + critical_faces * int(plan.sustained_hits_d3 or plan.lethal_hits
+                                                                           or plan.sustained_hits > 0)
+            unmodified_rolls = self.roll_stage_batch(streams, "hit", size, log_weight, scores=scores)
+            if plan.hit_reroll == REROLL_FAILED:
+                reroll_mask = unmodified_rolls + plan.hit_modifier < plan.skill
+            elif plan.hit_reroll == REROLL_ONES:
+                reroll_mask = unmodified_rolls == 1
+            else:
+                reroll_mask = None
+            if reroll_mask is not None:
+                # Every die gets a reroll die, used or not, so later dice do not shift with the number of rerolls
+                rerolls = self.roll_stage_batch(streams, "hit_reroll", size, log_weight, reroll_mask, scores)
+                unmodified_rolls = np.where(reroll_mask, rerolls, unmodified_rolls)
+            rolls = unmodified_rolls + plan.hit_modifier
+            if one_use is not None:
+                unmodified_rolls, rolls = self.spend_one_use_rolls_batch(
+                    streams.hit_reroll, unmodified_rolls, plan.hit_modifier, plan.skill, reroll_mask,
+                    HIT_REROLL_RULES if plan.hit_reroll != REROLL_FAILED else (), HIT_FLIP_RULES, one_use,
+                    np.ones(size, dtype=bool))
+            not_one = unmodified_rolls != 1
+            critical_hit = not_one & (unmodified_rolls >= plan.critical_hit_threshold)
+            hit = critical_hit | (not_one & (rolls >= plan.skill))
+
+        # Check for Sustained Hits
+        if plan.sustained_hits_d3:
+            sustained_hits = np.where(critical_hit, streams.sustained_hits.integers(1, 4, size=size), 0)
+        else:
+            sustained_hits = np.where(critical_hit, plan.sustained_hits, 0)
+        if profiler is not None:
+            profiler.lap("hit")
+
+        # Step 2: Wound Roll, against every profile at once: the thresholds are columns, so the outcomes have a row per
+        # profile
+        if plan.mortal:
+            wound = np.repeat(hit[np.newaxis], len(plans), axis=0)
+            critical_wound = wound.copy()
+        else:
+            wound_required = profile_column(plans, "wound_required")
+            wound_modifier = profile_column(plans, "wound_modifier")
+            scores = None
+            if log_weight is not None:
+                # Score each face: 1 for a wound, 2 for a devastating wound
+                critical_faces = (faces != 1) & (faces >= plan.critical_wound_threshold)
+                wound_faces = critical_faces | ((faces != 1) & (faces + plan.wound_modifier >= plan.wound_required))
+                scores = wound_faces.astype(np.int64) + critical_faces * int(plan.devastating_wounds)
+            unmodified_rolls = self.roll_stage_batch(streams, "wound", size, log_weight, hit, scores)
+            if plan.wound_reroll == REROLL_FAILED:
+                reroll_mask = unmodified_rolls + wound_modifier < wound_required
+            elif plan.wound_reroll == REROLL_ONES:
+                reroll_mask = np.broadcast_to(unmodified_rolls == 1, (len(plans), size))
+            else:
+                reroll_mask = None
+            if reroll_mask is not None:
+                # Tilted streams only come with a single profile, so its row decides which rerolls are used
+                rerolls = self.roll_stage_batch(streams, "wound_reroll", size, log_weight, hit & reroll_mask[0], scores)
+                unmodified_rolls = np.where(reroll_mask, rerolls, unmodified_rolls)
+            rolls = unmodified_rolls + wound_modifier
+            if one_use is not None:
+                # Critical hits with Lethal Hits make no wound roll to spend rules on
+                rolled = hit & ~critical_hit if plan.lethal_hits else hit
+                unmodified_rolls, rolls = self.spend_one_use_rolls_batch(
+                    streams.wound_reroll, np.broadcast_to(unmodified_rolls, (1, size))[0], plan.wound_modifier,
+                    plan.wound_required, None if reroll_mask is None else reroll_mask[0],
+                    WOUND_REROLL_RULES if plan.wound_reroll != REROLL_FAILED else (), WOUND_FLIP_RULES, one_use, rolled)
+            not_one = unmodified_rolls != 1
+            critical_wound = hit & not_one & (unmodified_rolls >= profile_column(plans, "critical_wound_threshold"))
+            wound = critical_wound | (hit & not_one & (rolls >= wound_required))
+
+        # Lethal Hits automatically wound (without a critical wound) on critical hits
+        if plan.lethal_hits:
+            wound = wound | critical_hit
+            critical_wound = critical_wound & ~critical_hit
+        if profiler is not None:
+            profiler.lap("wound")
+
+        # Step 3: Save Roll
+        devastating_wound = critical_wound & profile_column(plans, "devastating_wounds")
+        # Score each face 1 for a failed save
+        scores = ((faces == 1) | (faces < plan.save_threshold)).astype(np.int64) if log_weight is not None else None
+        save_rolls = self.roll_stage_batch(streams, "save", size, log_weight, (wound & ~devastating_wound)[0], scores)
+        saved = (wound & ~devastating_wound & (save_rolls != 1)
+                 & (save_rolls >= profile_column(plans, "save_threshold")))
+        unsaved = wound & ~saved
+        if profiler is not None:
+            profiler.lap("save")
+
+        # Step 4: Inflict Damage
+        if one_use is not None:
+            damage = self.roll_damage_one_use_batch(plan, streams.damage, critical_hit, unsaved[0], one_use)
+        elif log_weight is None:
+            damage = plan.damage.sample(streams.damage, size, plan.damage_reroll, critical_hit)
+        else:
+            damage, log_ratio = streams.sample_values("damage", plan.damage.pmf(plan.damage_reroll), size)
+            if plan.damage.critical is not None:
+                critical_damage, critical_log_ratio = streams.sample_values(
+                    "damage", plan.damage.pmf(plan.damage_reroll, True), size)
+                damage = np.where(critical_hit, critical_damage, damage)
+                log_ratio = np.where(critical_hit, critical_log_ratio, log_ratio)
+            log_weight += np.where(unsaved[0], log_ratio, 0.0)
+        if profiler is not None:
+            profiler.lap("damage")
+        for rule in plan.damage_reductions:
+            if rule == "-1 Damage":
+                damage = np.maximum(1, damage - 1)
+            elif rule == "Half Damage":
+                damage = (damage + 1) // 2
+        damage = damage + plan.melta_bonus
+        if profiler is not None:
+            profiler.lap("damage_reduction")
+
+        # Feel No Pain saves each point of damage independently, so the number saved is binomial
+        fnp_saves = 0
+        if any(p.feel_no_pain is not None or p.feel_no_pain_devastating is not None for p in plans):
+            fnp_chance = np.where(devastating_wound,
+                                  np.array([[0.0 if p.feel_no_pain_devastating is None
+                                             else (7 - p.feel_no_pain_devastating) / 6] for p in plans]),
+                                  np.array([[0.0 if p.feel_no_pain is None else (7 - p.feel_no_pain) / 6]
+                                            for p in plans]))
+            if log_weight is None:
+                # Only unsaved attacks that can be saved are drawn for, as drawing the rest costs as much
+                rolled = np.flatnonzero(unsaved & (damage > 0) & (fnp_chance > 0))
+                fnp_saves = np.zeros(unsaved.shape, dtype=np.int64)
+                fnp_saves.ravel()[rolled] = streams.feel_no_pain.binomial(damage[rolled % size],
+                                                                          fnp_chance.ravel()[rolled])
+            else:
+                fnp_saves, log_ratio = streams.binomial("feel_no_pain", damage, fnp_chance[0])
+                log_weight += np.where(unsaved[0], log_ratio, 0.0)
+            damage = damage - fnp_saves
+            if profiler is not None:
+                profiler.lap("feel_no_pain")
+
+        results = {
+            "hit": hit,
+            "critical_hit": critical_hit,
+            "lethal_hit": critical_hit & plan.lethal_hits,
+            "wound": wound,
+            "critical_wound": critical_wound,
+            "devastating_wound": wound & devastating_wound,
+            "saved": saved,
+            "failed_save": unsaved,
+            "fnp_saves": np.where(unsaved, fnp_saves, 0),
+            "damage": np.where(unsaved, damage, 0),
+            "sustained_hits": np.where(hit, sustained_hits, 0)
+        }
+        if profile_plans is None:
+            for key in PROFILE_OUTCOMES:
+                results[key] = results[key][0]
+        if log_weight is not None:
+            results["log_weight"] = log_weight
+        return results
+
+    def allocate_damage_batch(self, damage: np.ndarray, trial_ids: np.ndarray, target: Model,
+                              current_wounds: np.ndarray, models: np.ndarray,
+                              overkill: bool) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Allocate ordered per-attack damage to each trial's target, updating current_wounds and models (the models
+        destroyed so far) in place.
+
+        The attacks of each trial are contiguous and in order. Returns the damage dealt per trial and the model each
+        attack was allocated to, which is the target's unit_size for attacks made after the unit was destroyed, or None
+        if no trial's unit was destroyed.
+        """
+        n_trials = len(current_wounds)
+        wounds = target.wounds
+        num_models = target.unit_size
+        if num_models is None:
+            # An endless line of models: each point of damage destroys at most one, so this many are never reached
+            num_models = int(models.max(initial=0)) + int(damage.sum()) + 1
+        counts = np.bincount(trial_ids, minlength=n_trials)
+        starts = np.cumsum(counts) - counts
+        if overkill or wounds == 1 or damage.max(initial=0) <= 1:
+            # Damage spills over from model to model (with 1 wound per model only whether an attack deals damage
+            # matters, and attacks of 1 damage never lose any), so only the wounds taken from the unit need tracking
+            if not overkill:
+                damage = np.minimum(damage, 1)
+            taken = np.minimum(models + 1, num_models) * wounds - current_wounds
+            # Nothing is left to allocate to once every model is destroyed
+            total = np.minimum(taken + np.bincount(trial_ids, weights=damage, minlength=n_trials).astype(np.int64),
+                               num_models * wounds)
+            models[:] = total // wounds
+            current_wounds[:] = np.where(models < num_models, (models + 1) * wounds - total, 0)
+            if not np.any(models >= num_models):
+                return total - taken, None
+            before = np.cumsum(damage) - damage
+            taken_before = taken[trial_ids] + before - before[starts[trial_ids]]
+            return total - taken, np.minimum(taken_before // wounds, num_models)
+
+        # Only attacks that deal damage change the allocation state; pack them into a (trial, order) matrix
+        dealing = np.flatnonzero(damage > 0)
+        dealing_trial_ids = trial_ids[dealing]
+        dealing_counts = np.bincount(dealing_trial_ids, minlength=n_trials)
+        columns = np.arange(len(dealing)) - (np.cumsum(dealing_counts) - dealing_counts)[dealing_trial_ids]
+        damage_matrix = np.zeros((n_trials, dealing_counts.max(initial=0)), dtype=np.int64)
+        damage_matrix[dealing_trial_ids, columns] = damage[dealing]
+        destroyed_matrix = np.zeros(damage_matrix.shape, dtype=np.int64)
+
+        damage_dealt = np.zeros(n_trials, dtype=np.int64)
+        models_before = models.copy()
+        for column, column_damage in enumerate(damage_matrix.T):
+            dealt = np.minimum(column_damage, current_wounds)
+            current_wounds -= dealt
+            destroyed = (dealt > 0) & (current_wounds == 0)
+            models += destroyed
+            # A fresh model takes over from a destroyed one, unless it was the last
+            current_wounds[destroyed & (models < num_models)] = wounds
+            destroyed_matrix[:, column] = destroyed
+            damage_dealt += dealt
+
+        if not np.any(models >= num_models):
+            return damage_dealt, None
+        # Each attack is allocated to the model left after the models destroyed by the attacks before it
+        destroyed = np.zeros(len(damage), dtype=np.int64)
+        destroyed[dealing] = destroyed_matrix[dealing_trial_ids, columns]
+        before = np.cumsum(destroyed) - destroyed
+        allocated = models_before[trial_ids] + before - before[starts[trial_ids]]
+        return damage_dealt, allocated
+
+    def allocate_damage_unit_batch(self, damage: np.ndarray, trial_ids: np.ndarray, defender: "DefenderUnit",
+                                   current_wounds: np.ndarray, models: np.ndarray,
+                                   overkill: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Allocate ordered per-attack damage to each trial's DefenderUnit model by model, updating current_wounds and
+        models (the index of the model being allocated to) in place.
+
+        damage has a row per profile (see resolve_attack_batch), and each attack deals the damage of the profile of
+        the model it is allocated to. Returns the damage dealt per trial and the model each attack was allocated to,
+        which is num_models for attacks made after the unit was destroyed.
+        """
+        n_trials = len(current_wounds)
+        damage_dealt = np.zeros(n_trials, dtype=np.int64)
+        allocated = np.zeros(len(trial_ids), dtype=np.int64)
+        # The attacks of each trial are contiguous and in order, so the k-th attack of every trial is one column
+        counts = np.bincount(trial_ids, minlength=n_trials)
+        starts = np.cumsum(counts) - counts
+        last_model = defender.num_models - 1
+        for column in range(counts.max(initial=0)):
+            active = np.flatnonzero(counts > column)
+            attack = starts[active] + column
+            model = models[active]
+            profile = defender.profile[np.minimum(model, last_model)]
+            allocated[attack] = model
+            # Nothing is left to allocate to once every model is destroyed
+            attack_damage = np.where(model <= last_model, damage[profile, attack], 0)
+            if overkill:
+                # Damage spills over onto the next models, so only the wounds taken from the unit need tracking
+                taken = defender.cumulative_wounds[np.minimum(model + 1, last_model + 1)] - current_wounds[active]
+                dealt = np.minimum(attack_damage, defender.total_wounds - taken)
+                model = np.searchsorted(defender.cumulative_wounds, taken + dealt, side='right') - 1
+                wounds_left = defender.cumulative_wounds[np.minimum(model + 1, last_model + 1)] - (taken + dealt)
+            else:
+                dealt = np.minimum(attack_damage, current_wounds[active])
+                wounds_left = current_wounds[active] - dealt
+                destroyed = (dealt > 0) & (wounds_left == 0)
+                model = model + destroyed
+                wounds_left = np.where(destroyed, defender.wounds[np.minimum(model, last_model)], wounds_left)
+            # A destroyed unit has no wounds left to take
+            models[active] = model
+            current_wounds[active] = np.where(model <= last_model, wounds_left, 0)
+            damage_dealt[active] += dealt
+        return damage_dealt, allocated
+
+    def resolve_one_use_attacks_batch(self, plan: AttackPlan, num_attacks: np.ndarray, streams: StageStreams,
+                                      one_use: np.ndarray) -> Tuple[Dict[str, np.ndarray], np.ndarray,
+                                                                    Dict[str, np.ndarray], np.ndarray,
+                                                                    np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Resolve each trial's attacks against a Model, spending its one-use rules (one_use, updated in place) on the
+        first rolls they apply to, as resolve_attacks does.
+
+        Rules are spent in resolution order, so while a trial still has rules the plan can spend its attacks are resolved
+        one at a time: the k-th attack of every such trial at once, with any sustained hits it makes next. Trials soon
+        spend their rules or run out of attacks, and the rest of their attacks are resolved at once as usual.
+
+        Returns the attacks that can make sustained hits and the sustained hits resolved at once, each with their trial
+        ids, followed by the trial ids and damage of all of them in resolution order, and the positions in that order
+        of the attacks and of the sustained hits.
+        """
+        n_trials = len(num_attacks)
+        spendable = spendable_one_use(plan)
+        remaining = num_attacks.copy()
+        # Sustained hits made but not resolved yet, and how many attacks of each trial have been resolved
+        pending = np.zeros(n_trials, dtype=np.int64)
+        resolved = np.zeros(n_trials, dtype=np.int64)
+        column_trial_ids, column_order, column_attacks = [], [], []
+        active = np.flatnonzero(((one_use & spendable) != 0) & (remaining > 0))
+        while len(active):
+            masks = one_use[active]
+            attack = self.resolve_attack_batch(plan, len(active), streams, one_use=masks)
+            one_use[active] = masks
+            # Pending sustained hits come before the next attack, and make no sustained hits of their own
+            sustained = pending[active] > 0
+            attack["sustained_hits"] = np.where(sustained, 0, attack["sustained_hits"])
+            pending[active] += attack["sustained_hits"] - sustained
+            remaining[active] -= ~sustained
+            column_trial_ids.append(active)
+            column_order.append(resolved[active])
+            column_attacks.append(attack)
+            resolved[active] += 1
+            active = active[((one_use[active] & spendable) != 0) & ((remaining[active] > 0) | (pending[active] > 0))]
+
+        trial_ids = np.repeat(np.arange(n_trials), remaining)
+        attacks = self.resolve_attack_batch(plan, len(trial_ids), streams)
+        sustained_hits = attacks["sustained_hits"]
+        # Sustained hits still pending come before the rest of the attacks and their own sustained hits
+        pending_trial_ids = np.repeat(np.arange(n_trials), pending)
+        sustained_trial_ids = np.concatenate([pending_trial_ids, np.repeat(trial_ids, sustained_hits)])
+        sustained_attacks = self.resolve_attack_batch(plan, len(sustained_trial_ids), streams)
+
+        # Order each trial's attacks by their position in it: first the ones resolved one at a time, then the pending
+        # sustained hits, then the rest in resolution order (positions from resolution_order only grow within a trial)
+        pending_order = (resolved[pending_trial_ids] + np.arange(len(pending_trial_ids))
+                         - (np.cumsum(pending) - pending)[pending_trial_ids])
+        attack_positions, sustained_positions = resolution_order(sustained_hits)
+        rest_start = resolved + pending
+        order = np.concatenate(column_order + [rest_start[trial_ids] + attack_positions, pending_order,
+                                               rest_start[sustained_trial_ids[len(pending_trial_ids):]]
+                                               + sustained_positions])
+        all_trial_ids = np.concatenate(column_trial_ids + [trial_ids, sustained_trial_ids])
+        damage = np.concatenate([attack["damage"] for attack in column_attacks]
+                                + [attacks["damage"], sustained_attacks["damage"]])
+        resolution = np.lexsort((order, all_trial_ids))
+        positions = np.empty(len(resolution), dtype=np.int64)
+        positions[resolution] = np.arange(len(resolution))
+
+        attacks = {key: np.concatenate([attack[key] for attack in column_attacks] + [value])
+                   for key, value in attacks.items()}
+        trial_ids = np.concatenate(column_trial_ids + [trial_ids])
+        return (attacks, trial_ids, sustained_attacks, sustained_trial_ids, all_trial_ids[resolution],
+                damage[resolution], positions[:len(trial_ids)], positions[len(trial_ids):])
+
+    def resolve_attacks_batch(self, weapon: Weapon, target: Union[Model, "DefenderUnit"], n_trials: int,
+                              rng: Optional[Union[np.random.Generator, StageStreams]] = None,
+                              current_wounds: Optional[np.ndarray] = None,
+                              quantity: int = 1,
+                              target_range: Optional[int] = None,
+                              models: Optional[np.ndarray] = None,
+                              one_use: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        Resolve all attacks from a weapon against a target for n_trials independent trials at once.
+
+        Args:
+            weapon: The attacking weapon
+            target: The defending model, or a DefenderUnit (see defender_unit)
+            n_trials: Number of trials to resolve
+            rng: NumPy random generator, or streams already split from one (which several calls can share, e.g.
+                for each weapon of a unit in turn); the engine's generator is used if not given. With tilted streams
+                (see importance_sampling) the results include each trial's log likelihood ratio, as log_weight.
+            current_wounds: Per-trial wounds remaining on the current model, updated in place; lets several
+                weapons in one trial share damage carry-over. Starts at full wounds if not given.
+            quantity: Number of copies of the weapon firing one after another; equivalent to calling this
+                quantity times in a row with the same current_wounds, but rolled in one go.
+            target_range: Distance to the target in inches; defaults to the weapon's target_range
+            models: Per-trial index of the model being allocated to, which is also the number of models destroyed,
+                updated in place alongside current_wounds (see DefenderState). Starts at the first model if not given.
+            one_use: Per-trial one-use rules not yet spent, as bitmasks of ONE_USE_BITS, updated in place as they are
+                spent; none are used if not given. Only a Model target with untilted streams can have any.
+
+        Returns:
+            Dictionary of per-trial arrays with the same keys as resolve_attacks (see RESULT_COUNTERS), plus
+            current_wounds. As with resolve_attacks, attacks after a DefenderUnit, or a Model with a unit_size, is
+            destroyed count only as wasted attacks.
+        """
+        if rng is None:
+            rng = self.rng
+        streams = rng if isinstance(rng, StageStreams) else StageStreams(rng)
+        defender = None if isinstance(target, Model) else target
+        if current_wounds is None:
+            current_wounds = np.full(n_trials, target.wounds if defender is None else defender.wounds[0],
+                                     dtype=np.int64)
+        if models is None:
+            models = np.zeros(n_trials, dtype=np.int64)
+        num_models = unit_models(target)
+
+        results = {key: np.zeros(n_trials, dtype=np.int64) for key in RESULT_COUNTERS}
+        results["current_wounds"] = current_wounds
+        tilted = isinstance(streams, TiltedStreams)
+        if tilted:
+            results["log_weight"] = np.zeros(n_trials)
+
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        # Check if weapon is in range
+        if defender is None:
+            profile_plans = None
+            plan = self.compile_attack_plan(weapon, target, target_range)
+        else:
+            profile_plans = [self.compile_attack_plan(weapon, profile, target_range) for profile in defender.profiles]
+            plan = profile_plans[0]
+        if profiler is not None:
+            profiler.lap("plan")
+        if not plan.in_range:
+            return results
+        spends_one_use = one_use is not None and bool(np.any(one_use & spendable_one_use(plan)))
+        if spends_one_use and (defender is not None or tilted):
+            raise ValueError("One-use rules need a Model target and untilted streams")
+
+        # Calculate number of attacks and resolve them all at once
+        if tilted:
+            attacks_log_weight = np.zeros(n_trials * quantity)
+            num_attacks = self.roll_attacks_batch(plan, streams.attacks, n_trials * quantity, streams,
+                                                  attacks_log_weight)
+            results["log_weight"] += attacks_log_weight.reshape(n_trials, quantity).sum(axis=1)
+        else:
+            num_attacks = self.roll_attacks_batch(plan, streams.attacks, n_trials * quantity)
+        num_attacks = num_attacks.reshape(n_trials, quantity).sum(axis=1)
+        if num_models is not None:
+            # Trials whose target is already destroyed roll nothing further
+            destroyed = models >= num_models
+            results["wasted_attacks"] += np.where(destroyed, num_attacks, 0)
+            num_attacks = np.where(destroyed, 0, num_attacks)
+        if profiler is not None:
+            profiler.lap("attacks")
+        if spends_one_use:
+            (attacks, trial_ids, sustained_attacks, sustained_trial_ids, ordered_trial_ids, ordered_damage,
+             attack_positions, sustained_positions) = self.resolve_one_use_attacks_batch(plan, num_attacks, streams,
+                                                                                          one_use)
+            sustained_hits = attacks["sustained_hits"]
+            if profiler is not None:
+                profiler.start()
+        else:
+            trial_ids = np.repeat(np.arange(n_trials), num_attacks)
+            attacks = self.resolve_attack_batch(plan, len(trial_ids), streams, profile_plans)
+
+            # Each sustained hit is resolved as an extra attack straight after the attack that generated it
+            sustained_hits = attacks["sustained_hits"]
+            sustained_trial_ids = np.repeat(trial_ids, sustained_hits)
+            sustained_attacks = self.resolve_attack_batch(plan, len(sustained_trial_ids), streams, profile_plans)
+
+            # Interleave the attacks in resolution order: each attack followed by its sustained hits
+            if profiler is not None:
+                profiler.start()
+            attack_positions, sustained_positions = resolution_order(sustained_hits)
+            ordered_trial_ids = np.empty(len(trial_ids) + len(sustained_trial_ids), dtype=np.int64)
+            ordered_trial_ids[attack_positions] = trial_ids
+            ordered_trial_ids[sustained_positions] = sustained_trial_ids
+            # Against a unit the damage has a row per profile
+            ordered_damage = np.empty(attacks["damage"].shape[:-1] + ordered_trial_ids.shape, dtype=np.int64)
+            ordered_damage[..., attack_positions] = attacks["damage"]
+            ordered_damage[..., sustained_positions] = sustained_attacks["damage"]
+
+        models_before = models.copy()
+        if defender is None:
+            results["damage_dealt"], allocated = self.allocate_damage_batch(
+                ordered_damage, ordered_trial_ids, target, current_wounds, models, plan.overkill)
+        else:
+            results["damage_dealt"], allocated = self.allocate_damage_unit_batch(
+                ordered_damage, ordered_trial_ids, defender, current_wounds, models, plan.overkill)
+            ordered_profiles = defender.profile[np.minimum(allocated, defender.num_models - 1)]
+            # Keep only the outcomes against the profile each attack was allocated to
+            for resolved, positions in ((attacks, attack_positions), (sustained_attacks, sustained_positions)):
+                for key in PROFILE_OUTCOMES:
+                    resolved[key] = resolved[key][ordered_profiles[positions], np.arange(len(positions))]
+            ordered_damage = ordered_damage[ordered_profiles, np.arange(len(ordered_trial_ids))]
+        models_destroyed = models - models_before
+
+        # Attacks after the target was destroyed are dropped from every count, as if never rolled. A sustained hit of
+        # a dropped attack never existed (every one is dropped too, coming later); one of a resolved attack is a wasted
+        # attack like the dropped attacks.
+        unresolved = 0
+        wasted = None if allocated is None else allocated >= num_models
+        if wasted is not None and wasted.any():
+            ordered_damage = np.where(wasted, 0, ordered_damage)
+            attack_wasted = wasted[attack_positions]
+            sustained_wasted = wasted[sustained_positions]
+            unresolved = (np.bincount(trial_ids[attack_wasted], minlength=n_trials)
+                          + np.bincount(sustained_trial_ids[sustained_wasted], minlength=n_trials)
+                          - np.bincount(trial_ids[attack_wasted], weights=sustained_hits[attack_wasted],
+                                        minlength=n_trials).astype(np.int64))
+            results["wasted_attacks"] += unresolved
+            for resolved, kept in ((attacks, ~attack_wasted), (sustained_attacks, ~sustained_wasted)):
+                for stage in ("hit", "wound", "failed_save", "critical_hit", "critical_wound", "lethal_hit",
+                              "devastating_wound", "saved"):
+                    resolved[stage] = resolved[stage] & kept
+                resolved["fnp_saves"] = np.where(kept, resolved["fnp_saves"], 0)
+            sustained_hits = np.where(attack_wasted, 0, sustained_hits)
+        if profiler is not None:
+            profiler.lap("allocate")
+
+        for key, stage in (("hits", "hit"), ("wounds", "wound"), ("failed_saves", "failed_save"),
+                           ("critical_hits", "critical_hit"), ("critical_wounds", "critical_wound"),
+                           ("lethal_hits", "lethal_hit"), ("devastating_wounds", "devastating_wound"),
+                           ("saves", "saved")):
+            results[key] += np.bincount(trial_ids[attacks[stage]], minlength=n_trials)
+            results[key] += np.bincount(sustained_trial_ids[sustained_attacks[stage]], minlength=n_trials)
+        results["sustained_hits"] += np.bincount(trial_ids, weights=sustained_hits, minlength=n_trials).astype(np.int64)
+        results["attacks"] += num_attacks + results["sustained_hits"] - unresolved
+        results["fnp_saves"] += np.bincount(trial_ids, weights=attacks["fnp_saves"], minlength=n_trials).astype(np.int64)
+        results["fnp_saves"] += np.bincount(sustained_trial_ids, weights=sustained_attacks["fnp_saves"],
+                                            minlength=n_trials).astype(np.int64)
+        if tilted:
+            results["log_weight"] += np.bincount(trial_ids, weights=attacks["log_weight"], minlength=n_trials)
+            results["log_weight"] += np.bincount(sustained_trial_ids, weights=sustained_attacks["log_weight"],
+                                                 minlength=n_trials)
+
+        results["damage_inflicted"] = np.bincount(ordered_trial_ids, weights=ordered_damage,
+                                                  minlength=n_trials).astype(np.int64)
+        results["wasted_damage"] = results["damage_inflicted"] - results["damage_dealt"]
+        results["models_destroyed"] = models_destroyed
+        return results
@@ -1,12 +1,11 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import json
 import os
 from typing import Dict, List
 from combat_engine import CombatEngine, Model, Weapon
 from unit_combat_simulator import UnitCombatSimulator
 from attacker_special_rules import SPECIAL_RULES
-from pathlib import Path
+from faction_catalog import get_catalog
 
 class CombatSimulatorGUI:
     def __init__(self, root):
@@ -18,7 +17,7 @@ class CombatSimulatorGUI:
         
         # Initialize combat engine and simulator
         self.combat_engine = CombatEngine()
-        self.simulator = UnitCombatSimulator(num_simulations=1000, debug=False)
+        self.simulator = UnitCombatSimulator(num_simulations=1000, debug=False, batch=True)
         
         # Load faction data
         self.faction_data = self.load_faction_data()
@@ -121,21 +120,8 @@ Please report any bugs to Andrew White."""
         )
         
     def load_faction_data(self) -> Dict[str, Dict]:
-        """Load all faction data from JSON files"""
-        faction_data = {}
-        # Use Path to handle paths in a cross-platform way
-        # Go up two levels from the current file to reach project root
-        data_dir = Path(__file__).parent.parent.parent / "data" / "json"
-        
-        # Ensure the directory exists
-        if not data_dir.exists():
-            raise FileNotFoundError(f"Data directory not found at {data_dir}")
-            
-        for json_file in data_dir.glob("*.json"):
-            faction_name = json_file.stem  # Get filename without extension
-            with open(json_file, 'r') as f:
-                faction_data[faction_name] = json.load(f)
-        return faction_data
+        """Faction data from the shared catalog; each faction's JSON file is parsed when it is first selected"""
+        return get_catalog()
     
     def create_attacker_section(self):
         """Create the attacker selection interface"""
@@ -879,6 +865,9 @@ Please report any bugs to Andrew White."""
             
             # Run simulation
             results = self.simulator.simulate_attacks(weapons, defender, attacker_range)
+            if self.simulator.profiler is not None:
+                print(self.simulator.profiler.format())
+                self.simulator.profiler.clear()
             
             # Create title for the plot
             attacker_units = [u['unit_combo'].get() for u in self.attacker_units if u['unit_combo'].get()]
@@ -933,6 +922,12 @@ Please report any bugs to Andrew White."""
         debug_check = ttk.Checkbutton(self.main_frame, text="Enable Debug Output", variable=self.debug_var,
                                     command=self.toggle_debug, style='White.TCheckbutton')
         debug_check.grid(row=20, column=0, columnspan=2, sticky=tk.W, pady=(0,10))
+
+        # Profiling toggle; the time spent in each stage of the attacks is printed to the console
+        self.profile_var = tk.BooleanVar(value=False)
+        profile_check = ttk.Checkbutton(self.main_frame, text="Profile Stages", variable=self.profile_var,
+                                      command=self.toggle_profiling, style='White.TCheckbutton')
+        profile_check.grid(row=21, column=0, columnspan=2, sticky=tk.W, pady=(0,10))
         
         # Configure white text color for the checkbox
         style = ttk.Style()
@@ -940,7 +935,12 @@ Please report any bugs to Andrew White."""
         
     def toggle_debug(self):
         """Toggle debug mode in the simulator"""
-        self.simulator = UnitCombatSimulator(num_simulations=10, debug=self.debug_var.get())
+        self.simulator = UnitCombatSimulator(num_simulations=10, debug=self.debug_var.get(), batch=True,
+                                             profile=self.profile_var.get())
+
+    def toggle_profiling(self):
+        """Toggle profiling of the engine's pipeline stages"""
+        self.simulator.set_profiling(self.profile_var.get())
 
     def filter_attacker_faction(self, event=None):
         """Filter attacker faction combobox based on user input"""
@@ -0,0 +1,111 @@
+"""
+Defending units made of several model profiles.
+
+A Model target stands for an endless line of identical models: each time one is destroyed, a fresh one takes its place,
+unless it has a unit_size and that many are already destroyed. A DefenderUnit is a whole unit instead, such as a mob of
+Nobz with a Boss Nob or a squad with its sergeant: the profile and wounds of each of its models, in the order damage is
+allocated to them. The engine allocates damage model by model, moving on to the next when one is destroyed, with each
+attack rolled against the attack plan compiled for the profile of the model it is allocated to. Once every model is
+destroyed, the rest of the attacks and weapons are not rolled and are counted as wasted_attacks instead.
+
+Per-trial allocation state is just the index of the model being allocated to and its wounds left (see DefenderState), so
+the batch engine updates it for every trial at once.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import numpy as np
+from combat_engine import Model
+
+
+def characteristic(characteristics: Dict, key: str) -> Optional[int]:
+    """A model characteristic that may be missing or null, under its upper or title case key (INV or Inv)"""
+    value = characteristics.get(key.upper(), characteristics.get(key.title()))
+    return int(value) if value is not None else None
+
+
+def model_from_profile(name: str, characteristics: Dict, unit: Dict, total_models: Optional[int] = None) -> Model:
+    """A Model from one entry of a unit record's models, with the unit's keywords and defensive rules"""
+    return Model(
+        name=name,
+        toughness=int(characteristics['T']),
+        save=int(characteristics['SV']),
+        wounds=int(characteristics['W']),
+        current_wounds=int(characteristics['W']),
+        total_models=total_models if total_models is not None else unit.get('total_models'),
+        invulnerable_save=characteristic(characteristics, 'INV'),
+        feel_no_pain=characteristic(characteristics, 'FNP'),
+        keywords=unit.get('keywords', []),
+        special_rules=unit.get('special_rules_defence', [])
+    )
+
+
+@dataclass
+class DefenderUnit:
+    """A defending unit as per-model arrays, in allocation order; profile[i] indexes the Model in profiles of model i"""
+    name: str
+    profiles: List[Model]
+    profile: np.ndarray
+    wounds: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        self.profile = np.asarray(self.profile, dtype=np.int64)
+        self.wounds = np.array([model.wounds for model in self.profiles], dtype=np.int64)[self.profile]
+        # Wounds of the first i models, so Overkill finds the model its damage reaches with one search
+        self.cumulative_wounds = np.concatenate([[0], np.cumsum(self.wounds)])
+
+    @classmethod
+    def from_unit_data(cls, name: str, unit: Dict, counts: Optional[Dict[str, int]] = None) -> "DefenderUnit":
+        """
+        A unit from a unit record, with every model profile in the order listed (so leaders such as a Boss Nob, listed
+        last, are allocated to last).
+
+        The records do not say how many models have each profile, so counts gives them by profile name; a profile not
+        in counts has one model, or total_models if it is the unit's only profile.
+        """
+        names = list(unit['models'])
+        unknown = set(counts or {}) - set(names)
+        if unknown:
+            raise ValueError(f"{name} has no model profile {', '.join(sorted(unknown))}; its profiles are "
+                             f"{', '.join(names)}")
+        default = (unit.get('total_models') or 1) if len(names) == 1 else 1
+        model_counts = [(counts or {}).get(profile_name, default) for profile_name in names]
+        total_models = sum(model_counts)
+        profiles = [model_from_profile(profile_name, unit['models'][profile_name], unit, total_models)
+                    for profile_name in names]
+        profile = np.repeat(np.arange(len(profiles)), model_counts)
+        return cls(name, profiles, profile)
+
+    @classmethod
+    def from_model(cls, model: Model, num_models: Optional[int] = None) -> "DefenderUnit":
+        """
+        A unit of identical models, such as a single Trukk, so that attacks stop once it is destroyed; num_models
+        defaults to the model's unit_size, or else its total_models
+        """
+        num_models = num_models if num_models is not None else (model.unit_size or model.total_models or 1)
+        return cls(model.name, [model], np.zeros(num_models, dtype=np.int64))
+
+    @property
+    def num_models(self) -> int:
+        return len(self.profile)
+
+    @property
+    def total_wounds(self) -> int:
+        return int(self.cumulative_wounds[-1])
+
+    def profile_index(self, model: int) -> int:
+        """Index in profiles of the profile attacks against a model are rolled with; once the unit is destroyed, that
+        of its last model"""
+        return int(self.profile[min(model, self.num_models - 1)])
+
+
+@dataclass
+class DefenderState:
+    """Per-trial allocation state of a Model or DefenderUnit target: the model being allocated to and its wounds left"""
+    model: np.ndarray
+    current_wounds: np.ndarray
+
+    @classmethod
+    def fresh(cls, unit: DefenderUnit, n_trials: int) -> "DefenderState":
+        """Every trial starting on the unit's first model, at full wounds"""
+        return cls(np.zeros(n_trials, dtype=np.int64), np.full(n_trials, unit.wounds[0], dtype=np.int64))
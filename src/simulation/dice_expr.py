@@ -0,0 +1,161 @@
+"""
+Dice expressions.
+
+Attack counts, damage values and Rapid Fire bonuses are written as dice expressions such as 3, "D6+3", "2D6",
+"D3 or 3" and "2D3 or 2D6". parse_dice_expr parses each expression once and caches the result, so rolling a weapon's
+attacks or damage only samples dice instead of re-matching strings.
+
+"X or Y" expressions use Y on a critical hit and X otherwise. Rerolls follow the damage reroll rules: REROLL_FAILED
+rerolls all the dice when their total is below average, REROLL_ONES rerolls all the dice when any of them is a 1.
+
+PMFs are NumPy arrays indexed by value, so pmf[3] is the probability of exactly 3.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Union, Sequence
+import re
+import numpy as np
+
+# Reroll policies
+REROLL_FAILED = "failed"  # Reroll results below the target (for damage, below average)
+REROLL_ONES = "ones"  # Reroll results of 1
+
+DICE_PATTERN = re.compile(r'^(\d*)D(3|6)(?:([+-])(\d+))?$')
+
+
+@dataclass(frozen=True)
+class DiceExpr:
+    """A parsed dice expression: the sum of dice DX plus a flat bonus, with an optional value on critical hits"""
+    text: str
+    dice: int = 0
+    sides: int = 6
+    bonus: int = 0
+    critical: Optional["DiceExpr"] = None  # Used instead of this expression on a critical hit ("X or Y")
+
+    @property
+    def is_fixed(self) -> bool:
+        """Whether the expression always has the same value"""
+        return self.dice == 0 and self.critical is None
+
+    def select(self, is_critical_hit: bool = False) -> "DiceExpr":
+        """The expression that applies on a normal or critical hit"""
+        if is_critical_hit and self.critical is not None:
+            return self.critical
+        return self
+
+    def total(self, rolls: Sequence[int]) -> int:
+        """Value of the expression for the given dice results"""
+        return sum(rolls) + self.bonus
+
+    def should_reroll(self, rolls: Sequence[int], reroll: Optional[str]) -> bool:
+        """Whether a reroll policy rerolls the given dice results"""
+        if reroll == REROLL_FAILED:
+            return sum(rolls) * 2 < self.dice * (self.sides + 1)
+        if reroll == REROLL_ONES:
+            return 1 in rolls
+        return False
+
+    @lru_cache(maxsize=None)
+    def pmf(self, reroll: Optional[str] = None, is_critical_hit: bool = False) -> np.ndarray:
+        """PMF of the expression's value, with the dice rerolled once under the given reroll policy"""
+        expr = self.select(is_critical_hit)
+        if expr is not self:
+            return expr.pmf(reroll)
+
+        face = np.zeros(self.sides + 1)
+        face[1:] = 1 / self.sides
+        rolled = np.array([1.0])
+        for _ in range(self.dice):
+            rolled = np.convolve(rolled, face)
+
+        if reroll == REROLL_FAILED:
+            kept = rolled * (np.arange(len(rolled)) * 2 >= self.dice * (self.sides + 1))
+        elif reroll == REROLL_ONES:
+            # Results with no 1s are kept
+            kept = np.array([1.0])
+            for _ in range(self.dice):
+                kept = np.convolve(kept, np.where(np.arange(self.sides + 1) >= 2, face, 0.0))
+            kept = np.concatenate([kept, np.zeros(len(rolled) - len(kept))])
+        else:
+            kept = rolled
+        rolled = kept + (1 - kept.sum()) * rolled
+
+        # Values below zero are treated as zero
+        if self.bonus >= 0:
+            pmf = np.concatenate([np.zeros(self.bonus), rolled])
+        else:
+            pmf = rolled[-self.bonus:].copy()
+            pmf[0] += rolled[:-self.bonus].sum()
+        pmf.flags.writeable = False
+        return pmf
+
+    def mean(self, reroll: Optional[str] = None, is_critical_hit: bool = False) -> float:
+        """Expected value of the expression"""
+        pmf = self.pmf(reroll, is_critical_hit)
+        return float(np.dot(np.arange(len(pmf)), pmf))
+
+    @property
+    def maximum(self) -> int:
+        """Largest value of the expression, on a normal or a critical hit"""
+        value = max(0, self.dice * self.sides + self.bonus)
+        return value if self.critical is None else max(value, self.critical.maximum)
+
+    def sample(self, rng: np.random.Generator, size: Optional[int] = None, reroll: Optional[str] = None,
+               is_critical_hit: Union[bool, np.ndarray] = False) -> Union[int, np.ndarray]:
+        """
+        Roll the expression.
+
+        Args:
+            rng: NumPy random generator
+            size: Number of independent rolls; a single int is returned if not given
+            reroll: Reroll policy applied to the dice
+            is_critical_hit: Whether each roll is for a critical hit; a bool or an array of length size
+
+        Returns:
+            The rolled value, or an array of size rolled values
+        """
+        if size is None:
+            expr = self.select(bool(is_critical_hit))
+            rolls = rng.integers(1, expr.sides + 1, size=expr.dice).tolist()
+            if expr.should_reroll(rolls, reroll):
+                rolls = rng.integers(1, expr.sides + 1, size=expr.dice).tolist()
+            return max(0, expr.total(rolls))
+
+        if self.critical is not None and np.any(is_critical_hit):
+            return np.where(is_critical_hit, self.critical.sample(rng, size, reroll),
+                            self.sample(rng, size, reroll))
+
+        rolls = rng.integers(1, self.sides + 1, size=(size, self.dice))
+        if reroll == REROLL_FAILED:
+            reroll_mask = rolls.sum(axis=1) * 2 < self.dice * (self.sides + 1)
+        elif reroll == REROLL_ONES:
+            reroll_mask = (rolls == 1).any(axis=1)
+        else:
+            reroll_mask = None
+        if reroll_mask is not None:
+            rolls[reroll_mask] = rng.integers(1, self.sides + 1, size=(int(reroll_mask.sum()), self.dice))
+        return np.maximum(0, rolls.sum(axis=1) + self.bonus)
+
+
+@lru_cache(maxsize=None)
+def parse_dice_expr(value: Union[int, str]) -> DiceExpr:
+    """Parse a dice expression such as 3, "D6+3", "2D6" or "D3 or 3"; anything unrecognised counts as 1"""
+    if isinstance(value, int):
+        return DiceExpr(text=str(value), bonus=value)
+
+    text = value.strip()
+    if " or " in text:
+        normal, critical = text.split(" or ", 1)
+        normal_expr = parse_dice_expr(normal)
+        return DiceExpr(text=text, dice=normal_expr.dice, sides=normal_expr.sides, bonus=normal_expr.bonus,
+                        critical=parse_dice_expr(critical))
+    if text.isdigit():
+        return DiceExpr(text=text, bonus=int(text))
+
+    match = DICE_PATTERN.match(text.upper())
+    if match is None:
+        return DiceExpr(text=text, bonus=1)
+    bonus = int(match.group(4) or 0)
+    return DiceExpr(text=text, dice=int(match.group(1) or 1), sides=int(match.group(2)),
+                    bonus=-bonus if match.group(3) == "-" else bonus)
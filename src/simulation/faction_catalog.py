@@ -0,0 +1,121 @@
+"""
+Lazily loaded catalog of the faction files in data/json.
+
+Only a small manifest of unit names per faction is read at startup; a faction's full records are parsed the first time
+they are used. The manifest is cached in data/cache/faction_manifest.json, and an entry is rebuilt only when its
+faction file's modification time or size changes. One catalog is shared by everything in the process (see
+get_catalog), so the GUIs and simulators never parse a faction file twice.
+"""
+
+import json
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from results_journal import atomic_write_json
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data" / "json"
+CACHE_FILE = Path(__file__).parent.parent.parent / "data" / "cache" / "faction_manifest.json"
+
+# Version of the manifest cache layout
+MANIFEST_FORMAT = 1
+
+# Catalogs by data directory, shared by everything in the process
+_catalogs: Dict[Path, "FactionCatalog"] = {}
+
+
+class FactionCatalog(Mapping):
+    """Faction name -> list of unit records, in sorted faction order; records are parsed on first access"""
+
+    def __init__(self, data_dir: Path = DATA_DIR, cache_file: Optional[Path] = CACHE_FILE):
+        self.data_dir = Path(data_dir)
+        self.cache_file = cache_file
+        if not self.data_dir.exists():
+            raise FileNotFoundError(f"Data directory not found at {self.data_dir}")
+        self.files = {path.stem: path for path in sorted(self.data_dir.glob("*.json"))
+                      if not path.stem.startswith("zz_")}  # zz_ files are generated target arrays, not factions
+        self.units: Dict[str, List[Dict]] = {}  # Parsed records of the factions touched so far
+        self.units_by_name: Dict[str, Dict[str, Dict]] = {}  # First unit with each name, by faction
+        self.manifest = self._load_manifest()  # Unit names of every faction, in file order
+        # Factions with each unit name; several factions can share a unit, e.g. Ministorum Priest
+        self.unit_factions: Dict[str, List[str]] = {}
+        for faction_name, unit_names in self.manifest.items():
+            for unit_name in unit_names:
+                factions = self.unit_factions.setdefault(unit_name, [])
+                if faction_name not in factions:
+                    factions.append(faction_name)
+        self.sorted_unit_names = sorted(unit_name for unit_names in self.manifest.values() for unit_name in unit_names)
+
+    def __getitem__(self, faction_name: str) -> List[Dict]:
+        if faction_name not in self.units:
+            with open(self.files[faction_name], 'r') as f:
+                self.units[faction_name] = json.load(f)
+        return self.units[faction_name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.files)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __contains__(self, faction_name) -> bool:
+        return faction_name in self.files
+
+    def _load_manifest(self) -> Dict[str, List[str]]:
+        """Unit names of every faction, from the cache where the faction file has not changed"""
+        cached = {}
+        if self.cache_file is not None and self.cache_file.exists():
+            try:
+                with open(self.cache_file, 'r') as f:
+                    cache = json.load(f)
+                if cache.get('format') == MANIFEST_FORMAT and cache.get('data_dir') == str(self.data_dir):
+                    cached = cache['factions']
+            except (OSError, ValueError, KeyError):
+                cached = {}
+
+        entries = {}
+        changed = set(cached) != set(self.files)
+        for faction_name, path in self.files.items():
+            stat = path.stat()
+            entry = cached.get(faction_name)
+            if entry is None or entry['mtime_ns'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+                entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                         'units': [unit['name'] for unit in self[faction_name]]}
+                changed = True
+            entries[faction_name] = entry
+
+        if changed and self.cache_file is not None:
+            try:
+                self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+                atomic_write_json(self.cache_file, {'format': MANIFEST_FORMAT, 'data_dir': str(self.data_dir),
+                                                    'factions': entries}, indent=None)
+            except OSError:
+                pass  # A read-only checkout just rebuilds the manifest every time
+        return {faction_name: entry['units'] for faction_name, entry in entries.items()}
+
+    def unit_names(self) -> List[str]:
+        """Sorted names of every unit in every faction, including each faction's copy of a shared name"""
+        return list(self.sorted_unit_names)
+
+    def factions_with_unit(self, unit_name: str) -> List[str]:
+        """Factions that have a unit with the given name, in sorted order"""
+        return list(self.unit_factions.get(unit_name, []))
+
+    def get_unit(self, faction_name: str, unit_name: str) -> Optional[Dict]:
+        """A faction's unit with the given name, parsing the faction if needed"""
+        if faction_name not in self.unit_factions.get(unit_name, []):
+            return None
+        if faction_name not in self.units_by_name:
+            units_by_name = {}
+            for unit in self[faction_name]:
+                units_by_name.setdefault(unit['name'], unit)
+            self.units_by_name[faction_name] = units_by_name
+        return self.units_by_name[faction_name].get(unit_name)
+
+
+def get_catalog(data_dir: Path = DATA_DIR) -> FactionCatalog:
+    """The catalog for a data directory, created on first use and shared by everything in the process"""
+    data_dir = Path(data_dir).resolve()
+    if data_dir not in _catalogs:
+        # Only the default data directory has a manifest cache
+        _catalogs[data_dir] = FactionCatalog(data_dir, CACHE_FILE if data_dir == DATA_DIR.resolve() else None)
+    return _catalogs[data_dir]
@@ -0,0 +1,132 @@
+"""
+Histograms of simulation results.
+
+Simulations only ever produce small non-negative integers (damage, models destroyed), so their results are kept as counts
+per value rather than one entry per trial. A histogram needs memory for the largest value seen, however many trials are
+run, and histograms from separate chunks or worker processes are merged by adding their counts.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Union
+import numpy as np
+
+
+class Histogram:
+    """Counts of non-negative integer outcomes, indexed by value, so counts[3] is the number of trials with 3"""
+
+    def __init__(self, counts=None):
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64).copy()
+
+    @classmethod
+    def from_values(cls, values) -> "Histogram":
+        """Histogram of an array of trial results"""
+        histogram = cls()
+        histogram.add(values)
+        return histogram
+
+    def add(self, values: Union[int, np.ndarray]):
+        """Count one result or an array of results"""
+        values = np.asarray(values, dtype=np.int64).ravel()
+        if len(values) == 0:
+            return
+        counts = np.bincount(values)
+        self._grow(len(counts))
+        self.counts[:len(counts)] += counts
+
+    def merge(self, other: "Histogram") -> "Histogram":
+        """Add another histogram's counts to this one, e.g. from another chunk of trials"""
+        self._grow(len(other.counts))
+        self.counts[:len(other.counts)] += other.counts
+        return self
+
+    def __add__(self, other: "Histogram") -> "Histogram":
+        return Histogram(self.counts).merge(other)
+
+    def _grow(self, length: int):
+        if length > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(length - len(self.counts), dtype=np.int64)])
+
+    @property
+    def total(self) -> int:
+        """Number of trials counted"""
+        return int(self.counts.sum())
+
+    @property
+    def min(self) -> int:
+        """Smallest result counted"""
+        return int(np.flatnonzero(self.counts)[0])
+
+    @property
+    def max(self) -> int:
+        """Largest result counted"""
+        return int(np.flatnonzero(self.counts)[-1])
+
+    def pmf(self) -> np.ndarray:
+        """Fraction of trials with each result"""
+        return self.counts / max(self.total, 1)
+
+    @property
+    def mean(self) -> float:
+        """Mean result"""
+        return float(np.dot(np.arange(len(self.counts)), self.pmf()))
+
+    @property
+    def std(self) -> float:
+        """Standard deviation of the results (of the trials themselves, like np.std)"""
+        values = np.arange(len(self.counts))
+        return float(np.sqrt(max(0.0, np.dot((values - self.mean) ** 2, self.pmf()))))
+
+    @property
+    def standard_error(self) -> float:
+        """Standard error of the mean result"""
+        if self.total < 2:
+            return float('inf')
+        return float(self.std / np.sqrt(self.total - 1))
+
+    def survival(self) -> np.ndarray:
+        """Fraction of trials with a result of at least each value, so survival()[k] is P(result >= k)"""
+        return np.cumsum(self.pmf()[::-1])[::-1]
+
+    def quantile(self, q: Union[float, np.ndarray]) -> Union[int, np.ndarray]:
+        """Smallest result that at least a fraction q of the trials do not exceed"""
+        quantiles = np.searchsorted(np.cumsum(self.counts), np.asarray(q) * self.total)
+        return int(quantiles) if np.ndim(quantiles) == 0 else quantiles
+
+    def values(self) -> np.ndarray:
+        """The counted results expanded back into one entry per trial, in sorted order"""
+        return np.repeat(np.arange(len(self.counts)), self.counts)
+
+
+@dataclass
+class SimulationResults:
+    """
+    Histograms of the damage and models destroyed in each trial of a simulation, and optionally of how many attacks,
+    hits, wounds, saves and so on each trial had at each stage of its attacks (see UnitCombatSimulator telemetry)
+    """
+    damage: Histogram = field(default_factory=Histogram)
+    models_destroyed: Histogram = field(default_factory=Histogram)
+    stages: Dict[str, Histogram] = field(default_factory=dict)
+
+    def merge(self, other: "SimulationResults") -> "SimulationResults":
+        """Add another set of results, e.g. from another chunk of trials"""
+        self.damage.merge(other.damage)
+        self.models_destroyed.merge(other.models_destroyed)
+        for stage, histogram in other.stages.items():
+            self.stages.setdefault(stage, Histogram()).merge(histogram)
+        return self
+
+    @property
+    def num_simulations(self) -> int:
+        """Number of trials counted"""
+        return self.damage.total
+
+    def funnel(self) -> Dict[str, float]:
+        """Mean count per trial at each stage, e.g. {"attacks": 20.0, "hits": 13.3, ...}"""
+        return {stage: histogram.mean for stage, histogram in self.stages.items()}
+
+    def __getitem__(self, key: str) -> Histogram:
+        """results["damage"] and results["models_destroyed"], as with the arrays simulations used to return, or a
+        stage such as results["hits"]"""
+        if key in self.stages:
+            return self.stages[key]
+        return getattr(self, key)
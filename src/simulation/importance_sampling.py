@@ -0,0 +1,139 @@
+"""
+Importance sampling for rare outcomes.
+
+Questions such as "what is the chance these Fire Dragons destroy a Knight in one volley" ask about the far tail of the
+damage distribution, where plain Monte Carlo only sees a handful of trials reach the event. Instead, the dice can be
+drawn from tilted distributions that favour the attacker (or the defender, for the other tail), and each trial can be
+weighted by its likelihood ratio: the product over every die it used of the die's real probability over its tilted
+probability. The weighted fraction of trials reaching the event is an unbiased estimate of its real probability, with
+far less variance when the tilt makes the event common.
+
+The tilt is exponential in a single parameter theta. Each face of a hit, wound or save roll is scored by what it does for
+the attacker (0 for a miss, failed wound or saved wound, 1 for a success, 2 for a critical that triggers a rule), and a
+face with score s is drawn with probability proportional to exp(theta * s) / 6. Faces with the same outcome keep their
+relative chances, so only the dice that change the outcome move the weights. Attack counts and damage values are
+tilted by exp(theta) across their range of values, and Feel No Pain saves have their odds scaled by exp(-theta).
+theta = 0 is fair dice; a negative theta favours the defender.
+"""
+
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Dict, Optional, Tuple
+import numpy as np
+from rng_streams import RandomSource, StageStreams
+
+
+def tilt_pmf(pmf: np.ndarray, theta: float, scores: Optional[np.ndarray] = None) -> np.ndarray:
+    """PMF tilted by exp(theta * score); scores default to 0 to 1 across the range of values with non-zero
+    probability"""
+    support = np.flatnonzero(pmf)
+    if scores is None:
+        low, high = support[0], support[-1]
+        scores = (np.arange(len(pmf)) - low) / max(high - low, 1)
+    if theta == 0:
+        return np.asarray(pmf, dtype=float)
+    # Tilting in the log domain keeps large theta from overflowing
+    log_tilted = np.full(len(pmf), -np.inf)
+    log_tilted[support] = np.log(pmf[support]) + theta * scores[support]
+    tilted = np.exp(log_tilted - log_tilted.max())
+    return tilted / tilted.sum()
+
+
+def sample_pmf(rng: np.random.Generator, pmf: np.ndarray, size: int) -> np.ndarray:
+    """Array of values drawn from a PMF indexed by value"""
+    cdf = np.cumsum(pmf)
+    values = np.searchsorted(cdf, rng.random(size) * cdf[-1], side='right')
+    # Guard against rounding in the last bin of the cumulative sum
+    return np.minimum(values, len(pmf) - 1)
+
+
+# PMF of a fair D6, indexed by face
+D6_PMF = np.array([0.0] + [1 / 6] * 6)
+
+
+class TiltedStreams(StageStreams):
+    """
+    Stage streams whose dice come from tilted distributions.
+
+    The batch engine treats these like ordinary stage streams, but draws through the methods below, each of which also
+    returns the log likelihood ratio of every value drawn. The engine adds up the ratios of the dice each trial actually
+    used into the trial's log weight.
+    """
+
+    def __init__(self, rng: RandomSource, theta: float):
+        super().__init__(rng)
+        self.theta = theta
+        # Tilted PMF and log likelihood ratio of each face, by face scores
+        self.d6: Dict[bytes, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def roll_d6(self, stage: str, size: int, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """An array of D6 for a stage, with faces tilted by their scores (indexed by face), and the log likelihood
+        ratio of each"""
+        key = scores.tobytes()
+        if key not in self.d6:
+            tilted = tilt_pmf(D6_PMF, self.theta, scores)
+            # Face 0 does not exist, so its ratio is never read
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.d6[key] = (tilted, np.log(D6_PMF) - np.log(tilted))
+        tilted, log_ratio = self.d6[key]
+        rolls = sample_pmf(getattr(self, stage), tilted, size)
+        return rolls, log_ratio[rolls]
+
+    def sample_values(self, stage: str, pmf: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """An array of values drawn from a stage's tilted PMF, such as an attack count, and the log likelihood ratio
+        of each"""
+        tilted = tilt_pmf(pmf, self.theta)
+        values = sample_pmf(getattr(self, stage), tilted, size)
+        return values, np.log(pmf[values]) - np.log(tilted[values])
+
+    def binomial(self, stage: str, n: np.ndarray, p: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Binomial draws of successful saves, tilted towards fewer, and the log likelihood ratio of each"""
+        p = np.broadcast_to(np.asarray(p, dtype=float), np.shape(n))
+        # The odds of each save are scaled by exp(-theta)
+        q = p * np.exp(-self.theta) / (p * np.exp(-self.theta) + 1 - p)
+        successes = getattr(self, stage).binomial(n, q)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_ratio = (np.where(successes > 0, successes * (np.log(p) - np.log(q)), 0.0)
+                         + (n - successes) * (np.log1p(-p) - np.log1p(-q)))
+        return successes, log_ratio
+
+
+@dataclass
+class TailEstimate:
+    """Estimated probability of a rare outcome, with its standard error and confidence interval"""
+    probability: float
+    standard_error: float
+    confidence_interval: Tuple[float, float]
+    confidence: float
+    num_simulations: int  # Trials behind the estimate, not counting the trials spent choosing the tilt
+    theta: float  # Tilt the trials were run with
+    hits: int  # Trials that reached the outcome
+    effective_sample_size: float  # Number of unweighted trials the weighted ones that reached the outcome are worth
+
+    @property
+    def relative_error(self) -> float:
+        """Standard error as a fraction of the probability"""
+        return self.standard_error / self.probability if self.probability > 0 else float('inf')
+
+
+def estimate_probability(reached: np.ndarray, log_weights: np.ndarray, theta: float = 0.0,
+                         confidence: float = 0.95) -> TailEstimate:
+    """
+    Estimate a probability from weighted trials.
+
+    Args:
+        reached: Whether each trial reached the outcome
+        log_weights: Log likelihood ratio of each trial
+        theta: Tilt the trials were run with, for the record
+        confidence: Coverage of the confidence interval, which uses the normal approximation
+    """
+    n = len(reached)
+    weighted = np.where(reached, np.exp(log_weights), 0.0)
+    probability = float(weighted.mean()) if n else 0.0
+    standard_error = float(weighted.std(ddof=1) / np.sqrt(n)) if n > 1 else float('inf')
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    interval = (max(0.0, probability - z * standard_error), min(1.0, probability + z * standard_error))
+    squares = float(np.dot(weighted, weighted))
+    effective_sample_size = float(weighted.sum()) ** 2 / squares if squares > 0 else 0.0
+    return TailEstimate(probability, standard_error, interval, confidence, n, theta, int(np.count_nonzero(reached)),
+                        effective_sample_size)
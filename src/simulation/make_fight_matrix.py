@@ -3,12 +3,24 @@ I think it's working now; lots of time debugging the target profile.
 """
 
 import json
+import argparse
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import numpy as np
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Optional
 import statistics
-from unit_combat_simulator import UnitCombatSimulator
+from unit_combat_simulator import UnitCombatSimulator, ONE_USE_RULES
 from unit_combat_simulator import Model, Weapon
+from combat_engine import ENGINE_VERSION
+from analytic_engine import pmf_mean_std
+from rng_streams import RandomSource, make_rng
+from dice_expr import parse_dice_expr
+from results_journal import ResultsJournal, atomic_write_json
+from results_store import ResultsStore, RESULTS_DIR
+from profiling import PROFILE_STAGES
+from defender_unit import DefenderUnit
 
 def clean_string(s: str) -> str:
     """Remove all non-alphabetical characters from a string, except spaces."""
@@ -67,8 +79,21 @@ def create_weapon(unit: dict, weapon_all: dict):
         target_range=0  # Will be set when simulating attacks
     )
 
-def run_simulation(simulator: UnitCombatSimulator, attacker_config: Dict, target_data: Dict) -> Tuple[float, float, float, float]:
-    """Run a single simulation and return mean damage, std damage, mean models killed, std models killed"""
+def run_simulation(simulator: UnitCombatSimulator, attacker_config: Dict, target_data: Dict,
+                   exact: bool = False, rng: Optional[RandomSource] = None,
+                   pkpp_tolerance: Optional[float] = None) -> Tuple[float, float, float, float, float, int]:
+    """Run a single simulation and return mean damage, std damage, mean models killed, std models killed, the standard
+    error of the mean damage and the number of simulations run
+
+    A target with several model profiles is simulated as a DefenderUnit (see defender_unit), with the number of models
+    of each profile from its optional model_counts.
+
+    With exact=True the statistics are computed from the exact distributions instead of simulated trials, unless the
+    attacker has one-use rules or the target several profiles; the standard error and number of simulations are then
+    0. rng is passed on to
+    UnitCombatSimulator.simulate_attacks. pkpp_tolerance is a sequential-stopping tolerance on the standard error of
+    points killed per point, for a simulator with adaptive trial counts.
+    """
     # Create weapons for the attacker
     attacking_weapons = []
     for unit in attacker_config['units']:
@@ -78,7 +103,8 @@ def run_simulation(simulator: UnitCombatSimulator, attacker_config: Dict, target
                 for _ in range(weapon_all['quantity']):
                     attacking_weapons.append(weapon)
     
-    # Create target model directly from target data
+    # Create target model directly from target data; a target with several model profiles, such as a sergeant, is a
+    # whole unit with damage allocated model by model
     model_name = list(target_data['models'].keys())[0]
     characteristics = target_data['models'][model_name]
     if characteristics['INV'] is not None:
@@ -101,98 +127,404 @@ def run_simulation(simulator: UnitCombatSimulator, attacker_config: Dict, target
         keywords=target_data.get('keywords', []),
         special_rules=target_data.get('special_rules_defence', [])
     )
+    if len(target_data['models']) > 1:
+        target_model = DefenderUnit.from_unit_data(target_data['name'], target_data, target_data.get('model_counts'))
     
+    if (exact and isinstance(target_model, Model)
+            and not any(simulator.get_one_use_rules(attacking_weapons).values())):
+        distributions = simulator.compute_exact_distribution(attacking_weapons, target_model,
+                                                             target_range=attacker_config['target_range'])
+        mean_damage, std_damage = pmf_mean_std(distributions["damage"])
+        mean_models, std_models = pmf_mean_std(distributions["models_destroyed"])
+        return mean_damage, std_damage, mean_models, std_models, 0.0, 0
+
+    # Points killed per point is damage scaled by the target's points per wound over the attacker's points
+    abs_tolerance = None
+    if pkpp_tolerance is not None:
+        abs_tolerance = (pkpp_tolerance * target_wounds(target_data) * attacker_config['points']
+                         / target_model_points(target_data))
+
     # Run simulation
-    results = simulator.simulate_attacks(attacking_weapons, target_model, target_range=attacker_config['target_range'])
+    results = simulator.simulate_attacks(attacking_weapons, target_model, target_range=attacker_config['target_range'],
+                                         rng=rng, abs_tolerance=abs_tolerance)
     
     # Calculate statistics
-    mean_damage = float(np.mean(results["damage"]))
-    std_damage = float(np.std(results["damage"]))
-    mean_models = float(np.mean(results["models_destroyed"]))
-    std_models = float(np.std(results["models_destroyed"]))
+    mean_damage = results.damage.mean
+    std_damage = results.damage.std
+    mean_models = results.models_destroyed.mean
+    std_models = results.models_destroyed.std
     
-    return mean_damage, std_damage, mean_models, std_models
+    return mean_damage, std_damage, mean_models, std_models, results.damage.standard_error, results.num_simulations
+
+# Cells whose attacker has one-use rules and whose target has several model profiles fall back to the per-attack
+# engine, which is this many times slower per attack
+SCALAR_COST_FACTOR = 50
+
+# Simulator used by run_cell, created once per worker process
+_cell_simulator = None
+
+# Cells listed when printing the slowest ones of a profiled run
+PROFILE_TOP_CELLS = 10
+
+def estimate_cell_cost(attacker_config: Dict, target_data: Dict) -> float:
+    """Rough relative cost of simulating a cell: the expected number of attacks, weighted by which engine runs them"""
+    attacks = 0.0
+    for unit in attacker_config['units']:
+        for weapon_all in unit['weapons']:
+            weapon_attacks = parse_dice_expr(weapon_all['data']['A']).mean()
+            if "Blast" in weapon_all['data'].get('Keywords', []):
+                weapon_attacks += (target_data.get('total_models') or 0) // 5
+            attacks += weapon_attacks * weapon_all['quantity']
+
+    rules = {rule for unit in attacker_config['units'] for rule in unit.get('special_rules', [])}
+    rules.update(rule for unit in attacker_config['units'] for weapon_all in unit['weapons']
+                 for rule in weapon_all['data'].get('Keywords', []))
+    if len(target_data['models']) > 1 and any(rule in rules for rule in ONE_USE_RULES.values()):
+        attacks *= SCALAR_COST_FACTOR
+    return attacks
+
+def run_cell(attacker_config: Dict, target_data: Dict, exact: bool, seed: Optional[int], designation: str,
+             num_simulations: int, tolerance: Optional[float] = None, pkpp_tolerance: Optional[float] = None,
+             max_simulations: Optional[int] = None, common_random_numbers: bool = False,
+             profile: bool = False, sampled: bool = False,
+             aggregated: bool = False) -> Tuple[Optional[Tuple], Optional[str], Optional[Dict]]:
+    """
+    Simulate one (designation, target) cell; returns the statistics, or None and the traceback on failure, and with
+    profile set the cell's wall time and per-stage breakdown (see profiling)
+    """
+    global _cell_simulator
+    if (_cell_simulator is None or _cell_simulator.num_simulations != num_simulations
+            or _cell_simulator.tolerance != tolerance or _cell_simulator.max_simulations != max_simulations
+            or _cell_simulator.sampled != sampled or _cell_simulator.aggregated != aggregated):
+        # Aggregated trials are resolved one at a time, so they replace the batch engine
+        _cell_simulator = UnitCombatSimulator(num_simulations=num_simulations, batch=not aggregated, seed=seed,
+                                              tolerance=tolerance, max_simulations=max_simulations, sampled=sampled,
+                                              aggregated=aggregated)
+    _cell_simulator.set_profiling(profile)
+    # Each cell gets its own stream keyed by the matchup, so results do not depend on run order; with common random
+    # numbers every cell gets the same stream, so each attacker rolls the same dice against every target and vice versa
+    if common_random_numbers:
+        rng = make_rng(seed, "common random numbers")
+    else:
+        rng = make_rng(seed, designation, target_data['name']) if seed is not None else None
+    start_time = time.perf_counter()
+    try:
+        stats = run_simulation(_cell_simulator, attacker_config, target_data, exact=exact, rng=rng,
+                               pkpp_tolerance=pkpp_tolerance)
+        error = None
+    except Exception:
+        import traceback
+        stats, error = None, traceback.format_exc()
+    profile_report = None
+    if profile:
+        profile_report = {'seconds': time.perf_counter() - start_time, 'stages': _cell_simulator.profiler.report()}
+    return stats, error, profile_report
+
+def cell_hash(attacker_config: Dict, target_data: Dict, num_simulations: int, exact: bool,
+              seed: Optional[int], tolerance: Optional[float] = None, pkpp_tolerance: Optional[float] = None,
+              max_simulations: Optional[int] = None, common_random_numbers: bool = False,
+              sampled: bool = False, aggregated: bool = False) -> str:
+    """Canonical hash of everything a cell's results depend on, used to tell whether a stored cell is stale"""
+    cell_inputs = {
+        'attacker': attacker_config,
+        'target': target_data,
+        'engine_version': ENGINE_VERSION,
+        'num_simulations': num_simulations,
+        'exact': exact,
+        'seed': seed
+    }
+    # Only present with sequential stopping, so hashes of fixed-count cells are unchanged
+    if tolerance is not None or pkpp_tolerance is not None:
+        cell_inputs.update(tolerance=tolerance, pkpp_tolerance=pkpp_tolerance, max_simulations=max_simulations)
+    if common_random_numbers:
+        cell_inputs['common_random_numbers'] = True
+    if sampled:
+        cell_inputs['sampled'] = True
+    if aggregated:
+        cell_inputs['aggregated'] = True
+    canonical = json.dumps(cell_inputs, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def target_wounds(target_data: Dict) -> int:
+    """Wounds of the target's model, or of its first listed profile if it has several"""
+    models = target_data['models']
+    return models.get(target_data['name'], next(iter(models.values())))['W']
+
+def target_model_points(target_data: Dict) -> float:
+    """Points of each of the target's models; a unit with several model profiles splits its points evenly between them"""
+    if len(target_data['models']) > 1:
+        unit = DefenderUnit.from_unit_data(target_data['name'], target_data, target_data.get('model_counts'))
+        return target_data['points'] / unit.num_models
+    return target_data['points']
+
+def cell_result(phase: str, attacker_points: float, target_data: Dict,
+                stats: Tuple[float, float, float, float, float, int]) -> Dict:
+    """
+    The stored results of a cell from its simulated statistics; points killed per point is NaN for an attacker without
+    points.
+
+    A target with several model profiles is allocated to model by model, so its models killed are the simulated models
+    destroyed; a single-profile target's are its damage over its wounds, counting partly wounded models.
+    """
+    mean_damage, std_damage, mean_models, std_models, se_damage, simulations = stats
+    points_ratio = target_model_points(target_data) / attacker_points if attacker_points else float('nan')
+
+    if len(target_data['models']) > 1:
+        mean_models_killed, std_models_killed = mean_models, std_models
+        se_models_killed = std_models / simulations ** 0.5 if simulations else 0.0
+    else:
+        wounds = target_wounds(target_data)
+        mean_models_killed, std_models_killed = mean_damage / wounds, std_damage / wounds
+        se_models_killed = se_damage / wounds
+
+    # Calculate points killed per point
+    pkpp = mean_models_killed * points_ratio
+    std_dev_pkpp = std_models_killed * points_ratio
+    se_pkpp = se_models_killed * points_ratio
+
+    return {
+        'phase': phase,
+        'mean_damage': mean_damage,
+        'std_damage': std_damage,
+        'mean_models_killed': mean_models_killed,
+        'std_models_killed': std_models_killed,
+        'pnts_killed_per_point': pkpp,
+        'std_dev_pnts_killed_per_point': std_dev_pkpp,
+        'se_mean_damage': se_damage,
+        'se_pnts_killed_per_point': se_pkpp,
+        'num_simulations': simulations
+    }
+
+def write_profile_report(path: Path, cells: List[Dict]):
+    """
+    Write the per-cell profiles of a run, slowest first, with the total time of each attacker and stage, and print the
+    slowest cells
+    """
+    cells = sorted(cells, key=lambda cell: -cell['seconds'])
+    attackers = {}
+    stages = {stage: {'seconds': 0.0, 'calls': 0} for stage in PROFILE_STAGES}
+    for cell in cells:
+        attacker = attackers.setdefault((cell['faction'], cell['designation']),
+                                        {'faction': cell['faction'], 'designation': cell['designation'],
+                                         'seconds': 0.0, 'cells': 0})
+        attacker['seconds'] += cell['seconds']
+        attacker['cells'] += 1
+        for stage, entry in cell['stages'].items():
+            stages[stage]['seconds'] += entry['seconds']
+            stages[stage]['calls'] += entry['calls']
+    report = {
+        'seconds': sum(cell['seconds'] for cell in cells),
+        'stages': {stage: entry for stage, entry in stages.items() if entry['calls']},
+        'attackers': sorted(attackers.values(), key=lambda attacker: -attacker['seconds']),
+        'cells': cells
+    }
+    atomic_write_json(path, report)
+
+    print(f"Slowest cells ({report['seconds']:.1f}s in all):")
+    for cell in cells[:PROFILE_TOP_CELLS]:
+        slowest_stage = max(cell['stages'], key=lambda stage: cell['stages'][stage]['seconds'], default=None)
+        print(f"  {cell['seconds']:8.3f}s  {cell['faction']} - {cell['designation']} vs {cell['target']}"
+              + (f" (mostly {slowest_stage})" if slowest_stage is not None else ""))
+    print(f"Profile saved to {path}")
+
+def main(exact: bool = False, seed: Optional[int] = None, workers: int = 1, num_simulations: int = 2000,
+         force: bool = False, tolerance: Optional[float] = None, pkpp_tolerance: Optional[float] = None,
+         max_simulations: Optional[int] = None, common_random_numbers: bool = False, profile: bool = False,
+         sampled: bool = False, aggregated: bool = False):
+    """
+    Simulate every attacker against every target and save the results.
+
+    With common_random_numbers every cell draws from the same stream, so differences between targets for an attacker,
+    and between attackers for a target, are far less noisy. It needs a seed, and one is picked if not given.
+
+    With tolerance (relative) or pkpp_tolerance (absolute, in points killed per point) set, each cell runs at least
+    num_simulations trials and stops once the standard error of its mean is within tolerance, or after max_simulations.
+
+    With profile set, the wall time of every cell simulated, and of each stage of its attacks, is written to
+    simulation_profile.json, to find the attackers that dominate the run.
+
+    With sampled set, whole attacks are drawn from their exact outcome distribution rather than rolled die by die,
+    which gives the same distribution of results from different dice, faster.
+
+    With aggregated set, trials are resolved one at a time with the outcomes of a weapon's attacks drawn together
+    rather than every die rolled, instead of by the batch engine; it is about twice as fast as rolling every die, but
+    the batch engine is faster still.
+    """
+    if common_random_numbers and seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+        print(f"Using seed {seed} for common random numbers")
 
-def main():
-    # Create simulator
-    simulator = UnitCombatSimulator(num_simulations=2000)
-    
     # Load configurations
     attackers = load_attackers()
     targets = load_targets()
     
-    # Initialize results dictionary
-    results = {}
-    
     # Create output directory if it doesn't exist
-    output_dir = Path(__file__).parent.parent.parent / "data" / "results"
+    output_dir = RESULTS_DIR
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Load existing results if file exists
+    # Load existing results; simulation_data.json is only read to import results from before the columnar store
+    store = ResultsStore(output_dir)
     output_file = output_dir / "simulation_data.json"
-    if output_file.exists():
+    if not store.exists() and output_file.exists():
         with open(output_file, 'r') as f:
-            results = json.load(f)
+            store.import_nested(json.load(f))
+    results = store.to_nested()
+
+    # Hash of the inputs behind each stored cell, by faction, designation and target
+    hash_file = output_dir / "simulation_data_hashes.json"
+    cell_hashes = {}
+    if hash_file.exists():
+        with open(hash_file, 'r') as f:
+            cell_hashes = json.load(f)
+
+    # Cells finished by an earlier run that did not get as far as saving are replayed from the journal, and are then
+    # up to date unless their inputs have changed since
+    journal = ResultsJournal(output_dir / "simulation_data.journal")
+    new_cells = []
+    for entry in journal.replay():
+        results.setdefault(entry['faction'], {}).setdefault(entry['designation'], {})[entry['target']] = entry['result']
+        cell_hashes.setdefault(entry['faction'], {}).setdefault(entry['designation'], {})[entry['target']] = entry['hash']
+        new_cells.append((entry['faction'], entry['designation'], entry['result']['phase'], entry['target'],
+                          entry['result']))
+    if new_cells:
+        print(f"Resumed {len(new_cells)} cell(s) from {journal.path}")
     
-    # Run simulations for each attacker against each target
+    # Every attacker against every target whose inputs changed since it was stored is one task
+    tasks = []
+    task_hashes = []
     for designation, attacker_config in attackers.items():
         faction = clean_string(attacker_config['faction'])
         
-        # Initialize faction in results if not exists
-        if faction not in results:
-            results[faction] = {}
-        
-        # Skip if this designation already exists in the results
-        if designation in results[faction]:
-            print(f"Skipping {faction} - {designation} (already simulated)")
-            continue
-        
-        # Initialize designation in results
-        results[faction][designation] = {}
-        
-        # Determine phase for this attacker
-        phase = determine_phase(attacker_config['units'][0]['weapons'])
+        # Initialize faction and designation in results if not exists
+        results.setdefault(faction, {}).setdefault(designation, {})
+        stored_hashes = cell_hashes.setdefault(faction, {}).setdefault(designation, {})
         
-        # Run simulations against each target
+        stale_targets = []
         for target_data in targets:
             target_name = target_data['name']
-            print(f"Simulating {faction} - {designation} vs {target_name}")
-            
-            try:
-                # Run simulation
-                mean_damage, std_damage, mean_models, std_models = run_simulation(
-                    simulator, attacker_config, target_data
-                )
-
-                # Calculate points killed per point
-                fractional_mean_models_killed = mean_damage / target_data['models'][target_name]['W']
-                std_dev_fmmk = std_damage / target_data['models'][target_name]['W']
-                pkpp = fractional_mean_models_killed * target_data['points'] / attacker_config['points']
-                std_dev_pkpp = std_dev_fmmk * target_data['points'] / attacker_config['points']
-                
-                # Store results
-                results[faction][designation][target_name] = {
-                    'phase': phase,
-                    'mean_damage': mean_damage,
-                    'std_damage': std_damage,
-                    'mean_models_killed': fractional_mean_models_killed,
-                    'std_models_killed': std_dev_fmmk,
-                    'pnts_killed_per_point': pkpp,
-                    'std_dev_pnts_killed_per_point': std_dev_pkpp
-                }
-            except Exception as e:
-                print(f"Error simulating {faction} - {designation} vs {target_name}: {str(e)}")
-                print(f"Debug: Attacker config: {json.dumps(attacker_config, indent=2)}")
-                print(f"Debug: Target data: {json.dumps(target_data, indent=2)}")
-                import traceback
-                traceback.print_exc()
-                continue
+            current_hash = cell_hash(attacker_config, target_data, num_simulations, exact, seed, tolerance,
+                                     pkpp_tolerance, max_simulations, common_random_numbers, sampled,
+                                     aggregated)
+            # Cells without a stored hash predate hashing, so their inputs are unknown and they are recomputed
+            if (force or target_name not in results[faction][designation]
+                    or stored_hashes.get(target_name) != current_hash):
+                tasks.append((faction, designation, attacker_config, target_data))
+                task_hashes.append(current_hash)
+                stale_targets.append(target_name)
+
+        # Skip if every cell of this designation is up to date
+        if not stale_targets:
+            print(f"Skipping {faction} - {designation} (up to date)")
+        elif len(stale_targets) < len(targets):
+            print(f"Updating {faction} - {designation} against {len(stale_targets)} changed target(s)")
+
+    # Run simulations for each attacker against each target, longest first when in parallel so that a few
+    # expensive cells do not straggle at the end
+    costs = [estimate_cell_cost(attacker_config, target_data) for _, _, attacker_config, target_data in tasks]
+    order = list(range(len(tasks)))
+    if workers > 1:
+        order.sort(key=lambda index: -costs[index])
+    cell_results = {}
+    cell_profiles = []
+    total_cost = sum(costs) or 1.0
+    done_cost = 0.0
+    start_time = time.time()
+
+    def record(index: int, stats, error: Optional[str], profile_report: Optional[Dict]):
+        nonlocal done_cost
+        faction, designation, attacker_config, target_data = tasks[index]
+        target_name = target_data['name']
+        cell_results[index] = None
+        if stats is not None:
+            phase = determine_phase(attacker_config['units'][0]['weapons'])
+            cell_results[index] = cell_result(phase, attacker_config['points'], target_data, stats)
+            journal.append(faction, designation, target_name, task_hashes[index], cell_results[index])
+        if profile_report is not None:
+            cell_profiles.append({'faction': faction, 'designation': designation, 'target': target_name,
+                                  **profile_report})
+        done_cost += costs[index]
+        elapsed = time.time() - start_time
+        eta = elapsed * (total_cost - done_cost) / max(done_cost, 1e-9)
+        print(f"[{len(cell_results)}/{len(tasks)}] Simulated {faction} - {designation} vs {target_name} "
+              f"({elapsed:.0f}s elapsed, ETA {eta:.0f}s)")
+        if error is not None:
+            print(f"Error simulating {faction} - {designation} vs {target_name}: {error.strip().splitlines()[-1]}")
+            print(f"Debug: Attacker config: {json.dumps(attacker_config, indent=2)}")
+            print(f"Debug: Target data: {json.dumps(target_data, indent=2)}")
+            print(error)
+
+    # The journal is closed, and synced, however the loop exits
+    with journal:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(run_cell, tasks[index][2], tasks[index][3], exact, seed, tasks[index][1],
+                                           num_simulations, tolerance, pkpp_tolerance, max_simulations,
+                                           common_random_numbers, profile, sampled, aggregated): index
+                           for index in order}
+                for future in as_completed(futures):
+                    record(futures[future], *future.result())
+        else:
+            for index in order:
+                record(index, *run_cell(tasks[index][2], tasks[index][3], exact, seed, tasks[index][1],
+                                        num_simulations, tolerance, pkpp_tolerance, max_simulations,
+                                        common_random_numbers, profile, sampled, aggregated))
+
+    # Store results in attacker and target order, whatever order the cells finished in
+    for index, (faction, designation, attacker_config, target_data) in enumerate(tasks):
+        if cell_results[index] is None:
+            continue
+        cell_hashes[faction][designation][target_data['name']] = task_hashes[index]
+        new_cells.append((faction, designation, cell_results[index]['phase'], target_data['name'],
+                          cell_results[index]))
     
-    # Save results (appending to existing data)
-    with open(output_file, 'w') as f:
-        json.dump(results, f, indent=2)
+    # Compact the journal into the results store (appending to existing data) and the JSON view of it, and only remove
+    # the journal once everything is on disk
+    store.append(new_cells)
+    if len(store) > 2 * len(store.latest()):
+        store.compact()
+    store.export_json(output_file)
+    atomic_write_json(hash_file, cell_hashes)
+    journal.discard()
     
     print(f"Simulation complete. Results saved to {output_file}")
+    if profile:
+        write_profile_report(output_dir / "simulation_profile.json", cell_profiles)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Simulate every attacker in attacker_array.json against the standard targets")
+    parser.add_argument("--exact", action="store_true",
+                        help="compute exact distributions instead of simulating (attackers with one-use rules are still simulated)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="root random seed; every cell gets its own stream derived from it, so runs are reproducible")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes to run cells in, longest first")
+    parser.add_argument("--force", action="store_true",
+                        help="recompute every cell, even those whose inputs have not changed")
+    parser.add_argument("--num-simulations", type=int, default=2000,
+                        help="trials per cell; with a tolerance, the minimum trials per cell")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="keep simulating each cell until the standard error of its mean is at most this fraction "
+                             "of the mean")
+    parser.add_argument("--pkpp-tolerance", type=float, default=None,
+                        help="keep simulating each cell until the standard error of its points killed per point is at "
+                             "most this")
+    parser.add_argument("--max-simulations", type=int, default=None,
+                        help="most trials per cell with a tolerance")
+    parser.add_argument("--crn", action="store_true",
+                        help="common random numbers: every cell rolls the same dice, for less noisy comparisons "
+                             "between targets and between attackers")
+    parser.add_argument("--profile", action="store_true",
+                        help="time every cell and each stage of its attacks, and write the breakdown to "
+                             "simulation_profile.json")
+    parser.add_argument("--sampled", action="store_true",
+                        help="draw whole attacks from their exact outcome distribution instead of rolling every die "
+                             "(attackers with one-use rules are still rolled)")
+    parser.add_argument("--aggregated", action="store_true",
+                        help="resolve trials one at a time with each weapon's attack outcomes drawn together, "
+                             "instead of with the batch engine (about twice as fast as rolling every die, but slower "
+                             "than the batch engine)")
+    args = parser.parse_args()
+    main(exact=args.exact, seed=args.seed, workers=args.workers, num_simulations=args.num_simulations, force=args.force,
+         tolerance=args.tolerance, pkpp_tolerance=args.pkpp_tolerance, max_simulations=args.max_simulations,
+         common_random_numbers=args.crn, profile=args.profile, sampled=args.sampled,
+         aggregated=args.aggregated)
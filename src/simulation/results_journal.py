@@ -0,0 +1,125 @@
+"""
+Crash-safe journal of finished fight-matrix cells.
+
+Each cell is appended to a JSON-lines journal as soon as it finishes, and the journal is fsynced every few cells. If a
+run dies part way through (an exception, running out of memory, Ctrl-C), the next run replays the journal and only
+simulates the cells that are still missing. At the end of a run the journal is compacted into the results files, which
+are replaced atomically, and then removed.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+# Fsync the journal after this many cells, or this many seconds, whichever comes first
+FSYNC_EVERY_CELLS = 20
+FSYNC_EVERY_SECONDS = 5.0
+
+
+class ResultsJournal:
+    """Append-only journal of cell results; use as a context manager so it is flushed and closed on any exit"""
+
+    def __init__(self, path: Path, fsync_every_cells: int = FSYNC_EVERY_CELLS,
+                 fsync_every_seconds: float = FSYNC_EVERY_SECONDS):
+        self.path = Path(path)
+        self.fsync_every_cells = fsync_every_cells
+        self.fsync_every_seconds = fsync_every_seconds
+        self.file = None
+        self.pending = 0  # Cells written since the last fsync
+        self.last_sync = time.time()
+
+    def __enter__(self) -> "ResultsJournal":
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def replay(self) -> Iterator[Dict]:
+        """Yield the cells recorded by earlier runs; a line torn by a crash mid-write is ignored"""
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(entry, dict) and {'faction', 'designation', 'target', 'hash', 'result'} <= entry.keys():
+                    yield entry
+
+    def open(self):
+        """Open the journal for appending"""
+        if self.file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # A torn final line from a crash would otherwise swallow the first new entry
+            if self.path.exists() and self.path.stat().st_size > 0:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    needs_newline = f.read(1) != b'\n'
+            else:
+                needs_newline = False
+            self.file = open(self.path, 'a', encoding='utf-8')
+            if needs_newline:
+                self.file.write('\n')
+
+    def append(self, faction: str, designation: str, target: str, cell_hash: str, result: Dict):
+        """Record a finished cell, fsyncing once enough cells or time have accumulated"""
+        entry = {'faction': faction, 'designation': designation, 'target': target, 'hash': cell_hash,
+                 'result': result}
+        self.file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        self.file.flush()
+        self.pending += 1
+        if (self.pending >= self.fsync_every_cells
+                or time.time() - self.last_sync >= self.fsync_every_seconds):
+            self.sync()
+
+    def sync(self):
+        """Force everything written so far to disk"""
+        if self.file is not None and self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+        self.last_sync = time.time()
+
+    def close(self):
+        """Sync and close the journal, keeping it on disk"""
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def discard(self):
+        """Close and delete the journal, once its cells are safely in the results files"""
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
+            fsync_directory(self.path.parent)
+
+
+def fsync_directory(directory: Path):
+    """Make renames and deletions in a directory durable; a no-op where directories cannot be opened (Windows)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_json(path: Path, data, indent: Optional[int] = 2):
+    """Write JSON to a temporary file and rename it over path, so readers see either the old or the new file"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(path.parent)
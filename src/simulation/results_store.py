@@ -0,0 +1,200 @@
+"""
+Columnar store of fight-matrix results.
+
+Results are kept as fixed-width binary rows (attacker id, target id, one float per metric) in simulation_data.rows, with a
+small JSON index, simulation_data_index.json, naming the attackers, targets and metrics behind the ids. The rows file is
+memory-mapped for reading and only ever appended to, so recording a cell does not rewrite the rest. When a cell is
+recorded again the latest row wins; compact() drops the superseded rows.
+
+The nested faction -> designation -> target -> metric layout of simulation_data.json is still available through
+to_nested() and export_json() for code that reads the JSON file.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from results_journal import atomic_write_json, fsync_directory
+
+# Metrics stored for every cell, in the order they appear in simulation_data.json
+METRICS = ('mean_damage', 'std_damage', 'mean_models_killed', 'std_models_killed', 'pnts_killed_per_point',
+           'std_dev_pnts_killed_per_point', 'se_mean_damage', 'se_pnts_killed_per_point', 'num_simulations')
+
+# Metrics that are counts, exported to JSON as ints
+COUNT_METRICS = ('num_simulations',)
+
+# Version of the rows and index layout
+STORE_FORMAT = 1
+
+# Where the fight matrix and the GUIs keep their results, whatever the working directory
+RESULTS_DIR = Path(__file__).parent.parent.parent / "data" / "results"
+
+
+def row_dtype(metrics) -> np.dtype:
+    """Layout of a row with one float per metric"""
+    return np.dtype([('attacker', '<u4'), ('target', '<u4'), ('values', '<f8', (len(metrics),))])
+
+
+ROW_DTYPE = row_dtype(METRICS)
+
+
+class ResultsStore:
+    """Append-only columnar results for every attacker against every target"""
+
+    def __init__(self, directory: Path, name: str = "simulation_data"):
+        directory = Path(directory)
+        self.rows_path = directory / f"{name}.rows"
+        self.index_path = directory / f"{name}_index.json"
+        self.attackers: List[Dict] = []  # faction, designation and phase of each attacker id
+        self.targets: List[str] = []  # Name of each target id
+        self.attacker_ids: Dict[Tuple[str, str], int] = {}
+        self.target_ids: Dict[str, int] = {}
+        self._latest = None  # Cached result of latest()
+
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            metrics = tuple(index.get('metrics', ()))
+            if index.get('format') != STORE_FORMAT or metrics != METRICS[:len(metrics)]:
+                raise ValueError(f"{self.index_path} was written by an incompatible version of the results store")
+            for attacker in index['attackers']:
+                self.attacker_id(attacker['faction'], attacker['designation'], attacker.get('phase'))
+            for target in index['targets']:
+                self.target_id(target)
+            if metrics != METRICS:
+                self._add_metrics(metrics)
+
+    def _add_metrics(self, metrics: Tuple[str, ...]):
+        """Rewrite a store written with fewer metrics, with the new metrics NaN"""
+        old_dtype = row_dtype(metrics)
+        old_rows = np.fromfile(self.rows_path, dtype=old_dtype) if self.rows_path.exists() else np.empty(0, old_dtype)
+        rows = np.zeros(len(old_rows), dtype=ROW_DTYPE)
+        rows['attacker'] = old_rows['attacker']
+        rows['target'] = old_rows['target']
+        rows['values'] = np.nan
+        rows['values'][:, :len(metrics)] = old_rows['values']
+        self._write_rows(rows)
+        self.save_index()
+
+    def exists(self) -> bool:
+        """Whether the store has been written"""
+        return self.index_path.exists()
+
+    def __len__(self) -> int:
+        """Number of rows, including rows superseded by later ones"""
+        if not self.rows_path.exists():
+            return 0
+        return self.rows_path.stat().st_size // ROW_DTYPE.itemsize
+
+    def attacker_id(self, faction: str, designation: str, phase: Optional[str] = None) -> int:
+        """Id of an attacker, adding it if it is new; phase is updated if given"""
+        key = (faction, designation)
+        if key not in self.attacker_ids:
+            self.attacker_ids[key] = len(self.attackers)
+            self.attackers.append({'faction': faction, 'designation': designation, 'phase': phase})
+        elif phase is not None:
+            self.attackers[self.attacker_ids[key]]['phase'] = phase
+        return self.attacker_ids[key]
+
+    def target_id(self, target: str) -> int:
+        """Id of a target, adding it if it is new"""
+        if target not in self.target_ids:
+            self.target_ids[target] = len(self.targets)
+            self.targets.append(target)
+        return self.target_ids[target]
+
+    def rows(self) -> np.ndarray:
+        """All rows, memory-mapped read-only"""
+        count = len(self)
+        if count == 0:
+            return np.empty(0, dtype=ROW_DTYPE)
+        return np.memmap(self.rows_path, dtype=ROW_DTYPE, mode='r', shape=(count,))
+
+    def latest(self) -> np.ndarray:
+        """The latest row of every cell, ordered by attacker and target id"""
+        if self._latest is None:
+            rows = self.rows()
+            keys = rows['attacker'].astype(np.int64) * len(self.targets) + rows['target']
+            # np.unique keeps the first occurrence, so look from the end to keep the latest
+            _, last = np.unique(keys[::-1], return_index=True)
+            self._latest = np.array(rows[len(rows) - 1 - last])
+        return self._latest
+
+    def matrix(self, metric: str) -> np.ndarray:
+        """attackers x targets array of one metric, NaN for cells with no results"""
+        latest = self.latest()
+        values = np.full((len(self.attackers), len(self.targets)), np.nan)
+        values[latest['attacker'], latest['target']] = latest['values'][:, METRICS.index(metric)]
+        return values
+
+    def append(self, cells: Iterable[Tuple[str, str, Optional[str], str, Dict]]):
+        """Record (faction, designation, phase, target, results) cells; metrics missing from results are NaN"""
+        cells = list(cells)
+        if not cells:
+            return
+        rows = np.zeros(len(cells), dtype=ROW_DTYPE)
+        for row, (faction, designation, phase, target, result) in zip(rows, cells):
+            row['attacker'] = self.attacker_id(faction, designation, phase)
+            row['target'] = self.target_id(target)
+            row['values'] = [result.get(metric, np.nan) for metric in METRICS]
+
+        # The index naming the ids goes to disk before the rows, so a crash in between only leaves names without rows
+        self.rows_path.parent.mkdir(parents=True, exist_ok=True)
+        self.save_index()
+        with open(self.rows_path, 'ab') as f:
+            # Drop a partial row left by a crash mid-write
+            f.truncate(len(self) * ROW_DTYPE.itemsize)
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._latest = None
+
+    def save_index(self):
+        """Write the index atomically"""
+        index = {'format': STORE_FORMAT, 'metrics': list(METRICS), 'attackers': self.attackers,
+                 'targets': self.targets}
+        atomic_write_json(self.index_path, index, indent=None)
+
+    def compact(self):
+        """Rewrite the rows file with only the latest row of every cell"""
+        self._write_rows(self.latest())
+
+    def _write_rows(self, rows: np.ndarray):
+        """Replace the rows file atomically"""
+        tmp_path = self.rows_path.with_name(self.rows_path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.rows_path)
+        fsync_directory(self.rows_path.parent)
+        self._latest = None
+
+    def to_nested(self) -> Dict:
+        """Results in the faction -> designation -> target -> metric layout of simulation_data.json"""
+        results = {}
+        for attacker in self.attackers:
+            results.setdefault(attacker['faction'], {})[attacker['designation']] = {}
+        for row in self.latest():
+            attacker = self.attackers[row['attacker']]
+            result = {'phase': attacker['phase']} if attacker['phase'] is not None else {}
+            result.update((metric, int(value) if metric in COUNT_METRICS else float(value))
+                          for metric, value in zip(METRICS, row['values']) if not np.isnan(value))
+            results[attacker['faction']][attacker['designation']][self.targets[row['target']]] = result
+        return results
+
+    def import_nested(self, results: Dict):
+        """Append every cell of results in the simulation_data.json layout"""
+        cells = []
+        for faction, designations in results.items():
+            for designation, targets in designations.items():
+                self.attacker_id(faction, designation)
+                cells.extend((faction, designation, result.get('phase'), target, result)
+                             for target, result in targets.items())
+        self.append(cells)
+        self.save_index()
+
+    def export_json(self, path: Path):
+        """Write the results as simulation_data.json, atomically"""
+        atomic_write_json(path, self.to_nested())
@@ -2,10 +2,12 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import json
 import os
-from pathlib import Path
 from typing import Dict, List
 from combat_engine import CombatEngine, Model, Weapon
 from unit_combat_simulator import UnitCombatSimulator
+from results_store import ResultsStore, RESULTS_DIR
+from faction_catalog import get_catalog
+from make_fight_matrix import cell_result
 
 class StandardSimulatorGUI:
     def __init__(self, root):
@@ -17,7 +19,7 @@ class StandardSimulatorGUI:
         
         # Initialize combat engine and simulator
         self.combat_engine = CombatEngine()
-        self.simulator = UnitCombatSimulator(num_simulations=1000, debug=False)
+        self.simulator = UnitCombatSimulator(num_simulations=1000, debug=False, batch=True, common_random_numbers=True)
         
         # Load faction data
         self.faction_data = self.load_faction_data()
@@ -107,15 +109,8 @@ class StandardSimulatorGUI:
         )
     
     def load_faction_data(self) -> Dict[str, Dict]:
-        """Load all faction data from JSON files"""
-        faction_data = {}
-        data_dir = "data/json"
-        for filename in os.listdir(data_dir):
-            if filename.endswith(".json") and not filename.startswith("zz_"):
-                faction_name = filename[:-5]  # Remove .json extension
-                with open(os.path.join(data_dir, filename), 'r') as f:
-                    faction_data[faction_name] = json.load(f)
-        return faction_data
+        """Faction data from the shared catalog; each faction's JSON file is parsed when it is first selected"""
+        return get_catalog()
     
     def load_standard_targets(self) -> List[Dict]:
         """Load the standard target array from JSON file"""
@@ -433,24 +428,21 @@ class StandardSimulatorGUI:
             return
         
         # Create results directory if it doesn't exist
-        results_dir = Path("data/results")
+        results_dir = RESULTS_DIR
         results_dir.mkdir(parents=True, exist_ok=True)
         
-        # Load existing results if any
+        # Results are appended to the results store; simulation_data.json is only read to import results from
+        # before the store
         results_file = results_dir / "simulation_data.json"
-        if results_file.exists():
+        store = ResultsStore(results_dir)
+        if not store.exists() and results_file.exists():
             with open(results_file, 'r') as f:
-                results = json.load(f)
-        else:
-            results = {}
+                store.import_nested(json.load(f))
+        cells = []
         
         # Get faction name
         faction = self.clean_string(self.attacker_faction.get())
         
-        # Initialize faction dictionary if it doesn't exist
-        if faction not in results:
-            results[faction] = {}
-        
         # Run simulation for each target
         for target in self.standard_targets:
             # Create defender model
@@ -461,6 +453,7 @@ class StandardSimulatorGUI:
                 save=target["models"][model_name]["SV"],
                 wounds=target["models"][model_name]["W"],
                 current_wounds=target["models"][model_name]["W"],
+                total_models=target.get("total_models", 1),
                 invulnerable_save=target["models"][model_name]["Inv"],
                 feel_no_pain=target["models"][model_name]["Fnp"]
             )
@@ -477,40 +470,26 @@ class StandardSimulatorGUI:
             else:
                 phase = "Mixed"
             
-            # Initialize phase dictionary if it doesn't exist
-            if phase not in results[faction]:
-                results[faction][phase] = {}
-            
-            # Initialize designation dictionary if it doesn't exist
-            if designation not in results[faction][phase]:
-                results[faction][phase][designation] = {}
-            
             # Run simulation
             damage_results = self.simulator.simulate_attacks(
                 attacking_weapons=all_weapons,
                 defending_unit=defender_model,
                 target_range=attacker_config["range"]
             )
+            if self.simulator.profiler is not None:
+                print(f"Profile of {designation} vs {target['name']}:\n{self.simulator.profiler.format()}")
+                self.simulator.profiler.clear()
             
-            # Calculate statistics
-            mean_damage = sum(damage_results["damage"]) / len(damage_results["damage"])
-            std_damage = (sum((x - mean_damage) ** 2 for x in damage_results["damage"]) / len(damage_results["damage"])) ** 0.5
-            
-            # Calculate models killed
-            mean_models_killed = sum(damage_results["models_destroyed"]) / len(damage_results["models_destroyed"])
-            std_models_killed = (sum((x - mean_models_killed) ** 2 for x in damage_results["models_destroyed"]) / len(damage_results["models_destroyed"])) ** 0.5
-            
-            # Store results under the defender model name
-            results[faction][phase][designation][target["name"]] = {
-                "mean_damage": mean_damage,
-                "std_damage": std_damage,
-                "mean_models_killed": mean_models_killed,
-                "std_models_killed": std_models_killed
-            }
-        
-        # Save results
-        with open(results_file, 'w') as f:
-            json.dump(results, f, indent=2)
+            # Store the same results as the fight matrix, under the defender model name
+            stats = (damage_results.damage.mean, damage_results.damage.std,
+                     damage_results.models_destroyed.mean, damage_results.models_destroyed.std,
+                     damage_results.damage.standard_error, damage_results.num_simulations)
+            cells.append((faction, designation, phase, target["name"],
+                          cell_result(phase, attacker_config["points"], target, stats)))
+        
+        # Save results, and the JSON view of them
+        store.append(cells)
+        store.export_json(results_file)
         
         messagebox.showinfo("Success", f"Simulation completed and results saved to {results_file}")
     
@@ -581,7 +560,8 @@ class StandardSimulatorGUI:
                 units.append({
                     "name": unit_name,
                     "weapons": weapons,
-                    "models": unit_data["models"][model_name]
+                    "models": unit_data["models"][model_name],
+                    "points": unit_data.get("points", 0)
                 })
         
         if not units:
@@ -605,6 +585,7 @@ class StandardSimulatorGUI:
         return {
             "faction": faction,
             "units": units,
+            "points": sum(unit["points"] for unit in units),
             "range": range_value,
             "special_rules": special_rules
         }
@@ -625,10 +606,20 @@ class StandardSimulatorGUI:
         debug_check = ttk.Checkbutton(self.main_frame, text="Debug Mode", variable=self.debug_var,
                                     command=self.toggle_debug)
         debug_check.grid(row=10, column=0, sticky=tk.W, pady=5)
+
+        # Prints the time spent in each stage of the attacks of every target to the console
+        self.profile_var = tk.BooleanVar(value=False)
+        profile_check = ttk.Checkbutton(self.main_frame, text="Profile Stages", variable=self.profile_var,
+                                        command=self.toggle_profiling)
+        profile_check.grid(row=10, column=1, sticky=tk.W, pady=5)
     
     def toggle_debug(self):
         """Toggle debug mode"""
-        self.simulator.debug = self.debug_var.get()
+        self.simulator.set_debug(self.debug_var.get())
+
+    def toggle_profiling(self):
+        """Toggle profiling of the engine's pipeline stages"""
+        self.simulator.set_profiling(self.profile_var.get())
     
     def filter_attacker_faction(self, event=None):
         """Filter attacker faction combobox"""
@@ -0,0 +1,90 @@
+"""
+Structured tracing of the per-attack engine.
+
+With tracing on, the engine records every die it rolls as an event: a dict with the trial number, the stage ("attacks",
+"hit", "wound", "save", "damage", "feel_no_pain", "allocate", ...), the weapon and the die's unmodified roll,
+modifier, any reroll or one-use rule used and the outcome. Events go into a ring buffer of the most recent ones and,
+optionally, a JSON-lines file, so a single trial can be pulled back out and inspected with trial_events().
+
+With tracing off the engine's tracer is None. Every call site checks for that before building an event, so the
+disabled path costs one attribute check, with no dicts or strings formatted.
+"""
+
+import json
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+
+# Events kept in memory by default
+TRACE_CAPACITY = 100_000
+
+
+class Tracer:
+    """Collects engine events; use as a context manager when writing to a file, so the file is closed on any exit"""
+
+    def __init__(self, capacity: int = TRACE_CAPACITY, path: Optional[Path] = None, echo: bool = False):
+        self.buffer: Deque[Dict] = deque(maxlen=capacity)  # The most recent events
+        self.path = Path(path) if path is not None else None
+        self.file = open(self.path, 'a', encoding='utf-8') if self.path is not None else None
+        self.echo = echo  # Print each event as it happens, as debug mode used to
+        self.trial = 0
+
+    def __enter__(self) -> "Tracer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start_trial(self):
+        """Number the events that follow as a new trial"""
+        self.trial += 1
+        if self.echo:
+            print(f"Trial {self.trial}")
+
+    def emit(self, stage: str, **fields):
+        """Record an event for a stage of an attack"""
+        event = {'trial': self.trial, 'stage': stage, **fields}
+        self.buffer.append(event)
+        if self.file is not None:
+            self.file.write(json.dumps(event, separators=(',', ':')) + '\n')
+        if self.echo:
+            print(format_event(event))
+
+    def events(self) -> List[Dict]:
+        """Events in the ring buffer, oldest first"""
+        return list(self.buffer)
+
+    def trial_events(self, trial: Optional[int] = None) -> List[Dict]:
+        """Events of one trial still in the ring buffer; the latest trial if not given"""
+        if trial is None:
+            trial = self.trial
+        return [event for event in self.buffer if event['trial'] == trial]
+
+    def clear(self):
+        """Drop the events in the ring buffer"""
+        self.buffer.clear()
+
+    def close(self):
+        """Close the events file, if any"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def format_event(event: Dict) -> str:
+    """One line describing an event, e.g. "  hit: weapon=Bolt Rifle roll=5 modifier=0 outcome=hit" """
+    fields = " ".join(f"{key}={value}" for key, value in event.items()
+                      if key not in ('trial', 'stage') and value is not None and value != ())
+    return f"  {event['stage']}: {fields}"
+
+
+def read_trace(path: Path) -> List[Dict]:
+    """Events from a JSON-lines trace file; a line torn by a crash mid-write is ignored"""
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return events
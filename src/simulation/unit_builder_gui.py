@@ -5,6 +5,7 @@ import os
 from typing import Dict, List
 from pathlib import Path
 from attacker_special_rules import SPECIAL_RULES
+from faction_catalog import get_catalog
 
 class UnitBuilderGUI:
     def __init__(self, root):
@@ -103,21 +104,8 @@ Please report any bugs to Andrew White."""
         )
         
     def load_faction_data(self) -> Dict[str, Dict]:
-        """Load all faction data from JSON files"""
-        faction_data = {}
-        # Use Path to handle paths in a cross-platform way
-        # Go up two levels from the current file to reach project root
-        data_dir = Path(__file__).parent.parent.parent / "data" / "json"
-        
-        # Ensure the directory exists
-        if not data_dir.exists():
-            raise FileNotFoundError(f"Data directory not found at {data_dir}")
-            
-        for json_file in data_dir.glob("*.json"):
-            faction_name = json_file.stem  # Get filename without extension
-            with open(json_file, 'r') as f:
-                faction_data[faction_name] = json.load(f)
-        return faction_data
+        """Faction data from the shared catalog; each faction's JSON file is parsed when it is first selected"""
+        return get_catalog()
     
     def create_attacker_section(self):
         """Create the unit selection interface"""
@@ -1,178 +1,408 @@
-import json
 import numpy as np
 import matplotlib.pyplot as plt
-from typing import List, Dict, Optional
-from combat_engine import CombatEngine, Weapon, Model
-import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Tuple, Union
+from combat_engine import CombatEngine, Weapon, Model, ONE_USE_RULES, one_use_mask
+from analytic_engine import AnalyticCombatEngine
+from rng_streams import RandomSource, StageStreams, make_rng, spawn_rngs, as_numpy_rng, as_python_random
+from faction_catalog import get_catalog
+from histogram import Histogram, SimulationResults
+from importance_sampling import TiltedStreams, TailEstimate, estimate_probability
+from tracing import Tracer
+from profiling import StageProfiler
+from defender_unit import DefenderUnit, DefenderState, model_from_profile
+import math
+
+# Trials are split into chunks of this many, each with its own random stream, so results depend on the seed and not
+# on how many workers share the chunks
+CHUNK_SIZE = 2000
+
+# Tilts tried when choosing one for importance sampling (see estimate_tail_probability)
+TILTS = (0.0, 0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 4.0)
+# The gentlest tilt whose pilot relative error is within this factor of the best is used
+PILOT_MARGIN = 1.5
+
+# Per-trial counts collected with telemetry on (see CombatEngine.resolve_attacks), in the order attacks go through them
+FUNNEL_STAGES = ("attacks", "hits", "critical_hits", "sustained_hits", "lethal_hits", "wounds", "critical_wounds",
+                 "devastating_wounds", "saves", "failed_saves", "fnp_saves", "damage_inflicted", "wasted_damage",
+                 "wasted_attacks")
+
+# Engine used by simulate_chunk_in_worker, created once per worker process
+_worker_engine: Optional[AnalyticCombatEngine] = None
 
 class UnitCombatSimulator:
-    def __init__(self, num_simulations: int = 100, debug: bool = False):
+    def __init__(self, num_simulations: int = 100, debug: bool = False, batch: bool = False,
+                 seed: Optional[int] = None, workers: int = 1, tolerance: Optional[float] = None,
+                 abs_tolerance: Optional[float] = None, max_simulations: Optional[int] = None,
+                 common_random_numbers: bool = False, tracer: Optional[Tracer] = None, telemetry: bool = False,
+                 profile: bool = False, sampled: bool = False, aggregated: bool = False):
         self.num_simulations = num_simulations
-        self.combat_engine = CombatEngine(debug=debug)
-        self.units_data = self._load_units_data()
-        self.debug = False
+        # With a tolerance, num_simulations is only the minimum: trials continue until the standard error of the mean
+        # damage is at most tolerance times the mean, or abs_tolerance, or max_simulations is reached
+        self.tolerance = tolerance
+        self.abs_tolerance = abs_tolerance
+        self.max_simulations = max_simulations
+        # Root seed for reproducible simulations; each matchup gets its own stream (see rng_streams)
+        self.seed = seed
+        # With common random numbers every matchup gets the same stream instead, so comparisons between matchups are
+        # not swamped by independent noise; without a seed, one is picked for the simulator's lifetime
+        self.common_random_numbers = common_random_numbers
+        if common_random_numbers and seed is None:
+            self.seed = int(np.random.SeedSequence().generate_state(1)[0])
+        # Debug mode prints every die; a tracer collects them as events instead (see tracing). Either way trials run
+        # one die at a time in this process.
+        self.combat_engine = CombatEngine(debug=debug, tracer=tracer)
+        self.analytic_engine = AnalyticCombatEngine(debug=debug)
+        # Resolve all trials at once with NumPy arrays when possible (see CombatEngine.resolve_attacks_batch)
+        self.batch = batch
+        # Draw whole attacks from their exact outcome distribution when possible, rather than rolling every die (see
+        # AnalyticCombatEngine.resolve_attacks_sampled)
+        self.sampled = sampled
+        # Otherwise, when trials are resolved one at a time, draw how many attacks end in each outcome rather than
+        # rolling every die (see CombatEngine.resolve_attacks_aggregated)
+        self.aggregated = aggregated
+        # Number of processes to split trials across; the pool is started on first use (see close)
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Faction name -> unit records, parsed on first use and shared with every other simulator and GUI
+        self.units_data = get_catalog()
+        # Weapon constructor arguments by (faction, unit, weapon), filled in as weapons are first created
+        self.weapon_profiles: Dict[Tuple[str, str, str], Dict] = {}
+        self.debug = debug
+        # Also count attacks, hits, wounds, saves and so on at every stage of each trial, so results show where a
+        # profile loses its damage (see SimulationResults.stages)
+        self.telemetry = telemetry
+        self.set_profiling(profile)
+
+    def close(self):
+        """Shut down the worker processes, if any were started"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def set_debug(self, debug: bool, tracer: Optional[Tracer] = None):
+        """Turn debug output or tracing of the engine on or off (see CombatEngine.set_debug)"""
+        self.debug = debug
+        self.combat_engine.set_debug(debug, tracer)
+
+    def set_profiling(self, profile: bool):
+        """
+        Turn profiling of the engine's pipeline stages on or off (see profiling). While on, the profiler's times and
+        calls add up over every simulation until cleared, and trials run in this process rather than the worker pool.
+        """
+        self.profiler = StageProfiler() if profile else None
+        self.combat_engine.profiler = self.profiler
+        self.analytic_engine.profiler = self.profiler
 
     def debug_print(self, message: str):
         """Print message only if debug mode is enabled"""
         if self.debug:
             print(message)
     
-    def _load_units_data(self) -> Dict:
-        """Load units data from JSON files"""
-        faction_data = {}
-        data_dir = "data/json"
-        for filename in os.listdir(data_dir):
-            if filename.endswith(".json"):
-                faction_name = filename[:-5]  # Remove .json extension
-                with open(os.path.join(data_dir, filename), 'r') as f:
-                    faction_data[faction_name] = json.load(f)
-        return faction_data
-    
     def get_unit_names(self) -> List[str]:
         """Get list of all unit names in the data"""
-        unit_names = []
-        for faction_data in self.units_data.values():
-            for unit in faction_data:
-                unit_names.append(unit['name'])
-        return sorted(unit_names)
+        return self.units_data.unit_names()
+
+    def get_unit_factions(self, unit_name: str) -> List[str]:
+        """Get the factions that have a unit with the given name"""
+        return self.units_data.factions_with_unit(unit_name)
+
+    def find_unit(self, unit_name: str, faction: Optional[str] = None) -> Optional[Tuple[str, Dict]]:
+        """
+        Find a unit by name, returning its faction and data.
+
+        A name shared by several factions resolves to the first faction in sorted order unless faction is given.
+        """
+        if faction is None:
+            factions = self.get_unit_factions(unit_name)
+            if not factions:
+                return None
+            if len(factions) > 1:
+                self.debug_print(f"Unit '{unit_name}' is in several factions ({', '.join(factions)}); using {factions[0]}")
+            faction = factions[0]
+        unit = self.units_data.get_unit(faction, unit_name)
+        return (faction, unit) if unit is not None else None
     
-    def get_unit_weapons(self, unit_name: str) -> List[str]:
+    def get_unit_weapons(self, unit_name: str, faction: Optional[str] = None) -> List[str]:
         """Get list of all weapons for a given unit"""
-        for faction_data in self.units_data.values():
-            for unit in faction_data:
-                if unit['name'] == unit_name:
-                    return list(unit['weapons'].keys())
-        return []
+        found = self.find_unit(unit_name, faction)
+        if found is None:
+            return []
+        return list(found[1]['weapons'].keys())
     
-    def create_weapon(self, unit_name: str, weapon_name: str) -> Optional[Weapon]:
+    def create_weapon(self, unit_name: str, weapon_name: str, faction: Optional[str] = None) -> Optional[Weapon]:
         """Create a Weapon object from the unit data"""
-        for faction_data in self.units_data.values():
-            for unit in faction_data:
-                if unit['name'] == unit_name:
-                    self.debug_print(f"Looking for weapon '{weapon_name}' in unit '{unit_name}'")
-                    self.debug_print(f"Available weapons: {list(unit['weapons'].keys())}")
-                    if weapon_name in unit['weapons']:
-                        weapon_data = unit['weapons'][weapon_name]
-                        self.debug_print(f"Found weapon data: {weapon_data}")
-                        
-                        # Combine weapon keywords and unit special rules
-                        weapon_special_rules = weapon_data.get('Keywords', [])
-                        unit_special_rules = unit.get('special_rules_attack', [])
-                        combined_special_rules = list(set(weapon_special_rules + unit_special_rules))  # Remove duplicates
-                        try:
-                            tmp_range = int(weapon_data['Range'])
-                        except ValueError:
-                            tmp_range = weapon_data['Range']
-                        
-                        return Weapon(
-                            name=weapon_name,
-                            weapon_type=weapon_data['type'],
-                            range=tmp_range,
-                            attacks=weapon_data['A'],
-                            skill=weapon_data['BS'] if 'BS' in weapon_data else weapon_data['WS'],
-                            strength=int(weapon_data['S']),
-                            ap=int(weapon_data['AP']),
-                            damage=weapon_data['D'],
-                            special_rules=combined_special_rules,
-                            target_range=0  # Will be set when simulating attacks
-                        )
-                    else:
-                        print(f"Weapon '{weapon_name}' not found in unit '{unit_name}'")
-        return None
+        found = self.find_unit(unit_name, faction)
+        if found is None:
+            return None
+        faction_name, unit = found
+        key = (faction_name, unit_name, weapon_name)
+        if key not in self.weapon_profiles:
+            self.debug_print(f"Looking for weapon '{weapon_name}' in unit '{unit_name}'")
+            self.debug_print(f"Available weapons: {list(unit['weapons'].keys())}")
+            if weapon_name not in unit['weapons']:
+                print(f"Weapon '{weapon_name}' not found in unit '{unit_name}'")
+                return None
+            weapon_data = unit['weapons'][weapon_name]
+            self.debug_print(f"Found weapon data: {weapon_data}")
+
+            # Combine weapon keywords and unit special rules
+            weapon_special_rules = weapon_data.get('Keywords', [])
+            unit_special_rules = unit.get('special_rules_attack', [])
+            combined_special_rules = list(set(weapon_special_rules + unit_special_rules))  # Remove duplicates
+            try:
+                tmp_range = int(weapon_data['Range'])
+            except ValueError:
+                tmp_range = weapon_data['Range']
+
+            self.weapon_profiles[key] = dict(
+                name=weapon_name,
+                weapon_type=weapon_data['type'],
+                range=tmp_range,
+                attacks=weapon_data['A'],
+                skill=weapon_data['BS'] if 'BS' in weapon_data else weapon_data['WS'],
+                strength=int(weapon_data['S']),
+                ap=int(weapon_data['AP']),
+                damage=weapon_data['D'],
+                special_rules=combined_special_rules,
+                target_range=0  # Will be set when simulating attacks
+            )
+        # Weapons are mutable, so every call gets its own, with its own list of special rules
+        profile = self.weapon_profiles[key]
+        return Weapon(**{**profile, 'special_rules': list(profile['special_rules'])})
     
-    def create_target_model(self, unit_name: str) -> Optional[Model]:
+    def create_target_model(self, unit_name: str, faction: Optional[str] = None) -> Optional[Model]:
         """Create a Model object from the unit data"""
-        for faction_data in self.units_data.values():
-            for unit in faction_data:
-                if unit['name'] == unit_name:
-                    characteristics = unit['models'][list(unit['models'].keys())[0]]  # Get first model's characteristics
-                    return Model(
-                        name=unit_name,
-                        toughness=int(characteristics['T']),
-                        save=int(characteristics['SV']),
-                        wounds=int(characteristics['W']),
-                        current_wounds=int(characteristics['W']),
-                        total_models=unit.get('total_models'),
-                        invulnerable_save=int(characteristics['INV']) if 'INV' in characteristics else None,
-                        feel_no_pain=int(characteristics['FNP']) if 'FNP' in characteristics else None,
-                        keywords=unit.get('keywords', []),
-                        special_rules=unit.get('special_rules_defence', [])
-                    )
-        return None
+        found = self.find_unit(unit_name, faction)
+        if found is None:
+            return None
+        unit = found[1]
+        characteristics = unit['models'][list(unit['models'].keys())[0]]  # Get first model's characteristics
+        return model_from_profile(unit_name, characteristics, unit)
+
+    def create_defender_unit(self, unit_name: str, faction: Optional[str] = None,
+                             counts: Optional[Dict[str, int]] = None) -> Optional[DefenderUnit]:
+        """
+        Create a DefenderUnit with every model profile of the unit, e.g. Nobz and their Boss Nob, so damage is
+        allocated model by model; counts gives the number of models with each profile (see
+        DefenderUnit.from_unit_data)
+        """
+        found = self.find_unit(unit_name, faction)
+        if found is None:
+            return None
+        return DefenderUnit.from_unit_data(unit_name, found[1], counts)
     
+    def get_one_use_rules(self, attacking_weapons: List[Weapon]) -> Dict[str, bool]:
+        """Find which single-use rules are available to the attacking weapons"""
+        return {key: any(rule in w.special_rules for w in attacking_weapons) for key, rule in ONE_USE_RULES.items()}
+
     def simulate_attacks(self, 
                         attacking_weapons: List[Weapon], 
-                        defending_unit: Model,
-                        target_range: int = 0) -> Dict[str, np.ndarray]:
+                        defending_unit: Union[Model, DefenderUnit],
+                        target_range: int = 0,
+                        rng: Optional[RandomSource] = None,
+                        abs_tolerance: Optional[float] = None) -> SimulationResults:
         """
         Simulate multiple attacks from a unit against a defending unit.
         
         Args:
             attacking_weapons: List of weapons in the attacking unit
-            defending_unit: The defending unit model
+            defending_unit: The defending model, standing for an endless line of identical models unless it has a
+                unit_size, or a whole DefenderUnit; attacks stop once every model of a unit is destroyed
             target_range: The distance to the target in inches
+            rng: Generator to draw the dice from. If not given, one is derived from the simulator's seed and the
+                matchup (weapons, target and range), or an unseeded one is used if there is no seed. With common random
+                numbers every matchup gets the same one.
+            abs_tolerance: Overrides the simulator's abs_tolerance for this matchup
             
         Returns:
-            Dictionary containing arrays of damage and models destroyed for each simulation
+            Histograms of the damage and models destroyed in each simulation
         """
-        damage_results = []
-        models_destroyed_results = []
-
-        # Define single-use rules
-        has_reroll_1_hit = any("Reroll 1 Hit Roll" in w.special_rules for w in attacking_weapons)
-        has_reroll_1_wound = any("Reroll 1 Wound Roll" in w.special_rules for w in attacking_weapons)
-        has_reroll_1_hit_or_wound = any("Reroll 1 Hit or Wound" in w.special_rules for w in attacking_weapons)
-        has_reroll_1_hit_wound_or_damage = any("Reroll 1 Hit or Wound or Damage" in w.special_rules for w in attacking_weapons)
-        has_flip_a_6 = any("Flip Roll to 6" in w.special_rules for w in attacking_weapons)
-        has_flip_a_6_hit = any("Flip Hit Roll to 6" in w.special_rules for w in attacking_weapons)
-        has_flip_a_6_wound = any("Flip Wound Roll to 6" in w.special_rules for w in attacking_weapons)
-        has_flip_a_6_damage = any("Flip Damage Roll to 6" in w.special_rules for w in attacking_weapons)
-        has_flip_a_6_hit_wound = any("Flip Hit or Wound Roll to 6" in w.special_rules for w in attacking_weapons)
-        one_use_rules = {
-            "has_reroll_1_hit": has_reroll_1_hit,
-            "has_reroll_1_wound": has_reroll_1_wound,
-            "has_reroll_1_hit_or_wound": has_reroll_1_hit_or_wound,
-            "has_reroll_1_hit_wound_or_damage": has_reroll_1_hit_wound_or_damage,
-            "has_flip_a_6": has_flip_a_6,
-            "has_flip_a_6_hit": has_flip_a_6_hit,
-            "has_flip_a_6_wound": has_flip_a_6_wound,
-            "has_flip_a_6_damage": has_flip_a_6_damage,
-            "has_flip_a_6_hit_wound": has_flip_a_6_hit_wound
-        }
-        
-        # Set target range for all weapons
-        for weapon in attacking_weapons:
-            weapon.target_range = target_range
+        one_use_rules = self.get_one_use_rules(attacking_weapons)
+
+        if rng is None and self.common_random_numbers:
+            rng = make_rng(self.seed)
+        elif rng is None:
+            rng = make_rng(self.seed, *[weapon.name for weapon in attacking_weapons], defending_unit.name, target_range)
+
+        if abs_tolerance is None:
+            abs_tolerance = self.abs_tolerance
+        if self.tolerance is None and abs_tolerance is None:
+            # Each chunk of trials gets its own stream, so the results are the same however the chunks are shared out
+            chunk_sizes = [min(CHUNK_SIZE, self.num_simulations - start)
+                           for start in range(0, self.num_simulations, CHUNK_SIZE)]
+            chunk_rngs = spawn_rngs(rng, len(chunk_sizes)) if len(chunk_sizes) > 1 else [as_numpy_rng(rng)]
+            return self.run_chunks(attacking_weapons, defending_unit, target_range, chunk_sizes, chunk_rngs,
+                                   one_use_rules)
+
+        # Sequential stopping: after the minimum number of trials, estimate from the spread so far how many more are
+        # needed to reach the tolerance and run them, until it is reached. Only the results decide how many trials are
+        # run, so the results are the same however many workers there are.
+        rng = as_numpy_rng(rng)
+        results = SimulationResults()
+        max_simulations = max(self.max_simulations or self.num_simulations, self.num_simulations)
+        block = self.num_simulations
+        while block > 0:
+            chunk_sizes = [min(CHUNK_SIZE, block - start) for start in range(0, block, CHUNK_SIZE)]
+            results.merge(self.run_chunks(attacking_weapons, defending_unit, target_range, chunk_sizes,
+                                          spawn_rngs(rng, len(chunk_sizes)), one_use_rules))
+            target_error = self.target_standard_error(results, abs_tolerance)
+            if results.damage.standard_error <= target_error:
+                break
+            needed = math.ceil((results.damage.std / target_error) ** 2) + 1 if target_error > 0 else max_simulations
+            block = min(max(needed - results.num_simulations, CHUNK_SIZE), max_simulations - results.num_simulations)
+        self.debug_print(f"Stopped after {results.num_simulations} simulations, standard error of mean damage "
+                         f"{results.damage.standard_error:.4f}")
+        return results
+
+    def target_standard_error(self, results: SimulationResults, abs_tolerance: Optional[float] = None) -> float:
+        """Standard error of the mean damage at which sequential stopping stops, for the results so far"""
+        target_error = 0.0
+        if self.tolerance is not None:
+            target_error = self.tolerance * results.damage.mean
+        if abs_tolerance is not None:
+            target_error = max(target_error, abs_tolerance)
+        return target_error
+
+    def run_chunks(self, attacking_weapons: List[Weapon], defending_unit: Model, target_range: int,
+                   chunk_sizes: List[int], chunk_rngs: List[np.random.Generator],
+                   one_use_rules: Dict[str, bool]) -> SimulationResults:
+        """Run chunks of trials, each with its own stream, in the worker pool if there is one, and merge them"""
+        if (self.workers > 1 and len(chunk_sizes) > 1 and self.combat_engine.tracer is None
+                and self.profiler is None):
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            chunks = list(self._executor.map(simulate_chunk_in_worker,
+                                             [self.batch] * len(chunk_sizes),
+                                             [attacking_weapons] * len(chunk_sizes),
+                                             [defending_unit] * len(chunk_sizes),
+                                             [target_range] * len(chunk_sizes),
+                                             chunk_sizes, chunk_rngs,
+                                             [one_use_rules] * len(chunk_sizes),
+                                             [self.telemetry] * len(chunk_sizes),
+                                             [self.sampled] * len(chunk_sizes),
+                                             [self.aggregated] * len(chunk_sizes)))
+        else:
+            sampler = self.analytic_engine if self.sampled else None
+            chunks = [simulate_chunk(self.combat_engine, self.batch, attacking_weapons, defending_unit, target_range,
+                                     chunk_size, chunk_rng, one_use_rules, self.telemetry, sampler, self.aggregated)
+                      for chunk_size, chunk_rng in zip(chunk_sizes, chunk_rngs)]
+
+        results = SimulationResults()
+        for chunk in chunks:
+            results.merge(chunk)
+        return results
+    
+    def estimate_tail_probability(self,
+                                  attacking_weapons: List[Weapon],
+                                  defending_unit: Model,
+                                  threshold: int,
+                                  metric: str = "models_destroyed",
+                                  below: bool = False,
+                                  target_range: int = 0,
+                                  rng: Optional[RandomSource] = None,
+                                  confidence: float = 0.95,
+                                  theta: Optional[float] = None,
+                                  pilot_simulations: int = CHUNK_SIZE) -> TailEstimate:
+        """
+        Estimate the probability of a rare outcome by importance sampling (see importance_sampling).
+
+        The dice are tilted towards the outcome and each trial is weighted by its likelihood ratio, which estimates
+        far-tail probabilities to a useful precision with orders of magnitude fewer trials than simulate_attacks.
+        num_simulations trials are run with the batch engine, in this process. The target must be a Model.
+
+        Args:
+            attacking_weapons: List of weapons in the attacking unit
+            defending_unit: The defending unit model
+            threshold: The outcome is at least this much of the metric, or fewer than this with below
+            metric: "models_destroyed" or "damage"
+            below: Estimate the probability of fewer than threshold instead, e.g. threshold 1 and below for the chance
+                the target survives
+            target_range: The distance to the target in inches
+            rng: Generator to draw the dice from; derived from the simulator's seed and the question if not given
+            confidence: Coverage of the confidence interval
+            theta: Tilt to use; if not given, each of TILTS is tried on pilot_simulations trials and the gentlest one
+                close to the smallest relative error (see PILOT_MARGIN) is used
+
+        Returns:
+            The estimated probability with its standard error and confidence interval
+        """
+        if metric not in ("models_destroyed", "damage"):
+            raise ValueError(f"Unknown metric '{metric}'")
+        if any(self.get_one_use_rules(attacking_weapons).values()):
+            raise ValueError("One-use rules cannot be importance sampled; use simulate_attacks instead")
+        if not isinstance(defending_unit, Model):
+            raise ValueError("A DefenderUnit cannot be importance sampled; use simulate_attacks instead")
+
+        if rng is None:
+            rng = make_rng(self.seed, *[weapon.name for weapon in attacking_weapons], defending_unit.name, target_range,
+                           "importance sampling", metric, threshold, below)
+        pilot_rng, rng = spawn_rngs(rng, 2)
+        outcome = (threshold, metric, below, confidence)
+
+        if theta is None:
+            # Every tilt gets the same pilot stream, so they are compared on the same dice as far as possible
+            pilots = [self.run_tilted(attacking_weapons, defending_unit, target_range, -tilt if below else tilt,
+                                      pilot_simulations, pilot_rng, *outcome)
+                      for tilt in TILTS]
+            # Over-tilted pilots rarely see the heavily weighted trials that make their error large, so they look
+            # better than they are; take the gentlest tilt that comes close to the best
+            best = min(pilot.relative_error for pilot in pilots)
+            theta = next(pilot.theta for pilot in pilots if pilot.relative_error <= PILOT_MARGIN * best)
+            self.debug_print("Pilot relative errors: " + ", ".join(f"{pilot.theta:+.1f}: {pilot.relative_error:.3f}"
+                                                                     for pilot in pilots))
+
+        result = self.run_tilted(attacking_weapons, defending_unit, target_range, theta, self.num_simulations, rng,
+                                 *outcome)
+        self.debug_print(f"P = {result.probability:.3g} +/- {result.standard_error:.2g} from {result.hits} of "
+                         f"{result.num_simulations} trials with tilt {theta:+.1f}")
+        return result
+
+    def run_tilted(self, attacking_weapons: List[Weapon], defending_unit: Model, target_range: int, theta: float,
+                   num_simulations: int, rng: np.random.Generator, threshold: int, metric: str, below: bool,
+                   confidence: float) -> TailEstimate:
+        """Run trials with the dice tilted by theta, in chunks, and estimate the probability of the outcome"""
+        chunk_sizes = [min(CHUNK_SIZE, num_simulations - start) for start in range(0, num_simulations, CHUNK_SIZE)]
+        chunks = [simulate_chunk_tilted(self.combat_engine, attacking_weapons, defending_unit, target_range,
+                                        chunk_size, chunk_rng, theta)
+                  for chunk_size, chunk_rng in zip(chunk_sizes, spawn_rngs(rng, len(chunk_sizes)))]
+        damage = np.concatenate([chunk[0] for chunk in chunks])
+        models_destroyed = np.concatenate([chunk[1] for chunk in chunks])
+        log_weights = np.concatenate([chunk[2] for chunk in chunks])
+        values = damage if metric == "damage" else models_destroyed
+        reached = values < threshold if below else values >= threshold
+        return estimate_probability(reached, log_weights, theta, confidence)
+
+    def compute_exact_distribution(self,
+                                   attacking_weapons: List[Weapon],
+                                   defending_unit: Model,
+                                   target_range: int = 0) -> Dict[str, np.ndarray]:
+        """
+        Compute the exact distribution of damage and models destroyed, without simulation.
         
-        for _ in range(self.num_simulations):
-            # Reset defending unit's wounds for each simulation
-            defending_unit.current_wounds = defending_unit.wounds
-            
-            # Calculate total damage and models destroyed
-            total_damage = 0
-            for weapon in attacking_weapons:
-                results = self.combat_engine.resolve_attacks(weapon, defending_unit, one_use_rules)
-                total_damage += results["damage_dealt"]
-            
-            # Calculate models destroyed based on total damage
-            models_destroyed = total_damage // defending_unit.wounds  # Integer division to round down
+        Args:
+            attacking_weapons: List of weapons in the attacking unit
+            defending_unit: The defending unit model
+            target_range: The distance to the target in inches
             
-            damage_results.append(total_damage)
-            models_destroyed_results.append(models_destroyed)
+        Returns:
+            Dictionary containing probability mass functions of damage and models destroyed, indexed by value
+        """
+        if any(self.get_one_use_rules(attacking_weapons).values()):
+            raise ValueError("One-use rules cannot be resolved exactly; use simulate_attacks instead")
+        if not isinstance(defending_unit, Model):
+            raise ValueError("A DefenderUnit cannot be resolved exactly; use simulate_attacks instead")
 
-        return {
-            "damage": np.array(damage_results),
-            "models_destroyed": np.array(models_destroyed_results)
-        }
-    
-    def plot_results(self, results: Dict[str, np.ndarray], title: str = "Combat Simulation Results",
+        return self.analytic_engine.resolve_distribution(attacking_weapons, defending_unit, target_range)
+
+    def plot_results(self, results: SimulationResults, title: str = "Combat Simulation Results",
                     show_regular: bool = True, show_cumulative: bool = True,
                     show_damage: bool = True, show_models: bool = True):
         """
         Create histograms and cumulative histograms for damage and models destroyed.
         
         Args:
-            results: Dictionary containing arrays of damage and models destroyed
+            results: Histograms of damage and models destroyed, from simulate_attacks
             title: Title for the plot
             show_regular: Whether to show regular histograms
             show_cumulative: Whether to show cumulative histograms
@@ -194,43 +424,18 @@ class UnitCombatSimulator:
         elif n_cols == 1:
             axes = axes.reshape(-1, 1)
             
-        # Calculate appropriate bin ranges
-        damage_bins = np.arange(min(results["damage"]), max(results["damage"]) + 2) - 0.5
-        models_bins = np.arange(min(results["models_destroyed"]), max(results["models_destroyed"]) + 2) - 0.5
-        
         row = 0
         col = 0
         
         # Regular histograms
         if show_regular:
             if show_damage:
-                axes[row, col].hist(results["damage"], bins=damage_bins, alpha=0.7, color='blue')
-                axes[row, col].set_title("Damage Distribution")
-                axes[row, col].set_xlabel("Damage")
-                axes[row, col].set_ylabel("Frequency")
-                axes[row, col].set_xticks(range(min(results["damage"]), max(results["damage"]) + 1))
-                # Calculate and display mean and std
-                mean = np.mean(results["damage"])
-                std = np.std(results["damage"])
-                stats_text = f"Mean: {mean:.2f}\nStd Dev: {std:.2f}"
-                # Place in upper right
-                axes[row, col].text(0.98, 0.98, stats_text, transform=axes[row, col].transAxes,
-                                    fontsize=12, color='black', ha='right', va='top', bbox=dict(facecolor='white', alpha=0.7, edgecolor='none'))
+                self.plot_histogram(axes[row, col], results.damage, "Damage Distribution", "Damage", 'blue')
                 col += 1
                 
             if show_models:
-                axes[row, col].hist(results["models_destroyed"], bins=models_bins, alpha=0.7, color='red')
-                axes[row, col].set_title("Models Destroyed Distribution")
-                axes[row, col].set_xlabel("Models Destroyed")
-                axes[row, col].set_ylabel("Frequency")
-                axes[row, col].set_xticks(range(min(results["models_destroyed"]), max(results["models_destroyed"]) + 1))
-                # Calculate and display mean and std
-                mean = np.mean(results["models_destroyed"])
-                std = np.std(results["models_destroyed"])
-                stats_text = f"Mean: {mean:.2f}\nStd Dev: {std:.2f}"
-                # Place in upper right
-                axes[row, col].text(0.98, 0.98, stats_text, transform=axes[row, col].transAxes,
-                                    fontsize=12, color='black', ha='right', va='top', bbox=dict(facecolor='white', alpha=0.7, edgecolor='none'))
+                self.plot_histogram(axes[row, col], results.models_destroyed, "Models Destroyed Distribution",
+                                    "Models Destroyed", 'red')
 
             row += 1
             col = 0
@@ -238,51 +443,192 @@ class UnitCombatSimulator:
         # Cumulative histograms
         if show_cumulative:
             if show_damage:
-                # Calculate survival probability (1 - cumulative probability)
-                damage_hist, damage_bins = np.histogram(results["damage"], bins=damage_bins, density=True)
-                damage_cumsum = np.cumsum(damage_hist) * np.diff(damage_bins)[0]
-                damage_survival = 1 - damage_cumsum
-                
-                # Center bars on tick marks
-                bar_width = 0.8  # Width of bars relative to bin width
-                bin_centers = damage_bins[:-1] + 0.5  # Center of each bin
-                axes[row, col].bar(bin_centers, damage_survival, width=bar_width, alpha=0.7, color='blue')
-                axes[row, col].set_title("Probability of at least N damage")
-                axes[row, col].set_xlabel("Damage")
-                axes[row, col].set_ylabel("Probability")
-                axes[row, col].set_xticks(range(min(results["damage"]), max(results["damage"]) + 1))
+                self.plot_survival(axes[row, col], results.damage, "Probability of at least N damage", "Damage", 'blue')
                 col += 1
                 
             if show_models:
-                # Calculate survival probability (1 - cumulative probability)
-                models_hist, models_bins = np.histogram(results["models_destroyed"], bins=models_bins, density=True)
-                total_runs = len(results["models_destroyed"])  # Use actual number of simulations
-                
-                # Calculate cumulative probabilities
-                cumulative_counts = np.cumsum(models_hist[::-1])[::-1]
-                cumulative_probabilities = cumulative_counts #/ total_runs
-                
-                # Center bars on tick marks
-                bar_width = 0.8  # Width of bars relative to bin width
-                bin_centers = models_bins[:-1] + 0.5  # Center of each bin
-                
-                # Ensure bin_centers and probabilities have the same length
-                if len(bin_centers) != len(cumulative_probabilities):
-                    # If they don't match, use the shorter length
-                    min_length = min(len(bin_centers), len(cumulative_probabilities))
-                    bin_centers = bin_centers[:min_length]
-                    cumulative_probabilities = cumulative_probabilities[:min_length]
-                
-                axes[row, col].bar(bin_centers, cumulative_probabilities, width=bar_width, alpha=0.7, color='red')
-                axes[row, col].set_title("Probability of at least N models destroyed")
-                axes[row, col].set_xlabel("Models Destroyed")
-                axes[row, col].set_ylabel("Probability")
-                axes[row, col].set_xticks(range(min(results["models_destroyed"]), max(results["models_destroyed"]) + 1))
+                self.plot_survival(axes[row, col], results.models_destroyed, "Probability of at least N models destroyed",
+                                   "Models Destroyed", 'red')
         
         plt.suptitle(title)
         plt.tight_layout()
         plt.show()
 
+    def plot_histogram(self, ax, histogram: Histogram, title: str, xlabel: str, color: str):
+        """Bar chart of how many trials had each result, with the mean and standard deviation"""
+        values = np.arange(histogram.min, histogram.max + 1)
+        ax.bar(values, histogram.counts[values], width=1.0, alpha=0.7, color=color)
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel("Frequency")
+        ax.set_xticks(values)
+        # Calculate and display mean and std
+        stats_text = f"Mean: {histogram.mean:.2f}\nStd Dev: {histogram.std:.2f}"
+        # Place in upper right
+        ax.text(0.98, 0.98, stats_text, transform=ax.transAxes,
+                fontsize=12, color='black', ha='right', va='top', bbox=dict(facecolor='white', alpha=0.7, edgecolor='none'))
+
+    def plot_survival(self, ax, histogram: Histogram, title: str, xlabel: str, color: str):
+        """Bar chart of the probability of at least each result"""
+        values = np.arange(histogram.min, histogram.max + 1)
+        # Center bars on tick marks
+        bar_width = 0.8  # Width of bars relative to bin width
+        ax.bar(values, histogram.survival()[values], width=bar_width, alpha=0.7, color=color)
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel("Probability")
+        ax.set_xticks(values)
+
+def simulate_chunk(combat_engine: CombatEngine, batch: bool, attacking_weapons: List[Weapon],
+                   defending_unit: Union[Model, DefenderUnit],
+                   target_range: int, num_simulations: int, rng: np.random.Generator,
+                   one_use_rules: Dict[str, bool], telemetry: bool = False,
+                   sampler: Optional[AnalyticCombatEngine] = None, aggregated: bool = False) -> SimulationResults:
+    """
+    Run one chunk of trials of UnitCombatSimulator.simulate_attacks in this process, sampling whole attacks with the
+    sampler if given, where it can, and resolving trials one at a time with stage-aggregated counts if aggregated
+    """
+    one_use = one_use_mask(one_use_rules)
+    # Sampled attacks have no dice to trace or count at each stage, and are drawn against a single profile
+    if (sampler is not None and combat_engine.tracer is None and not telemetry and not one_use
+            and isinstance(defending_unit, Model)):
+        return simulate_chunk_sampled(sampler, attacking_weapons, defending_unit, target_range, num_simulations, rng)
+    # The batch engine is not traced, and only spends one-use rules against a Model
+    if batch and combat_engine.tracer is None and (not one_use or isinstance(defending_unit, Model)):
+        return simulate_chunk_batch(combat_engine, attacking_weapons, defending_unit, target_range, num_simulations, rng,
+                                    telemetry, one_use)
+
+    chunk_results = SimulationResults()
+    stage_counts = {stage: np.zeros(num_simulations, dtype=np.int64) for stage in FUNNEL_STAGES} if telemetry else None
+    python_random = as_python_random(rng)
+    for trial in range(num_simulations):
+        if combat_engine.tracer is not None:
+            combat_engine.tracer.start_trial()
+        # Each simulation starts with a fresh defending model or unit and unspent one-use rules
+        context = combat_engine.make_context(defending_unit, target_range, one_use, python_random)
+        
+        # Calculate total damage and models destroyed
+        total_damage = 0
+        index = 0
+        while index < len(attacking_weapons):
+            weapon = attacking_weapons[index]
+            quantity = 1
+            if aggregated:
+                # Copies of the same weapon in a row have their attacks drawn together, as in simulate_chunk_batch
+                while index + quantity < len(attacking_weapons) and attacking_weapons[index + quantity] is weapon:
+                    quantity += 1
+                results = combat_engine.resolve_attacks_aggregated(weapon, defending_unit, context, rng, quantity)
+            else:
+                results = combat_engine.resolve_attacks(weapon, defending_unit, context)
+            total_damage += results["damage_dealt"]
+            if stage_counts is not None:
+                for stage, counts in stage_counts.items():
+                    counts[trial] += results[stage]
+            index += quantity
+        
+        # Models destroyed as counted by allocation
+        chunk_results.damage.add(total_damage)
+        chunk_results.models_destroyed.add(context.model)
+
+    if stage_counts is not None:
+        chunk_results.stages = {stage: Histogram.from_values(counts) for stage, counts in stage_counts.items()}
+    return chunk_results
+
+def simulate_chunk_batch(combat_engine: CombatEngine, attacking_weapons: List[Weapon],
+                         defending_unit: Union[Model, DefenderUnit], target_range: int, num_simulations: int,
+                         rng: np.random.Generator, telemetry: bool = False, one_use: int = 0) -> SimulationResults:
+    """Run a chunk of trials at once with the batch engine, each starting with the one-use rules in one_use"""
+    if isinstance(defending_unit, Model):
+        state = DefenderState(np.zeros(num_simulations, dtype=np.int64),
+                              np.full(num_simulations, defending_unit.wounds, dtype=np.int64))
+    else:
+        state = DefenderState.fresh(defending_unit, num_simulations)
+    total_damage = np.zeros(num_simulations, dtype=np.int64)
+    stage_counts = {stage: np.zeros(num_simulations, dtype=np.int64) for stage in FUNNEL_STAGES} if telemetry else None
+    # Each trial's one-use rules not yet spent, as a bitmask shared by its weapons
+    one_use_rules = np.full(num_simulations, one_use, dtype=np.int64) if one_use else None
+    # The weapons draw from the same streams one after another, so the dice line up between matchups
+    streams = StageStreams(rng)
+    # Copies of the same weapon in a row (from [weapon] * quantity) are resolved together
+    index = 0
+    while index < len(attacking_weapons):
+        weapon = attacking_weapons[index]
+        quantity = 1
+        while index + quantity < len(attacking_weapons) and attacking_weapons[index + quantity] is weapon:
+            quantity += 1
+        results = combat_engine.resolve_attacks_batch(weapon, defending_unit, num_simulations, streams,
+                                                      state.current_wounds, quantity, target_range, state.model,
+                                                      one_use_rules)
+        total_damage += results["damage_dealt"]
+        if stage_counts is not None:
+            for stage, counts in stage_counts.items():
+                counts += results[stage]
+        index += quantity
+
+    chunk_results = SimulationResults(Histogram.from_values(total_damage), Histogram.from_values(state.model))
+    if stage_counts is not None:
+        chunk_results.stages = {stage: Histogram.from_values(counts) for stage, counts in stage_counts.items()}
+    return chunk_results
+
+def simulate_chunk_sampled(sampler: AnalyticCombatEngine, attacking_weapons: List[Weapon], defending_unit: Model,
+                           target_range: int, num_simulations: int, rng: np.random.Generator) -> SimulationResults:
+    """Run a chunk of trials at once, drawing whole attacks from their outcome distribution"""
+    current_wounds = np.full(num_simulations, defending_unit.wounds, dtype=np.int64)
+    models = np.zeros(num_simulations, dtype=np.int64)
+    total_damage = np.zeros(num_simulations, dtype=np.int64)
+    index = 0
+    while index < len(attacking_weapons):
+        weapon = attacking_weapons[index]
+        quantity = 1
+        while index + quantity < len(attacking_weapons) and attacking_weapons[index + quantity] is weapon:
+            quantity += 1
+        results = sampler.resolve_attacks_sampled(weapon, defending_unit, num_simulations, rng, current_wounds,
+                                                  quantity, target_range, models)
+        total_damage += results["damage_dealt"]
+        index += quantity
+
+    return SimulationResults(Histogram.from_values(total_damage), Histogram.from_values(models))
+
+def simulate_chunk_tilted(combat_engine: CombatEngine, attacking_weapons: List[Weapon], defending_unit: Model,
+                          target_range: int, num_simulations: int, rng: np.random.Generator,
+                          theta: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Run a chunk of trials with tilted dice, returning each trial's total damage, models destroyed as counted by
+    allocation and log likelihood ratio
+    """
+    current_wounds = np.full(num_simulations, defending_unit.wounds, dtype=np.int64)
+    models = np.zeros(num_simulations, dtype=np.int64)
+    total_damage = np.zeros(num_simulations, dtype=np.int64)
+    log_weights = np.zeros(num_simulations)
+    streams = TiltedStreams(rng, theta)
+    index = 0
+    while index < len(attacking_weapons):
+        weapon = attacking_weapons[index]
+        quantity = 1
+        while index + quantity < len(attacking_weapons) and attacking_weapons[index + quantity] is weapon:
+            quantity += 1
+        results = combat_engine.resolve_attacks_batch(weapon, defending_unit, num_simulations,
+                                                      streams, current_wounds, quantity, target_range, models)
+        total_damage += results["damage_dealt"]
+        log_weights += results["log_weight"]
+        index += quantity
+
+    return total_damage, models, log_weights
+
+def simulate_chunk_in_worker(batch: bool, attacking_weapons: List[Weapon], defending_unit: Model, target_range: int,
+                             num_simulations: int, rng: np.random.Generator,
+                             one_use_rules: Dict[str, bool], telemetry: bool = False,
+                             sampled: bool = False, aggregated: bool = False) -> SimulationResults:
+    """
+    Run one chunk of trials in a worker process, reusing the process's engine and its compiled attack plans and
+    outcome tables
+    """
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = AnalyticCombatEngine()
+    return simulate_chunk(_worker_engine, batch, attacking_weapons, defending_unit, target_range, num_simulations, rng,
+                          one_use_rules, telemetry, _worker_engine if sampled else None, aggregated)
+
 def main():
     # Create simulator
     simulator = UnitCombatSimulator(num_simulations=100)
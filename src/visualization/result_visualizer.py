@@ -1,20 +1,34 @@
+import sys
 import tkinter as tk
 from tkinter import ttk
 import json
+from pathlib import Path
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import numpy as np
-from typing import Dict, List, Tuple
+from typing import List, Tuple
 import seaborn as sns
 
+sys.path.insert(0, str(Path(__file__).parent.parent / "simulation"))
+from results_store import ResultsStore, RESULTS_DIR
+
+# Metric columns behind each metric choice: mean, std
+METRIC_COLUMNS = {
+    "Damage": ("mean_damage", "std_damage"),
+    "Models Killed": ("mean_models_killed", "std_models_killed"),
+    "Points Killed per Point": ("pnts_killed_per_point", "std_dev_pnts_killed_per_point")
+}
+
 class ResultVisualizer:
     def __init__(self, root):
         self.root = root
         self.root.title("Warhammer Simulation Results Visualizer")
         
-        # Load simulation data
-        with open("data/results/simulation_data.json", 'r') as f:
-            self.simulation_data = json.load(f)
+        # Load simulation data from the results store, importing simulation_data.json if it predates the store
+        self.results = ResultsStore(RESULTS_DIR)
+        if not self.results.exists():
+            with open(RESULTS_DIR / "simulation_data.json", 'r') as f:
+                self.results.import_nested(json.load(f))
             
         # Create main frame
         self.main_frame = ttk.Frame(root, padding="10")
@@ -38,7 +52,7 @@ class ResultVisualizer:
         ttk.Label(control_frame, text="Faction:").grid(row=0, column=0, sticky=tk.W)
         self.faction_var = tk.StringVar(value="All Factions")
         self.faction_combo = ttk.Combobox(control_frame, textvariable=self.faction_var, width=30)
-        self.faction_combo['values'] = ["All Factions"] + sorted(list(self.simulation_data.keys()))
+        self.faction_combo['values'] = ["All Factions"] + sorted({attacker['faction'] for attacker in self.results.attackers})
         self.faction_combo.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=5, pady=2)
         
         # Combat type selection
@@ -140,87 +154,38 @@ class ResultVisualizer:
         ]
         
         # Filter units based on faction and combat type
-        filtered_units = []
-        for faction, units in self.simulation_data.items():
-            if selected_faction != "All Factions" and faction != selected_faction:
-                continue
-                
-            for unit, targets in units.items():
-                # Get combat type from first target (all targets for a unit have same phase)
-                combat_type = next(iter(targets.values()))["phase"]
-                if self.combat_type_var.get() != "Both" and combat_type != self.combat_type_var.get():
-                    continue
-                    
-                filtered_units.append(f"{faction} - {unit}")
+        factions = np.array([attacker['faction'] for attacker in self.results.attackers])
+        phases = np.array([attacker['phase'] for attacker in self.results.attackers])
+        selected = np.ones(len(self.results.attackers), dtype=bool)
+        if selected_faction != "All Factions":
+            selected &= factions == selected_faction
+        if self.combat_type_var.get() != "Both":
+            selected &= phases == self.combat_type_var.get()
+        filtered_units = [f"{attacker['faction']} - {attacker['designation']}"
+                          for attacker, keep in zip(self.results.attackers, selected) if keep]
             
         if not filtered_units:
             return [], [], np.array([]), np.array([])
             
-        # Get all target units in their original order
-        target_units = []
-        seen_targets = set()
-        # Use the first unit's targets to establish the order
-        first_unit = next(iter(self.simulation_data.values()))
-        first_targets = next(iter(first_unit.values()))
-        for target in first_targets.keys():
-            if target not in seen_targets:
-                target_units.append(target)
-                seen_targets.add(target)
-        
-        # Create matrices for means and standard deviations
-        means = np.zeros((len(filtered_units), len(target_units) + 3))  # +3 for the new columns
-        stds = np.zeros((len(filtered_units), len(target_units) + 3))   # +3 for the new columns
-        
-        # Fill matrices
-        for i, full_unit_name in enumerate(filtered_units):
-            faction, unit = full_unit_name.split(" - ", 1)
-            
-            # Calculate averages against small and large units
-            small_unit_values = []
-            large_unit_values = []
-            all_values = []  # For overall average
-            
-            for target in small_units:
-                if target in self.simulation_data[faction][unit]:
-                    data = self.simulation_data[faction][unit][target]
-                    if self.metric_var.get() == "Damage":
-                        small_unit_values.append(data["mean_damage"])
-                    elif self.metric_var.get() == "Models Killed":
-                        small_unit_values.append(data["mean_models_killed"])
-                    else:  # Points Killed per Point
-                        small_unit_values.append(data["pnts_killed_per_point"])
-                        
-            for target in large_units:
-                if target in self.simulation_data[faction][unit]:
-                    data = self.simulation_data[faction][unit][target]
-                    if self.metric_var.get() == "Damage":
-                        large_unit_values.append(data["mean_damage"])
-                    elif self.metric_var.get() == "Models Killed":
-                        large_unit_values.append(data["mean_models_killed"])
-                    else:  # Points Killed per Point
-                        large_unit_values.append(data["pnts_killed_per_point"])
-            
-            # Fill the main data
-            for j, target in enumerate(target_units):
-                if target in self.simulation_data[faction][unit]:
-                    data = self.simulation_data[faction][unit][target]
-                    if self.metric_var.get() == "Damage":
-                        means[i, j] = data["mean_damage"]
-                        stds[i, j] = data["std_damage"]
-                        all_values.append(data["mean_damage"])
-                    elif self.metric_var.get() == "Models Killed":
-                        means[i, j] = data["mean_models_killed"]
-                        stds[i, j] = data["std_models_killed"]
-                        all_values.append(data["mean_models_killed"])
-                    else:  # Points Killed per Point
-                        means[i, j] = data["pnts_killed_per_point"]
-                        stds[i, j] = data["std_dev_pnts_killed_per_point"]
-                        all_values.append(data["pnts_killed_per_point"])
-            
-            # Add averages to last three columns
-            means[i, -3] = np.mean(small_unit_values) if small_unit_values else 0
-            means[i, -2] = np.mean(large_unit_values) if large_unit_values else 0
-            means[i, -1] = np.mean(all_values) if all_values else 0
+        # Target units in their original order
+        target_units = list(self.results.targets)
+        
+        # Matrices for means and standard deviations, +3 columns for the averages; missing cells are NaN
+        mean_metric, std_metric = METRIC_COLUMNS[self.metric_var.get()]
+        cell_means = self.results.matrix(mean_metric)[selected]
+        cell_stds = self.results.matrix(std_metric)[selected]
+        means = np.zeros((len(filtered_units), len(target_units) + 3))
+        stds = np.zeros((len(filtered_units), len(target_units) + 3))
+        means[:, :-3] = np.nan_to_num(cell_means)
+        stds[:, :-3] = np.nan_to_num(cell_stds)
+        
+        # Averages against small units, large units and every target, over the targets each unit has results for
+        small_columns = [self.results.target_ids[target] for target in small_units if target in self.results.target_ids]
+        large_columns = [self.results.target_ids[target] for target in large_units if target in self.results.target_ids]
+        for column, target_columns in ((-3, small_columns), (-2, large_columns), (-1, slice(None))):
+            values = cell_means[:, target_columns]
+            counts = np.sum(~np.isnan(values), axis=1)
+            means[:, column] = np.where(counts > 0, np.nansum(values, axis=1) / np.maximum(counts, 1), 0)
                         
         # Add average columns to the end of target_units
         target_units = target_units + ["Avg. vs. Small", "Avg. vs. Large", "Overall Avg"]
@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+import pytest
+
+# The simulation modules import each other by bare name, as when run from src/simulation
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "simulation"))
+
+# A corner of the fight matrix small enough to run in a test
+FIGHT_MATRIX_ATTACKERS = 2
+FIGHT_MATRIX_TARGETS = ("Hormagaunts", "Intercessor Squad")
+
+
+@pytest.fixture
+def fight_matrix(tmp_path, monkeypatch):
+    """make_fight_matrix for the first attackers against a couple of targets, saving its results under tmp_path"""
+    import make_fight_matrix
+    attackers = dict(list(make_fight_matrix.load_attackers().items())[:FIGHT_MATRIX_ATTACKERS])
+    targets = [target for target in make_fight_matrix.load_targets() if target['name'] in FIGHT_MATRIX_TARGETS]
+    monkeypatch.setattr(make_fight_matrix, "RESULTS_DIR", tmp_path)
+    monkeypatch.setattr(make_fight_matrix, "load_attackers", lambda: attackers)
+    monkeypatch.setattr(make_fight_matrix, "load_targets", lambda: targets)
+    monkeypatch.setattr(make_fight_matrix, "_cell_simulator", None)
+    return make_fight_matrix
@@ -0,0 +1,80 @@
+"""
+Checks that a fight-matrix cell's hash covers everything its results depend on, so a run recomputes exactly the cells
+whose inputs changed.
+"""
+
+import copy
+import json
+import make_fight_matrix
+from make_fight_matrix import cell_hash
+
+SEED = 3
+NUM_SIMULATIONS = 200
+
+
+def cell_inputs():
+    attacker = next(iter(make_fight_matrix.load_attackers().values()))
+    target = next(target for target in make_fight_matrix.load_targets() if target['name'] == "Intercessor Squad")
+    return attacker, target
+
+
+def test_hash_is_canonical():
+    attacker, target = cell_inputs()
+    # The same inputs in another key order, as after a round trip through a file
+    reordered = json.loads(json.dumps(attacker, sort_keys=True)), dict(reversed(list(target.items())))
+    assert cell_hash(*reordered, NUM_SIMULATIONS, False, SEED) == cell_hash(attacker, target, NUM_SIMULATIONS, False,
+                                                                             SEED)
+
+
+def test_changing_any_input_changes_the_hash(monkeypatch):
+    attacker, target = cell_inputs()
+    baseline = cell_hash(attacker, target, NUM_SIMULATIONS, False, SEED)
+
+    stronger = copy.deepcopy(attacker)
+    stronger['units'][0]['weapons'][0]['data']['S'] += 1
+    tougher = copy.deepcopy(target)
+    next(iter(tougher['models'].values()))['T'] += 1
+    changed = [
+        cell_hash(stronger, target, NUM_SIMULATIONS, False, SEED),
+        cell_hash(attacker, tougher, NUM_SIMULATIONS, False, SEED),
+        cell_hash(attacker, target, NUM_SIMULATIONS + 1, False, SEED),
+        cell_hash(attacker, target, NUM_SIMULATIONS, True, SEED),
+        cell_hash(attacker, target, NUM_SIMULATIONS, False, SEED + 1),
+        cell_hash(attacker, target, NUM_SIMULATIONS, False, None),
+        cell_hash(attacker, target, NUM_SIMULATIONS, False, SEED, tolerance=0.01),
+        cell_hash(attacker, target, NUM_SIMULATIONS, False, SEED, pkpp_tolerance=0.01),
+        cell_hash(attacker, target, NUM_SIMULATIONS, False, SEED, common_random_numbers=True),
+        cell_hash(attacker, target, NUM_SIMULATIONS, False, SEED, sampled=True),
+        cell_hash(attacker, target, NUM_SIMULATIONS, False, SEED, aggregated=True),
+    ]
+    monkeypatch.setattr(make_fight_matrix, "ENGINE_VERSION", make_fight_matrix.ENGINE_VERSION + ".1")
+    changed.append(cell_hash(attacker, target, NUM_SIMULATIONS, False, SEED))
+    assert baseline not in changed
+    assert len(set(changed)) == len(changed)
+
+
+def test_run_only_recomputes_changed_cells(fight_matrix, monkeypatch):
+    simulated = []
+    run_cell = fight_matrix.run_cell
+
+    def record_cell(attacker_config, target_data, *args):
+        simulated.append(target_data['name'])
+        return run_cell(attacker_config, target_data, *args)
+
+    monkeypatch.setattr(fight_matrix, "run_cell", record_cell)
+    attackers, targets = fight_matrix.load_attackers(), fight_matrix.load_targets()
+    fight_matrix.main(seed=SEED, num_simulations=NUM_SIMULATIONS)
+    assert len(simulated) == len(attackers) * len(targets)
+
+    simulated.clear()
+    fight_matrix.main(seed=SEED, num_simulations=NUM_SIMULATIONS)
+    assert simulated == []
+
+    changed = targets[0]
+    next(iter(changed['models'].values()))['SV'] += 1
+    fight_matrix.main(seed=SEED, num_simulations=NUM_SIMULATIONS)
+    assert simulated == [changed['name']] * len(attackers)
+
+    simulated.clear()
+    fight_matrix.main(seed=SEED + 1, num_simulations=NUM_SIMULATIONS)
+    assert len(simulated) == len(attackers) * len(targets)
@@ -0,0 +1,235 @@
+"""
+Seeded checks that the fast resolution paths agree with the per-attack engine, or with the exact distribution where it
+applies, in the mean and standard deviation of the damage dealt and models destroyed.
+"""
+
+import math as m
+from typing import Optional
+import pytest
+from combat_engine import CombatEngine, Model, Weapon, MULTINOMIAL_ATTACKS
+from analytic_engine import pmf_mean_std
+from defender_unit import DefenderUnit
+from unit_combat_simulator import UnitCombatSimulator
+
+SEED = 2024
+TRIALS = 20000
+# Fewer trials for the slower per-attack engine
+REFERENCE_TRIALS = 6000
+# Means may differ by this many standard errors, and standard deviations by this fraction (plus a little for
+# near-constant outcomes)
+MEAN_ERRORS = 4.5
+STD_TOLERANCE = 0.06
+STD_SLACK = 0.02
+
+
+# Profiles as the data files store them, with AP as a positive number
+
+
+def bolt_rifle(*rules: str) -> Weapon:
+    return Weapon("Bolt Rifle", 24, 2, 3, 4, 1, 1, "Ranged", list(rules))
+
+
+def fusion_gun(*rules: str) -> Weapon:
+    return Weapon("Fusion Gun", 12, 1, 3, 9, 4, "D6", "Ranged", ["Melta 2", *rules])
+
+
+def heavy_flamer(*rules: str) -> Weapon:
+    return Weapon("Heavy Flamer", 12, "D6", 0, 5, 1, 1, "Ranged", ["Torrent", *rules])
+
+
+def hail_of_fire(*rules: str) -> Weapon:
+    # Enough attacks that their outcomes are drawn as one multinomial (see test_aggregated_draws_many_attacks_at_once)
+    return Weapon("Hail of Fire", 24, 40, 4, 4, 0, 1, "Ranged", list(rules))
+
+
+# Targets stand for an endless line of models unless given a unit_size
+
+
+def intercessors(unit_size: Optional[int] = None) -> Model:
+    return Model("Intercessor", 4, 3, 2, 2, unit_size or 10, unit_size=unit_size)
+
+
+def plague_marines(unit_size: Optional[int] = None) -> Model:
+    return Model("Plague Marine", 5, 3, 2, 2, unit_size or 10, feel_no_pain=5, unit_size=unit_size)
+
+
+def hormagaunts(unit_size: Optional[int] = None) -> Model:
+    return Model("Hormagaunt", 3, 5, 1, 1, unit_size or 20, unit_size=unit_size)
+
+
+def terminators(unit_size: Optional[int] = None) -> Model:
+    return Model("Terminator", 5, 2, 3, 3, unit_size or 5, invulnerable_save=4, special_rules=["-1 Damage"],
+                 unit_size=unit_size)
+
+
+def simulate(weapons, target, trials: int = TRIALS, **modes):
+    simulator = UnitCombatSimulator(num_simulations=trials, seed=SEED, **modes)
+    return simulator.simulate_attacks(weapons, target, target_range=6)
+
+
+def assert_close(name: str, mean: float, std: float, trials: int, expected_mean: float, expected_std: float,
+                 expected_trials: int = 0):
+    """Compare a simulated mean and standard deviation with expected ones, from the exact PMF or another sample"""
+    standard_error = m.sqrt(std ** 2 / trials + (expected_std ** 2 / expected_trials if expected_trials else 0))
+    assert abs(mean - expected_mean) <= MEAN_ERRORS * standard_error + 1e-9, \
+        f"{name} mean {mean:.4f} vs {expected_mean:.4f} (standard error {standard_error:.4f})"
+    assert abs(std - expected_std) <= STD_TOLERANCE * expected_std + STD_SLACK, \
+        f"{name} standard deviation {std:.4f} vs {expected_std:.4f}"
+
+
+def assert_matches_exact(results, weapons, target):
+    exact = UnitCombatSimulator().compute_exact_distribution(weapons, target, target_range=6)
+    for metric in ("damage", "models_destroyed"):
+        histogram = results[metric]
+        assert_close(metric, histogram.mean, histogram.std, results.num_simulations, *pmf_mean_std(exact[metric]))
+
+
+def assert_matches(results, reference):
+    for metric in ("damage", "models_destroyed"):
+        histogram, expected = results[metric], reference[metric]
+        assert_close(metric, histogram.mean, histogram.std, results.num_simulations, expected.mean, expected.std,
+                     reference.num_simulations)
+
+
+MATCHUPS = {
+    "bolt rifles": ([bolt_rifle()] * 5, intercessors()),
+    "sustained lethal": ([bolt_rifle("Sustained Hits D3", "Lethal Hits")] * 5, plague_marines()),
+    "devastating melta": ([fusion_gun("Devastating Wounds")] * 3, terminators()),
+    "overkill torrent": ([heavy_flamer("Overkill")] * 2, hormagaunts()),
+    "damage reduction": ([fusion_gun(), bolt_rifle("Sustained Hits 2")] * 2, terminators()),
+    # Small units, which the attacks often destroy before they are all resolved
+    "destroyed unit": ([bolt_rifle("Sustained Hits 1")] * 5, hormagaunts(3)),
+    "destroyed unit overkill": ([fusion_gun("Overkill")] * 3, intercessors(2)),
+}
+
+
+@pytest.mark.parametrize("matchup", MATCHUPS)
+def test_sampled_matches_exact(matchup):
+    weapons, target = MATCHUPS[matchup]
+    assert_matches_exact(simulate(weapons, target, batch=True, sampled=True), weapons, target)
+
+
+@pytest.mark.parametrize("modes", [{}, {"batch": True}, {"batch": True, "sampled": True}, {"aggregated": True}],
+                         ids=["per-attack", "batch", "sampled", "aggregated"])
+def test_model_without_unit_size_is_endless(modes):
+    # As the fight matrix's targets, with one model of total_models each, need: more than one is destroyed
+    weapons = [bolt_rifle()] * 10
+    target = Model("Hormagaunt", 3, 5, 1, 1)
+    results = simulate(weapons, target, trials=REFERENCE_TRIALS, **modes)
+    assert results.models_destroyed.max > 1
+    assert_matches_exact(results, weapons, target)
+
+
+# Profiles loaded from the faction data: attacker, weapon, number of copies and target
+CATALOG_MATCHUPS = {
+    "fire dragons": ("Fire Dragons", "Dragon Fusion Gun - Ranged", 5, "Terminator Squad"),
+    "intercessors": ("Intercessor Squad", "Bolt Rifle - Ranged", 10, "Boyz"),
+    "boyz": ("Boyz", "Shoota - Ranged", 10, "Intercessor Squad"),
+}
+
+
+@pytest.mark.parametrize("matchup", CATALOG_MATCHUPS)
+def test_catalog_profiles_match_exact(matchup):
+    attacker, weapon_name, quantity, target_name = CATALOG_MATCHUPS[matchup]
+    simulator = UnitCombatSimulator()
+    weapons = [simulator.create_weapon(attacker, weapon_name)] * quantity
+    target = simulator.create_target_model(target_name)
+    for modes in ({"batch": True}, {"batch": True, "sampled": True}):
+        assert_matches_exact(simulate(weapons, target, **modes), weapons, target)
+
+
+def test_exact_floors_reduced_damage_at_one():
+    # A rolled damage of 0 still deals 1 under -1 Damage, as each attack deals at least 1
+    weapons = [Weapon("Shock Lance", 12, 4, 2, 6, 2, "D3-1", "Melee", [])] * 2
+    target = terminators()
+    assert_matches_exact(simulate(weapons, target, trials=5000), weapons, target)
+
+
+AGGREGATED_MATCHUPS = {
+    **MATCHUPS,
+    "many attacks": ([hail_of_fire("Sustained Hits 1")] * 2, plague_marines()),
+    "many attacks overkill": ([hail_of_fire("Overkill", "Devastating Wounds")], terminators()),
+    # Drawn in chunks that cannot destroy the rest of the unit
+    "many attacks against a unit": ([hail_of_fire()] * 2, plague_marines(20)),
+}
+MANY_ATTACKS = ["many attacks", "many attacks overkill", "many attacks against a unit"]
+
+
+@pytest.mark.parametrize("matchup", AGGREGATED_MATCHUPS)
+def test_aggregated_matches_per_attack(matchup):
+    weapons, target = AGGREGATED_MATCHUPS[matchup]
+    reference = simulate(weapons, target, trials=REFERENCE_TRIALS)
+    assert_matches(simulate(weapons, target, trials=REFERENCE_TRIALS, aggregated=True), reference)
+
+
+@pytest.mark.parametrize("matchup", MANY_ATTACKS)
+def test_aggregated_draws_many_attacks_at_once(matchup, monkeypatch):
+    # Otherwise the agreement checks above would only cover drawing one attack at a time
+    drawn = []
+    draw_outcomes = CombatEngine.draw_outcomes
+
+    def record_draw(self, num_attacks, *args):
+        drawn.append(num_attacks)
+        return draw_outcomes(self, num_attacks, *args)
+
+    monkeypatch.setattr(CombatEngine, "draw_outcomes", record_draw)
+    weapons, target = AGGREGATED_MATCHUPS[matchup]
+    trials = 20
+    simulate(weapons, target, trials=trials, aggregated=True)
+    # At least each trial's first draw is one multinomial
+    assert sum(num_attacks >= MULTINOMIAL_ATTACKS for num_attacks in drawn) >= trials
+
+
+ONE_USE_MATCHUPS = {
+    "reroll hit and flip": ([bolt_rifle("Reroll 1 Hit Roll", "Flip Roll to 6")] * 5, intercessors()),
+    "reroll any and flip damage": ([fusion_gun("Reroll 1 Hit or Wound or Damage", "Flip Damage Roll to 6")] * 3,
+                                   terminators()),
+    "sustained with one-use": ([bolt_rifle("Sustained Hits 2", "Flip Hit Roll to 6", "Reroll 1 Hit or Wound")] * 5,
+                               plague_marines()),
+    "destroyed unit with one-use": ([bolt_rifle("Sustained Hits D3", "Lethal Hits", "Flip Hit or Wound Roll to 6",
+                                                "Reroll 1 Wound Roll")] * 5, hormagaunts(3)),
+}
+
+
+def nobz() -> DefenderUnit:
+    """Four Nobz and a Boss Nob, allocated to last, with a better save and more wounds"""
+    nob = Model("Nob", 5, 4, 2, 2, 5)
+    boss_nob = Model("Boss Nob", 5, 3, 3, 3, 5, feel_no_pain=6)
+    return DefenderUnit("Nobz", [nob, boss_nob], [0, 0, 0, 0, 1])
+
+
+@pytest.mark.parametrize("matchup", MATCHUPS)
+def test_batch_matches_per_attack(matchup):
+    weapons, target = MATCHUPS[matchup]
+    assert_matches(simulate(weapons, target, batch=True), simulate(weapons, target, trials=REFERENCE_TRIALS))
+
+
+@pytest.mark.parametrize("matchup", ONE_USE_MATCHUPS)
+def test_one_use_batch_matches_per_attack(matchup):
+    weapons, target = ONE_USE_MATCHUPS[matchup]
+    assert_matches(simulate(weapons, target, batch=True), simulate(weapons, target, trials=REFERENCE_TRIALS))
+
+
+@pytest.mark.parametrize("weapons", [[bolt_rifle("Sustained Hits 1")] * 5, [fusion_gun("Overkill")] * 3,
+                                     [fusion_gun("Devastating Wounds"), heavy_flamer()] * 2],
+                         ids=["sustained", "overkill", "mixed"])
+def test_multi_profile_batch_matches_per_attack(weapons):
+    target = nobz()
+    assert_matches(simulate(weapons, target, batch=True), simulate(weapons, target, trials=REFERENCE_TRIALS))
+
+
+@pytest.mark.parametrize("matchup", ["destroyed unit", "destroyed unit overkill"])
+def test_single_profile_unit_matches_model(matchup):
+    # A DefenderUnit of one profile is allocated to model by model, and stops, as the Model with a unit_size it is made
+    # from
+    weapons, target = MATCHUPS[matchup]
+    assert_matches(simulate(weapons, DefenderUnit.from_model(target), batch=True),
+                   simulate(weapons, target, trials=REFERENCE_TRIALS))
+    assert_matches_exact(simulate(weapons, DefenderUnit.from_model(target), batch=True), weapons, target)
+
+
+def test_one_use_unit_matches_model():
+    # One-use rules against a DefenderUnit fall back to the per-attack engine
+    weapons, target = ONE_USE_MATCHUPS["destroyed unit with one-use"]
+    assert_matches(simulate(weapons, DefenderUnit.from_model(target), trials=REFERENCE_TRIALS, batch=True),
+                   simulate(weapons, target, batch=True))
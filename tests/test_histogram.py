@@ -0,0 +1,73 @@
+"""
+Checks that histograms give the same statistics as the per-trial values they replace, and that merging histograms from
+separate chunks is the same as counting all their trials together.
+"""
+
+import numpy as np
+import pytest
+from histogram import Histogram, SimulationResults
+
+QUANTILES = [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0]
+
+
+def trial_values(seed: int, size: int = 5000) -> np.ndarray:
+    # Skewed, with gaps between the values, like the damage of a few big hits
+    return np.random.default_rng(seed).poisson(3, size) * 3
+
+
+def test_statistics_match_the_trial_values():
+    values = trial_values(1)
+    histogram = Histogram.from_values(values)
+    assert histogram.total == len(values)
+    assert (histogram.min, histogram.max) == (values.min(), values.max())
+    assert histogram.mean == pytest.approx(values.mean())
+    assert histogram.std == pytest.approx(values.std())
+    assert histogram.standard_error == pytest.approx(values.std(ddof=1) / np.sqrt(len(values)))
+    np.testing.assert_array_equal(histogram.values(), np.sort(values))
+    assert histogram.survival()[9] == pytest.approx(np.mean(values >= 9))
+    assert histogram.pmf().sum() == pytest.approx(1.0)
+
+
+def test_quantiles_match_the_trial_values():
+    values = trial_values(2)
+    histogram = Histogram.from_values(values)
+    # The smallest value that at least a fraction q of the trials do not exceed
+    expected = np.quantile(values, QUANTILES, method="inverted_cdf")
+    np.testing.assert_array_equal(histogram.quantile(np.array(QUANTILES)), expected)
+    assert histogram.quantile(0.5) == int(expected[QUANTILES.index(0.5)])
+
+
+def test_merge_is_the_same_as_counting_together():
+    # Chunks of different lengths, the longest not first, so the counts have to grow
+    chunks = [trial_values(3, 100) // 3, trial_values(4, 2000), trial_values(5, 10)]
+    merged = Histogram()
+    for chunk in chunks:
+        merged.merge(Histogram.from_values(chunk))
+    np.testing.assert_array_equal(merged.counts, Histogram.from_values(np.concatenate(chunks)).counts)
+
+
+def test_add_leaves_both_histograms_alone():
+    first, second = Histogram.from_values([0, 1, 1]), Histogram.from_values([5])
+    total = first + second
+    np.testing.assert_array_equal(total.counts, [1, 2, 0, 0, 0, 1])
+    np.testing.assert_array_equal(first.counts, [1, 2])
+    np.testing.assert_array_equal(second.counts, [0, 0, 0, 0, 0, 1])
+
+
+def test_empty_histogram():
+    histogram = Histogram.from_values(np.array([], dtype=np.int64))
+    assert histogram.total == 0
+    assert histogram.standard_error == float('inf')
+    histogram.add(4)
+    np.testing.assert_array_equal(histogram.counts, [0, 0, 0, 0, 1])
+
+
+def test_simulation_results_merge_stages():
+    first = SimulationResults(Histogram.from_values([2, 4]), Histogram.from_values([1, 2]),
+                              {"hits": Histogram.from_values([3, 5])})
+    second = SimulationResults(Histogram.from_values([6]), Histogram.from_values([3]),
+                               {"hits": Histogram.from_values([7]), "wounds": Histogram.from_values([2])})
+    first.merge(second)
+    assert first.num_simulations == 3
+    assert first["damage"].mean == pytest.approx(4.0)
+    assert first.funnel() == pytest.approx({"hits": 5.0, "wounds": 2.0})
@@ -0,0 +1,107 @@
+"""
+Checks the importance-sampling estimator against exact tail probabilities: over many independent runs its estimates
+average to the exact probability, and its confidence intervals contain it about as often as they claim to.
+"""
+
+import math as m
+import numpy as np
+import pytest
+from combat_engine import Model, Weapon
+from rng_streams import make_rng
+from unit_combat_simulator import UnitCombatSimulator
+
+SEED = 17
+TRIALS = 2000
+RUNS = 400
+# Mean estimates may differ from the exact probability by this many standard errors
+MEAN_ERRORS = 4.0
+# Coverage of the nominal 95% intervals, over RUNS runs. Heavily weighted trials make the interval a little short when
+# a run happens to see few of them, so coverage is a few points under 95% for the rarest events.
+MIN_COVERAGE = 0.90
+MAX_COVERAGE = 0.99
+
+
+def fusion_guns() -> list:
+    return [Weapon("Fusion Gun", 12, 1, 3, 9, 4, "D6", "Ranged", ["Melta 2"])] * 5
+
+
+def lascannons() -> list:
+    return [Weapon("Lascannon", 48, 1, 3, 12, 3, "D6+1", "Ranged", [])] * 3
+
+
+def knight() -> Model:
+    return Model("Knight Paladin", 12, 3, 22, 22, 1, feel_no_pain=6)
+
+
+def terminators() -> Model:
+    return Model("Terminator", 5, 2, 3, 3, 5, invulnerable_save=4)
+
+
+# weapons, target, threshold, metric, below, theta
+TAILS = {
+    "destroy a knight": (fusion_guns(), knight(), 1, "models_destroyed", False, 1.0),
+    "three terminators": (lascannons(), terminators(), 3, "models_destroyed", False, 1.0),
+    "under 3 damage to a knight": (fusion_guns(), knight(), 3, "damage", True, -1.0),
+}
+
+
+def exact_probability(simulator, weapons, target, threshold, metric, below):
+    pmf = simulator.compute_exact_distribution(weapons, target, target_range=6)[metric]
+    return float(pmf[:threshold].sum() if below else pmf[threshold:].sum())
+
+
+def estimate_runs(simulator, weapons, target, threshold, metric, below, theta):
+    return [simulator.estimate_tail_probability(weapons, target, threshold, metric=metric, below=below, target_range=6,
+                                                theta=theta, rng=make_rng(SEED, run))
+            for run in range(RUNS)]
+
+
+@pytest.mark.parametrize("tail", TAILS)
+def test_estimates_are_unbiased(tail):
+    simulator = UnitCombatSimulator(num_simulations=TRIALS)
+    exact = exact_probability(simulator, *TAILS[tail][:-1])
+    estimates = np.array([estimate.probability for estimate in estimate_runs(simulator, *TAILS[tail])])
+    standard_error = estimates.std(ddof=1) / m.sqrt(RUNS)
+    assert abs(estimates.mean() - exact) <= MEAN_ERRORS * standard_error, \
+        f"mean estimate {estimates.mean():.4g} vs exact {exact:.4g} (standard error {standard_error:.2g})"
+
+
+@pytest.mark.parametrize("tail", ["three terminators", "under 3 damage to a knight"])
+def test_confidence_intervals_cover_the_exact_probability(tail):
+    simulator = UnitCombatSimulator(num_simulations=TRIALS)
+    exact = exact_probability(simulator, *TAILS[tail][:-1])
+    estimates = estimate_runs(simulator, *TAILS[tail])
+    assert all(estimate.confidence == 0.95 for estimate in estimates)
+    coverage = np.mean([low <= exact <= high for low, high in (estimate.confidence_interval for estimate in estimates)])
+    assert MIN_COVERAGE <= coverage <= MAX_COVERAGE, f"coverage {coverage:.3f}"
+
+
+def test_tilt_is_far_more_precise_than_plain_sampling():
+    simulator = UnitCombatSimulator(num_simulations=TRIALS)
+    weapons, target, threshold, metric, below, theta = TAILS["destroy a knight"]
+    exact = exact_probability(simulator, weapons, target, threshold, metric, below)
+    estimate = simulator.estimate_tail_probability(weapons, target, threshold, metric=metric, target_range=6,
+                                                   theta=theta, rng=make_rng(SEED))
+    # Plain Monte Carlo would see a handful of trials reach the outcome
+    assert estimate.hits > 50 * exact * TRIALS
+    assert estimate.standard_error < 0.2 * m.sqrt(exact * (1 - exact) / TRIALS)
+
+
+def test_untilted_estimate_is_the_plain_fraction():
+    simulator = UnitCombatSimulator(num_simulations=TRIALS)
+    weapons, target, threshold, metric, below, _ = TAILS["three terminators"]
+    estimate = simulator.estimate_tail_probability(weapons, target, threshold, metric=metric, target_range=6,
+                                                   theta=0.0, rng=make_rng(SEED))
+    fraction = estimate.hits / TRIALS
+    assert estimate.probability == pytest.approx(fraction)
+    assert estimate.standard_error == pytest.approx(m.sqrt(fraction * (1 - fraction) / (TRIALS - 1)))
+    assert estimate.effective_sample_size == pytest.approx(estimate.hits)
+
+
+def test_weights_average_to_one():
+    # Every trial reaches "at least 0 damage", so the estimate is the mean likelihood ratio, which is 1 at any tilt
+    simulator = UnitCombatSimulator(num_simulations=TRIALS)
+    for theta in (-1.0, 1.0, 2.0):
+        estimate = simulator.estimate_tail_probability(fusion_guns(), knight(), 0, metric="damage", target_range=6,
+                                                       theta=theta, rng=make_rng(SEED, theta))
+        assert abs(estimate.probability - 1.0) <= MEAN_ERRORS * estimate.standard_error
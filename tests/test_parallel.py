@@ -0,0 +1,48 @@
+"""
+Checks that splitting trials across worker processes changes nothing: every chunk draws from its own stream, so a seeded
+simulation gives identical results with any number of workers.
+"""
+
+import numpy as np
+import pytest
+from combat_engine import Model, Weapon
+from unit_combat_simulator import UnitCombatSimulator, CHUNK_SIZE
+
+SEED = 11
+# Enough chunks for every worker to get some
+TRIALS = 3 * CHUNK_SIZE
+
+MODES = {
+    "per-attack": {},
+    "batch": {"batch": True},
+    "sampled": {"sampled": True},
+    "sequential stopping": {"batch": True, "tolerance": 0.01, "max_simulations": 10 * CHUNK_SIZE},
+}
+
+
+def fusion_guns() -> list:
+    return [Weapon("Fusion Gun", 12, 1, 3, 9, 4, "D6", "Ranged", ["Melta 2"])] * 5
+
+
+def terminators() -> Model:
+    return Model("Terminator", 5, 2, 3, 3, 5, invulnerable_save=4)
+
+
+def simulate(workers: int, **modes):
+    simulator = UnitCombatSimulator(num_simulations=TRIALS, seed=SEED, workers=workers, **modes)
+    try:
+        results = simulator.simulate_attacks(fusion_guns(), terminators(), target_range=6)
+        # The chunks really were shared out to a pool of workers
+        assert (simulator._executor is not None) == (workers > 1)
+        return results
+    finally:
+        simulator.close()
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_results_do_not_depend_on_workers(mode):
+    serial = simulate(1, **MODES[mode])
+    parallel = simulate(2, **MODES[mode])
+    assert parallel.num_simulations == serial.num_simulations
+    np.testing.assert_array_equal(parallel.damage.counts, serial.damage.counts)
+    np.testing.assert_array_equal(parallel.models_destroyed.counts, serial.models_destroyed.counts)
@@ -0,0 +1,71 @@
+"""
+Checks that a fight-matrix run that dies part way through resumes from its journal: the cells it finished are not
+simulated again, and the results come out the same as from an uninterrupted run.
+"""
+
+import json
+import pytest
+from results_journal import ResultsJournal
+
+SEED = 5
+NUM_SIMULATIONS = 200
+
+
+def test_interrupted_run_resumes_from_journal(fight_matrix, monkeypatch, tmp_path):
+    simulated = []
+    run_cell = fight_matrix.run_cell
+
+    def crash_after_two_cells(attacker_config, target_data, *args):
+        if len(simulated) == 2:
+            raise KeyboardInterrupt
+        simulated.append((args[2], target_data['name']))
+        return run_cell(attacker_config, target_data, *args)
+
+    monkeypatch.setattr(fight_matrix, "run_cell", crash_after_two_cells)
+    with pytest.raises(KeyboardInterrupt):
+        fight_matrix.main(seed=SEED, num_simulations=NUM_SIMULATIONS)
+    journal = ResultsJournal(tmp_path / "simulation_data.journal")
+    assert [(entry['designation'], entry['target']) for entry in journal.replay()] == simulated
+    assert not (tmp_path / "simulation_data.json").exists()
+
+    finished = list(simulated)
+    simulated.clear()
+
+    def record_cell(attacker_config, target_data, *args):
+        simulated.append((args[2], target_data['name']))
+        return run_cell(attacker_config, target_data, *args)
+
+    monkeypatch.setattr(fight_matrix, "run_cell", record_cell)
+    fight_matrix.main(seed=SEED, num_simulations=NUM_SIMULATIONS)
+    cells = len(fight_matrix.load_attackers()) * len(fight_matrix.load_targets())
+    assert len(simulated) == cells - len(finished)
+    assert not set(simulated) & set(finished)
+    assert not journal.path.exists()
+    with open(tmp_path / "simulation_data.json") as f:
+        resumed = json.load(f)
+
+    # Every cell has its own stream, so the resumed run matches one that was never interrupted
+    uninterrupted_dir = tmp_path / "uninterrupted"
+    monkeypatch.setattr(fight_matrix, "RESULTS_DIR", uninterrupted_dir)
+    fight_matrix.main(seed=SEED, num_simulations=NUM_SIMULATIONS)
+    with open(uninterrupted_dir / "simulation_data.json") as f:
+        assert json.load(f) == resumed
+
+
+def test_replay_skips_a_torn_line(tmp_path):
+    with ResultsJournal(tmp_path / "cells.journal") as journal:
+        journal.append("Orks", "Boyz", "Hormagaunts", "hash 1", {'mean_damage': 4.5})
+        journal.append("Orks", "Boyz", "Intercessor Squad", "hash 2", {'mean_damage': 2.0})
+    # A crash mid-write leaves half a line
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"faction": "Orks", "designation": "Nob')
+
+    assert [entry['hash'] for entry in journal.replay()] == ["hash 1", "hash 2"]
+    # The next run's entries start on a line of their own
+    with journal:
+        journal.append("Orks", "Nobz", "Hormagaunts", "hash 3", {'mean_damage': 6.0})
+    assert [entry['hash'] for entry in journal.replay()] == ["hash 1", "hash 2", "hash 3"]
+
+    journal.discard()
+    assert not journal.path.exists()
+    assert list(journal.replay()) == []
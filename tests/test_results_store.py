@@ -0,0 +1,111 @@
+"""
+Checks that the columnar results store appends cells, lets the latest result of a cell win, survives being reopened and
+compacted, and exports the same nested layout simulation_data.json always had.
+"""
+
+import json
+import math as m
+import numpy as np
+import pytest
+from results_store import ResultsStore, METRICS, ROW_DTYPE
+
+
+def result(mean_damage: float, num_simulations: int = 2000) -> dict:
+    return {'mean_damage': mean_damage, 'std_damage': mean_damage / 2, 'mean_models_killed': mean_damage / 4,
+            'std_models_killed': 0.5, 'pnts_killed_per_point': mean_damage / 100, 'std_dev_pnts_killed_per_point': 0.01,
+            'se_mean_damage': 0.05, 'se_pnts_killed_per_point': 0.001, 'num_simulations': num_simulations}
+
+
+CELLS = [
+    ("Orks", "Boyz", "Melee", "Hormagaunts", result(6.5)),
+    ("Orks", "Boyz", "Melee", "Intercessor Squad", result(2.25)),
+    ("Aeldari", "Fire Dragons", "Ranged", "Intercessor Squad", result(4.0)),
+]
+
+
+def test_append_and_reopen(tmp_path):
+    store = ResultsStore(tmp_path)
+    assert not store.exists()
+    store.append(CELLS)
+    assert len(store) == len(CELLS)
+
+    reopened = ResultsStore(tmp_path)
+    assert reopened.exists()
+    nested = reopened.to_nested()
+    assert nested["Orks"]["Boyz"]["Hormagaunts"] == {'phase': "Melee", **result(6.5)}
+    assert nested["Aeldari"]["Fire Dragons"] == {"Intercessor Squad": {'phase': "Ranged", **result(4.0)}}
+    assert isinstance(nested["Orks"]["Boyz"]["Hormagaunts"]['num_simulations'], int)
+
+    matrix = reopened.matrix('mean_damage')
+    boyz = reopened.attacker_ids[("Orks", "Boyz")]
+    fire_dragons = reopened.attacker_ids[("Aeldari", "Fire Dragons")]
+    assert matrix[boyz, reopened.target_ids["Intercessor Squad"]] == 2.25
+    # A cell with no results is NaN
+    assert m.isnan(matrix[fire_dragons, reopened.target_ids["Hormagaunts"]])
+
+
+def test_latest_result_wins_and_compact_drops_the_rest(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append(CELLS)
+    store.append([("Orks", "Boyz", "Melee", "Hormagaunts", result(7.0, 4000))])
+    assert len(store) == len(CELLS) + 1
+    assert store.to_nested()["Orks"]["Boyz"]["Hormagaunts"]['mean_damage'] == 7.0
+
+    before = store.to_nested()
+    store.compact()
+    assert len(store) == len(CELLS)
+    assert ResultsStore(tmp_path).to_nested() == before
+
+
+def test_missing_metrics_are_left_out(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append([("Orks", "Gretchin", None, "Hormagaunts", {'mean_damage': 1.5})])
+    assert store.to_nested() == {"Orks": {"Gretchin": {"Hormagaunts": {'mean_damage': 1.5}}}}
+
+
+def test_export_json_round_trips(tmp_path):
+    store = ResultsStore(tmp_path / "store")
+    store.append(CELLS)
+    path = tmp_path / "simulation_data.json"
+    store.export_json(path)
+    with open(path) as f:
+        exported = json.load(f)
+    assert exported == store.to_nested()
+
+    # Importing the JSON file into a fresh store gives back the same results
+    imported = ResultsStore(tmp_path / "imported")
+    imported.import_nested(exported)
+    assert imported.to_nested() == exported
+
+
+def test_partial_row_from_a_crash_is_dropped(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append(CELLS[:2])
+    with open(store.rows_path, 'ab') as f:
+        f.write(b'\0' * (ROW_DTYPE.itemsize // 2))
+    store.append(CELLS[2:])
+    assert len(store) == len(CELLS)
+    assert ResultsStore(tmp_path).to_nested()["Aeldari"]["Fire Dragons"]["Intercessor Squad"]['mean_damage'] == 4.0
+
+
+def test_store_with_fewer_metrics_is_upgraded(tmp_path):
+    # A store written before the last metrics were added
+    old_metrics = METRICS[:-2]
+    old_dtype = np.dtype([('attacker', '<u4'), ('target', '<u4'), ('values', '<f8', (len(old_metrics),))])
+    rows = np.zeros(1, dtype=old_dtype)
+    rows['values'] = [[result(3.0)[metric] for metric in old_metrics]]
+    rows.tofile(tmp_path / "simulation_data.rows")
+    with open(tmp_path / "simulation_data_index.json", 'w') as f:
+        json.dump({'format': 1, 'metrics': list(old_metrics),
+                   'attackers': [{'faction': "Orks", 'designation': "Boyz", 'phase': "Melee"}],
+                   'targets': ["Hormagaunts"]}, f)
+
+    cell = ResultsStore(tmp_path).to_nested()["Orks"]["Boyz"]["Hormagaunts"]
+    assert cell == {'phase': "Melee", **{metric: result(3.0)[metric] for metric in old_metrics}}
+
+
+def test_incompatible_store_is_refused(tmp_path):
+    with open(tmp_path / "simulation_data_index.json", 'w') as f:
+        json.dump({'format': 99, 'metrics': list(METRICS), 'attackers': [], 'targets': []}, f)
+    with pytest.raises(ValueError):
+        ResultsStore(tmp_path)
@@ -0,0 +1,80 @@
+"""
+Checks that seeded simulations repeat exactly: the same seed and matchup give the same results in every engine, however
+many chunks the trials are split into and whatever else the simulator ran before.
+"""
+
+import numpy as np
+import pytest
+from combat_engine import Model, Weapon
+from rng_streams import make_rng, StageStreams, STAGES
+from unit_combat_simulator import UnitCombatSimulator, CHUNK_SIZE
+
+SEED = 7
+# More than one chunk, so each chunk's stream is checked too
+TRIALS = CHUNK_SIZE + 500
+
+MODES = {
+    "per-attack": {},
+    "batch": {"batch": True},
+    "sampled": {"sampled": True},
+    "aggregated": {"aggregated": True},
+}
+
+
+def bolt_rifles() -> list:
+    return [Weapon("Bolt Rifle", 24, 2, 3, 4, 1, 1, "Ranged", ["Sustained Hits 1"])] * 5
+
+
+def plague_marines() -> Model:
+    return Model("Plague Marine", 5, 3, 2, 2, 10, feel_no_pain=5)
+
+
+def hormagaunts() -> Model:
+    return Model("Hormagaunt", 3, 5, 1, 1, 20)
+
+
+def assert_identical(results, expected):
+    np.testing.assert_array_equal(results.damage.counts, expected.damage.counts)
+    np.testing.assert_array_equal(results.models_destroyed.counts, expected.models_destroyed.counts)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_seeded_runs_repeat_exactly(mode):
+    runs = [UnitCombatSimulator(num_simulations=TRIALS, seed=SEED, **MODES[mode]).simulate_attacks(
+        bolt_rifles(), plague_marines(), target_range=6) for _ in range(2)]
+    assert runs[0].num_simulations == TRIALS
+    assert_identical(runs[1], runs[0])
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_matchup_results_do_not_depend_on_run_order(mode):
+    # Each matchup draws from its own stream, so running another matchup first changes nothing
+    alone = UnitCombatSimulator(num_simulations=TRIALS, seed=SEED, **MODES[mode]).simulate_attacks(
+        bolt_rifles(), hormagaunts(), target_range=6)
+    simulator = UnitCombatSimulator(num_simulations=TRIALS, seed=SEED, **MODES[mode])
+    simulator.simulate_attacks(bolt_rifles(), plague_marines(), target_range=6)
+    assert_identical(simulator.simulate_attacks(bolt_rifles(), hormagaunts(), target_range=6), alone)
+
+
+def test_different_seeds_give_different_results():
+    runs = [UnitCombatSimulator(num_simulations=TRIALS, seed=seed, batch=True).simulate_attacks(
+        bolt_rifles(), plague_marines(), target_range=6) for seed in (SEED, SEED + 1)]
+    assert not np.array_equal(runs[0].damage.counts, runs[1].damage.counts)
+
+
+def test_make_rng_streams_are_keyed():
+    assert np.array_equal(make_rng(SEED, "Intercessors", "Boyz").integers(1 << 30, size=8),
+                          make_rng(SEED, "Intercessors", "Boyz").integers(1 << 30, size=8))
+    assert not np.array_equal(make_rng(SEED, "Intercessors", "Boyz").integers(1 << 30, size=8),
+                              make_rng(SEED, "Intercessors", "Gretchin").integers(1 << 30, size=8))
+    # The key parts are kept apart, so moving text between them gives another stream
+    assert not np.array_equal(make_rng(SEED, "ab", "c").integers(1 << 30, size=8),
+                              make_rng(SEED, "a", "bc").integers(1 << 30, size=8))
+
+
+def test_stage_streams_repeat_and_are_independent():
+    first, second = StageStreams(make_rng(SEED)), StageStreams(make_rng(SEED))
+    draws = {stage: getattr(first, stage).integers(1, 7, size=32) for stage in STAGES}
+    for stage in STAGES:
+        assert np.array_equal(getattr(second, stage).integers(1, 7, size=32), draws[stage])
+    assert not np.array_equal(draws["hit"], draws["wound"])
@@ -0,0 +1,69 @@
+"""
+Checks sequential stopping: with a tolerance, a simulation runs until the standard error of its mean damage is within
+it, without running many more trials than that needs, and never more than max_simulations.
+"""
+
+from combat_engine import Model, Weapon
+from unit_combat_simulator import UnitCombatSimulator, CHUNK_SIZE
+
+SEED = 13
+MIN_SIMULATIONS = 1000
+
+
+def lascannons() -> list:
+    return [Weapon("Lascannon", 48, 1, 3, 12, 3, "D6+1", "Ranged", [])] * 2
+
+
+def knight() -> Model:
+    return Model("Knight Paladin", 12, 3, 22, 22, 1, feel_no_pain=6)
+
+
+def simulate(weapons=None, target_range: int = 24, **tolerances):
+    simulator = UnitCombatSimulator(num_simulations=MIN_SIMULATIONS, seed=SEED, batch=True, **tolerances)
+    return simulator.simulate_attacks(weapons or lascannons(), knight(), target_range=target_range)
+
+
+def test_stops_once_the_relative_tolerance_is_reached():
+    tolerance = 0.02
+    results = simulate(tolerance=tolerance, max_simulations=200000)
+    assert results.num_simulations > MIN_SIMULATIONS
+    assert results.damage.standard_error <= tolerance * results.damage.mean
+    # About as many trials as the spread needs, rounded up to whole chunks, not many more
+    needed = (results.damage.std / (tolerance * results.damage.mean)) ** 2
+    assert results.num_simulations <= 1.5 * needed + CHUNK_SIZE
+
+
+def test_stops_once_the_absolute_tolerance_is_reached():
+    results = simulate(abs_tolerance=0.05, max_simulations=200000)
+    assert results.num_simulations > MIN_SIMULATIONS
+    assert results.damage.standard_error <= 0.05
+
+
+def test_tighter_tolerance_needs_more_trials():
+    loose = simulate(tolerance=0.02, max_simulations=200000)
+    tight = simulate(tolerance=0.01, max_simulations=200000)
+    # The standard error falls with the square root of the trials
+    assert 3 * loose.num_simulations <= tight.num_simulations
+
+
+def test_stops_at_max_simulations():
+    results = simulate(tolerance=0.001, max_simulations=3 * CHUNK_SIZE)
+    assert results.num_simulations == 3 * CHUNK_SIZE
+    assert results.damage.standard_error > 0.001 * results.damage.mean
+
+
+def test_stops_at_the_minimum_when_nothing_varies():
+    # Out of range, so every trial deals no damage and the mean is known exactly
+    results = simulate(target_range=60, tolerance=0.01, max_simulations=200000)
+    assert results.num_simulations == MIN_SIMULATIONS
+    assert results.damage.mean == 0
+
+
+def test_simulate_attacks_tolerance_overrides_the_simulator():
+    simulator = UnitCombatSimulator(num_simulations=MIN_SIMULATIONS, seed=SEED, batch=True, abs_tolerance=0.5,
+                                    max_simulations=200000)
+    loose = simulator.simulate_attacks(lascannons(), knight(), target_range=24)
+    tight = simulator.simulate_attacks(lascannons(), knight(), target_range=24, abs_tolerance=0.05)
+    assert loose.num_simulations == MIN_SIMULATIONS
+    assert tight.num_simulations > MIN_SIMULATIONS
+    assert tight.damage.standard_error <= 0.05